@@ -3,18 +3,205 @@
 Creates a temporary session for a given profile
 """
 
+import contextlib
 import datetime
+import hashlib
+import io
+import json
 import os
+import re
 import shutil
+import stat
 import sys
+import tempfile
 import time
 from configparser import ConfigParser
 
 import boto3
-import humanize
+from botocore.config import Config
 from dateutil.parser import parse
 
+from awstemp import mfa, usage
+from awstemp.locks import FileLock, LockTimeout
+from awstemp.ratelimit import RateLimiter
+
 ENCODING = "utf-8"
+DIRECTORY_FILE = ".awstemp"
+CLIENTS = {}
+CLI_CACHE_MARGIN = datetime.timedelta(minutes=15)
+SESSION_KEYS = ("AccessKeyId", "SecretAccessKey", "SessionToken")
+SHARD_NAME = re.compile(r"^[A-Za-z0-9_+=,@-][A-Za-z0-9_+=,.@-]*$")
+
+
+def atomic_write(path, content, mode=None, owner=None, follow_symlinks=True):
+    """
+    Write a file through a temporary sibling so readers never see partial data.
+    An existing file keeps its permissions unless mode is given, owner is an
+    optional (uid, gid) for the new file. A symlinked path is written through
+    to its target, so the link itself is kept, unless follow_symlinks is False.
+    """
+
+    if follow_symlinks:
+        path = os.path.realpath(path)
+    if mode is None:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o600
+
+    with tempfile.NamedTemporaryFile(
+        "w",
+        encoding=ENCODING,
+        dir=os.path.dirname(path) or ".",
+        prefix=".",
+        delete=False,
+    ) as temp_file:
+        temp_file.write(content)
+    if owner is not None:
+        os.chown(temp_file.name, *owner)
+    os.chmod(temp_file.name, mode)
+    os.replace(temp_file.name, path)
+
+
+def client(session, service, **kwargs):
+    """
+    Create a client, honouring AWS_ENDPOINT_URL_<SERVICE> on any botocore.
+    Retries are left to the shared RateLimiter so throttling is seen host wide.
+    """
+
+    kwargs.setdefault("config", Config(retries={"max_attempts": 0}))
+    endpoint = os.environ.get(
+        f"AWS_ENDPOINT_URL_{service.upper()}", os.environ.get("AWS_ENDPOINT_URL")
+    )
+    if endpoint:
+        kwargs["endpoint_url"] = endpoint
+    return session.client(service, **kwargs)
+
+
+def state_path():
+    """Directory of awstemp's locks, caches and logs, AWSTEMP_STATE_DIR overrides it"""
+
+    return os.environ.get("AWSTEMP_STATE_DIR", os.path.expanduser("~/.aws/awstemp"))
+
+
+def sts_limiter():
+    """The STS rate limiter shared host wide, capped by AWSTEMP_STS_MAX_RATE"""
+
+    return RateLimiter(
+        os.path.join(state_path(), "sts-ratelimit.json"),
+        maximum=float(os.environ.get("AWSTEMP_STS_MAX_RATE", "50")),
+    )
+
+
+def cli_cache_key(kwargs):
+    """
+    Name botocore gives the AWS CLI cache file of an AssumeRole call: the
+    SHA1 of its sorted JSON arguments without the session name and token
+    """
+
+    args = {
+        key: value
+        for key, value in kwargs.items()
+        if key not in ("RoleSessionName", "TokenCode")
+    }
+    digest = hashlib.sha1(json.dumps(args, sort_keys=True).encode(ENCODING))
+    return digest.hexdigest().replace(":", "_").replace(os.path.sep, "_")
+
+
+def cli_cache_path(cfg):
+    """
+    File in the AWS CLI credential cache for a role's session, None
+    unless AWSTEMP_CLI_CACHE is set
+    """
+
+    if os.environ.get("AWSTEMP_CLI_CACHE", "0") == "0":
+        return None
+
+    kwargs = {"RoleArn": cfg["role_arn"]}
+    if cfg["mfa_serial"]:
+        kwargs["SerialNumber"] = cfg["mfa_serial"]
+    return os.path.join(
+        os.path.expanduser("~/.aws/cli/cache"), f"{cli_cache_key(kwargs)}.json"
+    )
+
+
+def read_json(path, default):
+    """Read a JSON state file, falling back to a default when missing or corrupt"""
+
+    try:
+        with open(path, "r", encoding=ENCODING) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
+
+
+def print_columns(columns, rows):
+    """Print rows of strings as aligned columns below upper case headers"""
+
+    widths = [
+        max([len(column), *[len(row[i]) for row in rows]])
+        for i, column in enumerate(columns)
+    ]
+    for row in [[x.upper() for x in columns], *rows]:
+        print("  ".join(x.ljust(w) for x, w in zip(row, widths)).rstrip())
+
+
+def expired_sections(parser, now):
+    """Names of the sections whose aws_expiration has passed"""
+
+    return [
+        section
+        for section in parser.sections()
+        if parser.has_option(section, "aws_expiration")
+        and now
+        >= datetime.datetime.fromisoformat(parser.get(section, "aws_expiration"))
+    ]
+
+
+def directory_role(path=None):
+    """Role and optional alias named by the nearest .awstemp file"""
+
+    path = os.path.abspath(path or os.getcwd())
+    while not os.path.isfile(os.path.join(path, DIRECTORY_FILE)):
+        if os.path.dirname(path) == path:
+            print(f"No role given and no {DIRECTORY_FILE} file found")
+            sys.exit(1)
+        path = os.path.dirname(path)
+
+    path = os.path.join(path, DIRECTORY_FILE)
+    with open(path, "r", encoding=ENCODING) as directory_file:
+        for line in directory_file:
+            words = line.split()
+            if words and not words[0].startswith("#"):
+                return words[0], words[1] if len(words) > 1 else None
+
+    print(f"No role found in {path}")
+    sys.exit(1)
+
+
+@contextlib.contextmanager
+def single_flight(alias):
+    """
+    Hold the lock of a session shared by every awstemp process, so one
+    of them assumes it while the others wait and then reuse it. After
+    AWSTEMP_LOCK_TIMEOUT seconds the waiter carries on without the lock.
+    """
+
+    name = re.sub(r"[^A-Za-z0-9_.@+=,-]", "_", alias)
+    lock = FileLock(
+        os.path.join(state_path(), "locks", f"session-{name}.lock"),
+        timeout=float(os.environ.get("AWSTEMP_LOCK_TIMEOUT", "120")),
+    )
+    try:
+        lock.acquire()
+    except LockTimeout:
+        print(f"Timed out waiting for another assume of {alias}", file=sys.stderr)
+        yield
+        return
+    try:
+        yield
+    finally:
+        lock.release()
 
 
 class AWSTEMP:
@@ -32,11 +219,74 @@ class AWSTEMP:
             "AWS_CONFIG_FILE", os.path.expanduser("~/.aws/config")
         )
 
+        self.shards_path = os.environ.get("AWSTEMP_CREDENTIALS_DIR")
+        self.usage = usage.Usage(os.path.join(state_path(), "usage.jsonl"))
+
+        with self.usage.timer("io"):
+            self.load_credentials()
+
+            self.config = ConfigParser()
+            self.config.read(self.config_path)
+
+    def stamp(self):
+        """Identity of the files loaded at construction, changing with them"""
+
+        stamps = []
+        for path in [self.credentials_path, self.config_path, self.shards_path]:
+            try:
+                info = os.stat(path)
+            except (OSError, TypeError):
+                stamps.append(None)
+                continue
+            stamps.append((info.st_ino, info.st_mtime_ns, info.st_size))
+        return tuple(stamps)
+
+    def load_credentials(self):
+        """(Re)load the credentials file and any sharded sessions"""
+
         self.credentials = ConfigParser()
         self.credentials.read(self.credentials_path)
 
-        self.config = ConfigParser()
-        self.config.read(self.config_path)
+        self.shards = {}
+        if self.shards_path:
+            self.load_shards()
+
+    def load_shards(self):
+        """Load session sections from the per-profile credentials directory"""
+
+        if not os.path.isdir(self.shards_path):
+            return
+
+        for name in sorted(os.listdir(self.shards_path)):
+            if name.startswith("."):
+                continue
+            path = os.path.join(self.shards_path, name)
+            shard = ConfigParser()
+            shard.read(path)
+            for section in shard.sections():
+                if not self.credentials.has_section(section):
+                    self.credentials.add_section(section)
+                for key, value in shard.items(section):
+                    self.credentials.set(section, key, value)
+                self.shards[section] = path
+
+    def write_shard(self, section):
+        """Atomically write a single session section to its own file"""
+
+        if not SHARD_NAME.match(section):
+            raise ValueError(f"Invalid shard name: {section}")
+
+        os.makedirs(self.shards_path, mode=0o700, exist_ok=True)
+        path = os.path.join(self.shards_path, section)
+
+        shard = ConfigParser()
+        shard[section] = dict(self.credentials.items(section))
+
+        content = io.StringIO()
+        shard.write(content)
+        atomic_write(path, content.getvalue() + self.vimsyntax)
+
+        self.shards[section] = path
 
     def role_completer(self, **_):
         """argcomplete completer for --role"""
@@ -67,185 +317,276 @@ class AWSTEMP:
 
         return now >= expiry
 
-    def assume(self, role, alias=None):
-        """Assumes Role and stores the temporary credentials"""
+    def session_profile(self, config, alias, region):
+        """Add the config profile of a session, True if the config changed"""
+
+        section = f"profile {alias}"
+        changed = False
+        if not config.has_section(section) and region:
+            config.add_section(section)
+            config.set(section, "region", region)
+            changed = True
+
+        if self.shards_path and not config.has_option(section, "credential_process"):
+            if not config.has_section(section):
+                config.add_section(section)
+            config.set(
+                section, "credential_process", f"awstemp credential-process {alias}"
+            )
+            changed = True
+
+        return changed
+
+    def update_ini(self, path, change):
+        """
+        Re-read an ini file under an exclusive host wide lock, apply
+        change(parser) and atomically write it back unless change returns False.
+        Other processes' sections written since our own read are kept.
+        """
+
+        path = os.path.realpath(path)
+        lock = os.path.join(state_path(), "locks", f"{os.path.basename(path)}.lock")
+        with FileLock(lock):
+            parser = ConfigParser()
+            parser.read(path)
+            if change(parser) is not False:
+                content = io.StringIO()
+                parser.write(content)
+                atomic_write(path, content.getvalue() + self.vimsyntax)
+        return parser
+
+    def assume(self, role=None, alias=None):
+        """
+        Assumes Role and stores the temporary credentials. Without a role the
+        one named in the nearest .awstemp file is used.
+        """
+
+        if role is None:
+            role, alias = directory_role()
 
         if alias is None:
             alias = f"{role}_temp"
 
         if not self.is_expired(alias):
+            self.usage.record("assume", role, "hit")
             return "skipping"
 
-        credentials = self.credentials
-        config = self.config
-
-        print(f"Assuming role: {role} as {alias}")
-
-        unix = int(time.time())
+        if self.shards_path and not SHARD_NAME.match(alias):
+            print(f"Invalid alias for sharded credentials: {alias}")
+            sys.exit(1)
 
-        cfg = {
-            "region": config.get(
-                f"profile {role}",
-                "region",
-                fallback=os.environ.get("AWS_DEFAULT_REGION", "eu-west-1"),
-            ),
-            "role_arn": config.get(f"profile {role}", "role_arn"),
-            "mfa_serial": config.get(f"profile {role}", "mfa_serial", fallback=None),
-            "session_name": f"{role}-{unix}",
-            "source_profile": config.get(
-                f"profile {role}", "source_profile", fallback="default"
-            ),
-        }
+        with single_flight(alias):
+            with self.usage.timer("io"):
+                self.load_credentials()
+            if not self.is_expired(alias):
+                self.usage.record("assume", role, "hit")
+                return "skipping"
 
-        sts = boto3.Session(profile_name=cfg["source_profile"]).client("sts")
+            print(f"Assuming role: {role} as {alias}")
 
-        if cfg["mfa_serial"]:
+            cfg = self.role_config(role)
             try:
-                token = input("MFA Token: ")
-            except KeyboardInterrupt:
-                sys.exit(0)
-
-            response = sts.assume_role(
-                RoleArn=cfg["role_arn"],
-                SerialNumber=cfg["mfa_serial"],
-                RoleSessionName=cfg["session_name"],
-                TokenCode=token,
-            )
+                session, cached = self.fetch_session(cfg)
+            except mfa.MFAError as error:
+                print(error)
+                sys.exit(1)
 
-        else:
-            response = sts.assume_role(
-                RoleArn=cfg["role_arn"], RoleSessionName=cfg["session_name"]
-            )
-
-        config_section = f"profile {alias}"
-        if config_section not in config.sections() and cfg["region"]:
-            config.add_section(config_section)
-            config.set(config_section, "region", cfg["region"])
-            with open(self.config_path, "w", encoding=ENCODING) as config_file:
-                config.write(config_file)
-
-        if alias not in credentials.sections():
-            credentials.add_section(alias)
-
-        credentials.set(
-            alias, "aws_access_key_id", response["Credentials"]["AccessKeyId"]
-        )
-        credentials.set(
-            alias, "aws_secret_access_key", response["Credentials"]["SecretAccessKey"]
-        )
-        credentials.set(
-            alias, "aws_session_token", response["Credentials"]["SessionToken"]
-        )
-        credentials.set(
-            alias, "aws_expiration", response["Credentials"]["Expiration"].isoformat()
-        )
-
-        with open(self.credentials_path, "w", encoding=ENCODING) as credentials_file:
-            credentials.write(credentials_file)
-
-        self.syntax(self.config_path)
-        self.syntax(self.credentials_path)
+            with self.usage.timer("io"):
+                self.store_sessions({alias: (cfg["region"], session)})
 
         print(f"Session credentials created as temporary profile: {alias}")
+        self.usage.record("assume", role, "hit" if cached else "miss")
 
         return "created"
 
-    def clean(self):
-        """Iterate through sections and remove expired sections"""
+    def stored_session(self, alias):
+        """A valid session as currently stored on disk, None if there is none"""
 
-        for section in self.credentials.sections():
-            if self.is_expired(section):
-                print(f"Removing expired: {section}")
-                self.credentials.remove_section(section)
+        paths = [self.credentials_path]
+        if self.shards_path and SHARD_NAME.match(alias):
+            paths.append(os.path.join(self.shards_path, alias))
 
-                if self.config.has_section(f"profile {section}"):
-                    self.config.remove_section(f"profile {section}")
+        parser = ConfigParser()
+        parser.read(paths)
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        if not parser.has_option(alias, "aws_session_token") or alias in (
+            expired_sections(parser, now)
+        ):
+            return None
+        return dict(parser.items(alias))
+
+    def role_config(self, role):
+        """Settings needed to assume a role profile"""
+
+        section = f"profile {role}"
+        return {
+            "region": self.config.get(
+                section,
+                "region",
+                fallback=os.environ.get("AWS_DEFAULT_REGION", "eu-west-1"),
+            ),
+            "role_arn": self.config.get(section, "role_arn"),
+            "mfa_serial": self.config.get(section, "mfa_serial", fallback=None),
+            "mfa_command": self.config.get(
+                section, "awstemp_mfa_command", fallback=None
+            ),
+            "mfa_cache": self.config.getboolean(
+                section, "awstemp_mfa_cache", fallback=False
+            ),
+            "session_name": f"{role}-{int(time.time())}",
+            "source_profile": self.config.get(
+                section, "source_profile", fallback="default"
+            ),
+        }
 
-        with open(self.credentials_path, "w", encoding=ENCODING) as credentials_file:
-            self.credentials.write(credentials_file)
+    def role_profiles(self):
+        """Names of the profiles that assume a role"""
 
-        with open(self.config_path, "w", encoding=ENCODING) as config_file:
-            self.config.write(config_file)
+        return sorted(
+            section.replace("profile ", "", 1)
+            for section in self.config.sections()
+            if section.startswith("profile ")
+            and self.config.has_option(section, "role_arn")
+        )
 
-        self.syntax(self.config_path)
-        self.syntax(self.credentials_path)
+    def source_profiles(self):
+        """Source profiles of every role profile"""
 
-    def syntax(self, path):
-        """Add vim ini syntax if not exists"""
+        return sorted(
+            {self.role_config(x)["source_profile"] for x in self.role_profiles()}
+        )
 
-        with open(path, "r", encoding=ENCODING) as ini_file:
-            data = ini_file.readlines()
-        if self.vimsyntax not in data:
-            with open(path, "a", encoding=ENCODING) as ini_file:
-                ini_file.write(self.vimsyntax)
+    def sts_client(self, profile):
+        """
+        STS client of a source profile, shared by the threads of this process
+        and kept while the files are unchanged, so a resident server hands
+        every call a client that is already built
+        """
+
+        key = (
+            profile,
+            os.environ.get("AWS_ENDPOINT_URL_STS"),
+            os.environ.get("AWS_ENDPOINT_URL"),
+            self.credentials_path,
+            self.config_path,
+        )
+        stamp = self.stamp()
+        cached = CLIENTS.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = CLIENTS[key] = (
+                stamp,
+                client(boto3.Session(profile_name=profile), "sts"),
+            )
+        return cached[1]
 
-    def list(self):
-        """List all credentials"""
+    def request_session(self, cfg):
+        """
+        Call STS for a role session, asking the profile's MFA provider for
+        a token if required. Raises mfa.MFAError when there is no token.
+        """
 
-        now = datetime.datetime.now(tz=datetime.timezone.utc)
-        for section in sorted(self.credentials.sections()):
-            if self.credentials.has_option(section, "aws_session_token"):
-                delta = parse(self.credentials.get(section, "aws_expiration")) - now
-                if delta.total_seconds() > 0:
-                    print(f"{section} ({humanize.naturaltime(-delta)[:-9]})")
-                else:
-                    print(f"{section} (expired)")
-            else:
-                print(section)
-
-    def sessions(self):
-        """List all sessions"""
+        sts = self.sts_client(cfg["source_profile"])
+        kwargs = {"RoleArn": cfg["role_arn"], "RoleSessionName": cfg["session_name"]}
 
-        now = datetime.datetime.now(tz=datetime.timezone.utc)
-        for section in sorted(self.credentials.sections()):
-            if self.credentials.has_option(section, "aws_session_token"):
-                delta = parse(self.credentials.get(section, "aws_expiration")) - now
-                if delta.total_seconds() > 0:
-                    print(f"{section} ({humanize.naturaltime(-delta)[:-9]})")
-                else:
-                    print(f"{section} (expired)")
+        if cfg["mfa_serial"]:
+            provider = mfa.provider(
+                cfg["mfa_command"],
+                cfg["mfa_cache"],
+                os.path.join(state_path(), "locks"),
+            )
+            try:
+                with self.usage.timer("mfa"):
+                    token = provider.token(cfg["mfa_serial"])
+            except KeyboardInterrupt:
+                sys.exit(0)
+            kwargs.update(SerialNumber=cfg["mfa_serial"], TokenCode=token)
+
+        with self.usage.timer("sts"):
+            return sts_limiter().call(sts.assume_role, **kwargs)["Credentials"]
+
+    def fetch_session(self, cfg):
+        """
+        A role session and whether it came from the AWS CLI cache. With the
+        cache enabled, a session valid for another CLI_CACHE_MARGIN is taken
+        from it and a new one from STS is written back to it.
+        """
+
+        path = cli_cache_path(cfg)
+        if path is None:
+            return self.request_session(cfg), False
+
+        with self.usage.timer("io"):
+            cached = read_json(path, {}).get("Credentials")
+        try:
+            session = {x: cached[x] for x in SESSION_KEYS}
+            session["Expiration"] = parse(cached["Expiration"])
+            if session["Expiration"] - CLI_CACHE_MARGIN > datetime.datetime.now(
+                tz=datetime.timezone.utc
+            ):
+                return session, True
+        except (KeyError, TypeError, ValueError, OverflowError):
+            pass
+
+        session = self.request_session(cfg)
+        content = dict(session, Expiration=session["Expiration"].isoformat())
+        with self.usage.timer("io"), contextlib.suppress(OSError):
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            atomic_write(path, json.dumps({"Credentials": content}), mode=0o600)
+        return session, False
+
+    def store_sessions(self, sessions):
+        """
+        Merge assumed sessions, {alias: (region, credentials)}, and their
+        config profiles into the files with one write per file
+        """
+
+        values = {
+            alias: {
+                "aws_access_key_id": session["AccessKeyId"],
+                "aws_secret_access_key": session["SecretAccessKey"],
+                "aws_session_token": session["SessionToken"],
+                "aws_expiration": session["Expiration"].isoformat(),
+            }
+            for alias, (_, session) in sessions.items()
+        }
+
+        def merge(credentials):
+            for alias, items in values.items():
+                if not credentials.has_section(alias):
+                    credentials.add_section(alias)
+                for key, value in items.items():
+                    credentials.set(alias, key, value)
+
+        def profiles(config):
+            changed = [
+                self.session_profile(config, alias, region)
+                for alias, (region, _) in sessions.items()
+            ]
+            return any(changed)
+
+        self.config = self.update_ini(self.config_path, profiles)
+
+        merge(self.credentials)
+        if self.shards_path:
+            for alias in sessions:
+                self.write_shard(alias)
+        else:
+            self.update_ini(self.credentials_path, merge)
 
     def backup(self):
         """Backup credential and config files"""
         backup_dir = os.path.expanduser(
             f"~/.aws/backup-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}"
         )
-        if not os.path.isdir(backup_dir):
-            os.mkdir(backup_dir)
+        os.makedirs(backup_dir, exist_ok=True)
         shutil.copy(self.credentials_path, f"{backup_dir}/credentials")
         shutil.copy(self.config_path, f"{backup_dir}/config")
         print(f"Backup: {backup_dir}")
 
-    def export(self, profile=None):
-        """print export statements to console out"""
-
-        if profile is None:
-            profile = os.environ.get("AWS_PROFILE", "default")
-
-        if profile not in self.credentials.sections():
-            print(f"Profile not found: {profile}")
-            sys.exit(1)
-
-        print(f"Profile: {profile}")
-
-        print(
-            "export AWS_ACCESS_KEY_ID="
-            + self.credentials.get(profile, "aws_access_key_id")
-        )
-        print(
-            "export AWS_SECRET_ACCESS_KEY="
-            + self.credentials.get(profile, "aws_secret_access_key")
-        )
-        if self.credentials.has_option(profile, "aws_session_token"):
-            print(
-                "export AWS_SESSION_TOKEN="
-                + self.credentials.get(profile, "aws_session_token")
-            )
-
     def status(self, profile=None):
         """Check if current profile is valid"""
         if profile is None:
             profile = os.environ.get("AWS_PROFILE", "default")
-        if self.is_expired(profile):
-            sys.exit(1)
-        sys.exit(0)
+        expired = self.is_expired(profile)
+        self.usage.record("status", profile)
+        sys.exit(1 if expired else 0)
@@ -0,0 +1,169 @@
+"""
+Removes expired sessions and their config profiles, for the current user
+or for every user on the host
+"""
+
+import datetime
+import glob
+import io
+import os
+import stat
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+from configparser import Error as ConfigError
+
+import humanize
+
+from awstemp import awstemp
+
+
+def remove_sections(path, select, owner=None):
+    """
+    Remove the sections chosen by select(parser) from an ini file, rewriting
+    it only when something was removed and keeping its owner and permissions.
+    Symlinks, other special files and files not owned by the optional owner
+    uid are left alone. Returns the removed sections and the bytes reclaimed.
+    """
+
+    def foreign(info):
+        return not stat.S_ISREG(info.st_mode) or owner not in (None, info.st_uid)
+
+    try:
+        if foreign(os.lstat(path)):
+            return [], 0
+        descriptor = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK)
+    except FileNotFoundError:
+        return [], 0
+    with open(descriptor, "r", encoding=awstemp.ENCODING) as ini_file:
+        info = os.fstat(descriptor)
+        if foreign(info):
+            return [], 0
+        original = ini_file.read()
+
+    parser = ConfigParser()
+    parser.read_string(original, source=path)
+    removed = select(parser)
+    if not removed:
+        return [], 0
+
+    for section in removed:
+        parser.remove_section(section)
+    content = io.StringIO()
+    parser.write(content)
+    if awstemp.AWSTEMP.vimsyntax in original.splitlines(keepends=True):
+        content.write(awstemp.AWSTEMP.vimsyntax)
+
+    awstemp.atomic_write(
+        path,
+        content.getvalue(),
+        stat.S_IMODE(info.st_mode),
+        (info.st_uid, info.st_gid),
+        follow_symlinks=False,
+    )
+    return removed, len(original.encode()) - len(content.getvalue().encode())
+
+
+def clean_user(credentials_path, config_path, now):
+    """
+    Remove the expired sessions of one user and their config profiles. Only
+    files owned by the owner of the home directory holding .aws are changed.
+    Runs in a worker process, so errors are returned instead of raised.
+    """
+
+    try:
+        home = os.path.dirname(os.path.dirname(credentials_path))
+        owner = os.lstat(home).st_uid
+        removed, reclaimed = remove_sections(
+            credentials_path, lambda x: awstemp.expired_sections(x, now), owner
+        )
+        _, config_reclaimed = remove_sections(
+            config_path,
+            lambda x: [
+                f"profile {section}"
+                for section in removed
+                if x.has_section(f"profile {section}")
+            ],
+            owner,
+        )
+    except (OSError, ConfigError, TypeError, ValueError) as error:
+        return credentials_path, [], 0, str(error)
+    return credentials_path, removed, reclaimed + config_reclaimed, None
+
+
+def clean(cli):
+    """Remove expired sessions and their config profiles"""
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    removed = [x for x in cli.shards if cli.is_expired(x)]
+    for section in removed:
+        try:
+            os.remove(cli.shards.pop(section))
+        except FileNotFoundError:
+            pass
+
+    def drop_sessions(credentials):
+        expired = awstemp.expired_sections(credentials, now)
+        for section in expired:
+            credentials.remove_section(section)
+        removed.extend(expired)
+        return bool(expired)
+
+    def drop_profiles(config):
+        profiles = [f"profile {x}" for x in removed]
+        profiles = [x for x in profiles if config.has_section(x)]
+        for section in profiles:
+            config.remove_section(section)
+        return bool(profiles)
+
+    with cli.usage.timer("io"):
+        cli.update_ini(cli.credentials_path, drop_sessions)
+        cli.config = cli.update_ini(cli.config_path, drop_profiles)
+        cli.load_credentials()
+
+    for section in removed:
+        print(f"Removing expired: {section}")
+    cli.usage.record("clean")
+
+
+def user_files(patterns):
+    """
+    Resolve globs of home directories or credentials files to pairs of
+    credentials and config paths
+    """
+
+    files = {}
+    for pattern in patterns:
+        for match in glob.glob(os.path.expanduser(pattern)):
+            match = os.path.abspath(match)
+            if os.path.isdir(match):
+                match = os.path.join(match, ".aws", "credentials")
+            files[match] = os.path.join(os.path.dirname(match), "config")
+    return sorted(files.items())
+
+
+def clean_users(patterns, workers):
+    """Clean the credentials of every matching user on a process pool"""
+
+    files = user_files(patterns)
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(clean_user, *paths, now) for paths in files]
+    results = [x.result() for x in futures]
+
+    failed = False
+    for path, sections, _, error in results:
+        if error:
+            print(f"Failed {path}: {error}")
+            failed = True
+        for section in sections:
+            print(f"Removing expired: {path} {section}")
+
+    removed = sum(len(x[1]) for x in results)
+    reclaimed = humanize.naturalsize(sum(x[2] for x in results))
+    print(
+        f"Cleaned {sum(bool(x[1]) for x in results)} of {len(files)} files:"
+        f" {removed} sections removed, {reclaimed} reclaimed"
+    )
+    if failed:
+        sys.exit(1)
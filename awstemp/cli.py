@@ -1,7 +1,9 @@
 """
 CLI wrapper for awstemp package
 """
+
 import argparse
+import functools
 import importlib.resources
 import os
 import sys
@@ -14,7 +16,7 @@ except ImportError:  # pragma: no cover - 3.7 only
 import argcomplete
 import psutil
 
-from awstemp import awstemp
+from awstemp import awstemp, clean, discover, each, sessions, stats, verify
 
 INIT_MESSAGE = {
     "fish": (
@@ -43,7 +45,11 @@ def arguments(cli):
 
     assume_parser = subparsers.add_parser("assume", help="Assumes an AWS IAM role")
     assume_parser.add_argument(
-        "role", type=str, help="Role to assume"
+        "role",
+        type=str,
+        nargs="?",
+        default=None,
+        help="Role to assume, defaults to the role in the nearest .awstemp file",
     ).completer = cli.role_completer
     assume_parser.add_argument(
         "alias",
@@ -53,15 +59,97 @@ def arguments(cli):
         help="Alias to name the temporary profile",
     )
 
-    backup_parser = subparsers.add_parser(
+    subparsers.add_parser(
         "backup", help="Creates a backup of the credentials and config files"
-    )
-    backup_parser.set_defaults(func=cli.backup)
+    ).set_defaults(func=cli.backup)
 
-    list_parser = subparsers.add_parser(
+    clean_parser = subparsers.add_parser(
         "clean", help="Cleans up expired session profiles"
     )
-    list_parser.set_defaults(func=cli.clean)
+    clean_parser.add_argument(
+        "-u",
+        "--users",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="GLOB",
+        help="Home directories or credentials files of other users to clean",
+    )
+    clean_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes for --users",
+    )
+    clean_parser.set_defaults(func=functools.partial(clean.clean, cli))
+
+    process_parser = subparsers.add_parser(
+        "credential-process",
+        help="Prints a session as credential_process JSON for the AWS SDKs",
+    )
+    process_parser.add_argument(
+        "profile", type=str, help="Session profile to print"
+    ).completer = cli.export_completer
+
+    discover_parser = subparsers.add_parser(
+        "discover", help="Creates role profiles for every account in the organization"
+    )
+    discover_parser.add_argument(
+        "role_name", type=str, help="IAM role name to assume in each account"
+    )
+    discover_parser.add_argument(
+        "-t",
+        "--template",
+        type=str,
+        default="{name}",
+        help="Profile name template using {name}, {id} and {role}",
+    )
+    discover_parser.add_argument(
+        "-s",
+        "--source-profile",
+        type=str,
+        default="default",
+        help="Source profile of the generated profiles",
+    )
+    discover_parser.add_argument(
+        "-r", "--region", type=str, default=None, help="Region of generated profiles"
+    )
+    discover_parser.add_argument(
+        "-m", "--mfa-serial", type=str, default=None, help="MFA device to require"
+    )
+    discover_parser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        default=None,
+        help="Profile with access to the organization management account",
+    )
+    discover_parser.add_argument(
+        "-j", "--jobs", type=int, default=16, help="Number of concurrent listings"
+    )
+
+    each_parser = subparsers.add_parser(
+        "each", help="Runs a command once per matching role in parallel"
+    )
+    each_parser.add_argument(
+        "-r",
+        "--roles",
+        type=str,
+        nargs="+",
+        required=True,
+        metavar="GLOB",
+        help="Role profiles to run the command with",
+    )
+    each_parser.add_argument(
+        "-j", "--jobs", type=int, default=8, help="Number of concurrent commands"
+    )
+    each_parser.add_argument(
+        "--json", action="store_true", help="Collect the results as JSON"
+    )
+    each_parser.add_argument(
+        "command", nargs=argparse.REMAINDER, help="Command to run, after --"
+    )
 
     export_parser = subparsers.add_parser(
         "export", help="Exports the access keys to stdout"
@@ -89,18 +177,68 @@ def arguments(cli):
         help="Override shell detection. Supports `bash`, `zsh`, and `fish`",
     )
 
-    list_parser = subparsers.add_parser("list", help="Lists the profiles available")
-    list_parser.set_defaults(func=cli.list)
+    subparsers.add_parser("list", help="Lists the profiles available").set_defaults(
+        func=functools.partial(sessions.list_profiles, cli)
+    )
+
+    ratelimit_parser = subparsers.add_parser(
+        "ratelimit", help="Shows the host wide STS rate limiter metrics"
+    )
+    ratelimit_parser.add_argument(
+        "--json", action="store_true", help="Print the metrics as JSON"
+    )
+    ratelimit_parser.set_defaults(func=stats.ratelimit)
 
-    status_parser = subparsers.add_parser(
+    subparsers.add_parser(
         "status", help="Checks the status of the current profile"
+    ).set_defaults(func=cli.status)
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="Shows latency percentiles from the local usage log"
+    )
+    stats_parser.add_argument(
+        "--json", action="store_true", help="Print the report as JSON"
     )
-    status_parser.set_defaults(func=cli.status)
+    stats_parser.set_defaults(func=functools.partial(stats.stats, cli))
 
     sessions_parser = subparsers.add_parser(
         "sessions", help="Lists the session profiles and their TTL"
     )
-    sessions_parser.set_defaults(func=cli.sessions)
+    sessions_parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keep redrawing the sessions as they change",
+    )
+
+    verify_parser = subparsers.add_parser(
+        "verify", help="Verifies profiles against STS GetCallerIdentity"
+    )
+    verify_parser.add_argument(
+        "profiles",
+        type=str,
+        nargs="*",
+        help="Profiles to verify, defaults to the current profile",
+    ).completer = cli.export_completer
+    verify_parser.add_argument(
+        "-a", "--all", action="store_true", help="Verify every credentials profile"
+    )
+    verify_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=16,
+        help="Number of concurrent STS calls",
+    )
+    verify_parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=60,
+        help="Seconds to reuse a successful verification",
+    )
+    verify_parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON"
+    )
 
     parser.add_argument(
         "-v", "--version", action="store_true", help="Show package version"
@@ -131,10 +269,10 @@ def setup_shell(args):
         print(importlib.resources.read_text("awstemp.wrappers", shell))
 
 
-def main():
-    """main function"""
+def main(instance=None):
+    """main function, instance: an AWSTEMP already loaded by the server"""
 
-    cli = awstemp.AWSTEMP()
+    cli = instance or awstemp.AWSTEMP()
     parser, args = arguments(cli)
 
     if args.version:
@@ -143,10 +281,37 @@ def main():
 
     if args.name == "assume":
         cli.assume(args.role, args.alias)
-    elif args.name == "export":
-        cli.export(args.profile)
-    elif args.name in ["backup", "clean", "list", "status", "sessions"]:
+    elif args.name in ["export", "credential-process"]:
+        getattr(sessions, args.name.replace("-", "_"))(cli, args.profile)
+    elif args.name == "each":
+        each.each(cli, args.roles, args.command, args.jobs, args.json)
+    elif args.name == "sessions":
+        sessions.sessions(cli, args.watch)
+    elif args.name == "clean" and args.users:
+        clean.clean_users(args.users, args.jobs)
+    elif args.name in ["backup", "clean", "list", "status"]:
         args.func()
+    elif args.name == "discover":
+        discover.discover(
+            cli,
+            args.role_name,
+            template=args.template,
+            source_profile=args.source_profile,
+            region=args.region,
+            mfa_serial=args.mfa_serial,
+            profile=args.profile,
+            workers=args.jobs,
+        )
+    elif args.name in ["ratelimit", "stats"]:
+        args.func(args.json)
+    elif args.name == "verify":
+        verify.verify(
+            cli,
+            cli.export_completer() if args.all else args.profiles,
+            args.jobs,
+            args.cache_ttl,
+            args.json,
+        )
     elif args.name == "init":
         setup_shell(args)
     else:
@@ -0,0 +1,174 @@
+"""
+Creates role profiles for every account of an AWS Organization
+"""
+
+import os
+import re
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import boto3
+
+from awstemp import awstemp
+from awstemp.ratelimit import RateLimiter
+
+
+def pages(limiter, method, key, **kwargs):
+    """Collect every page of a paginated listing, one rate limited call per page"""
+
+    items = []
+    while True:
+        response = limiter.call(method, **kwargs)
+        items.extend(response[key])
+        if not response.get("NextToken"):
+            return items
+        kwargs["NextToken"] = response["NextToken"]
+
+
+def organization_listing(limiter, org, kind, parent):
+    """Every account, or every child unit, directly under a parent"""
+
+    if kind == "accounts":
+        method, key = org.list_accounts_for_parent, "Accounts"
+    else:
+        method, key = (
+            org.list_organizational_units_for_parent,
+            "OrganizationalUnits",
+        )
+    return kind, pages(limiter, method, key, ParentId=parent, MaxResults=20)
+
+
+def organization_accounts(profile=None, workers=16):
+    """List the active accounts of the organization, walking OUs in parallel"""
+
+    org = awstemp.client(
+        boto3.Session(profile_name=profile),
+        "organizations",
+        region_name="us-east-1",
+    )
+    limiter = RateLimiter(
+        os.path.join(awstemp.state_path(), "organizations-ratelimit.json"),
+        rate=20.0,
+        increase=1.0,
+    )
+
+    accounts = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def submit(parent):
+            return {
+                pool.submit(organization_listing, limiter, org, x, parent)
+                for x in ["accounts", "units"]
+            }
+
+        pending = set()
+        for root in pages(limiter, org.list_roots, "Roots"):
+            pending |= submit(root["Id"])
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, items = future.result()
+                if kind == "accounts":
+                    accounts.extend(items)
+                else:
+                    for unit in items:
+                        pending |= submit(unit["Id"])
+
+    return sorted(
+        (x for x in accounts if x["Status"] == "ACTIVE"), key=lambda x: x["Id"]
+    )
+
+
+def check_template(template):
+    """Exit with a message unless the profile name template can be filled"""
+
+    try:
+        template.format(name="name", id="id", role="role")
+    except (AttributeError, IndexError, KeyError, ValueError):
+        print(
+            f"Invalid profile name template {template!r},"
+            " the allowed fields are {name}, {id} and {role}"
+        )
+        sys.exit(1)
+
+
+def profile_names(accounts, template, role_name):
+    """
+    Name each account's profile from the template. Accounts whose names
+    collide get their account id appended so none overwrites another.
+    """
+
+    def name(account, suffix=""):
+        return (
+            template.format(
+                name=re.sub(r"[^a-z0-9]+", "-", account["Name"].lower()).strip("-"),
+                id=account["Id"],
+                role=role_name,
+            )
+            + suffix
+        )
+
+    names = [name(x) for x in accounts]
+    duplicates = {x for x in names if names.count(x) > 1}
+    for index, account in enumerate(accounts):
+        if names[index] in duplicates:
+            print(f"Duplicate profile name {names[index]}, appending account id")
+            names[index] = name(account, f"-{account['Id']}")
+
+    if len(set(names)) != len(names):
+        print("Profile name template does not produce unique names")
+        sys.exit(1)
+    return names
+
+
+def merge_profile(config, name, desired):
+    """Set the given non-empty options on a config profile, True if any changed"""
+
+    section = f"profile {name}"
+    if not config.has_section(section):
+        config.add_section(section)
+
+    updated = False
+    for key, value in desired.items():
+        if value and config.get(section, key, fallback=None) != value:
+            config.set(section, key, value)
+            updated = True
+    return updated
+
+
+# pylint: disable=R0913
+def discover(
+    cli,
+    role_name,
+    *,
+    template="{name}",
+    source_profile="default",
+    region=None,
+    mfa_serial=None,
+    profile=None,
+    workers=16,
+):
+    """Create role profiles for every account in the organization"""
+
+    check_template(template)
+    accounts = organization_accounts(profile, workers)
+    names = profile_names(accounts, template, role_name)
+
+    changed = []
+
+    def merge(config):
+        for name, account in zip(names, accounts):
+            desired = {
+                "role_arn": f"arn:aws:iam::{account['Id']}:role/{role_name}",
+                "source_profile": source_profile,
+                "region": region,
+                "mfa_serial": mfa_serial,
+            }
+            if merge_profile(config, name, desired):
+                changed.append(name)
+        return bool(changed)
+
+    cli.config = cli.update_ini(cli.config_path, merge)
+
+    print(f"Discovered {len(accounts)} accounts, {len(changed)} profiles updated")
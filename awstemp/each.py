@@ -0,0 +1,135 @@
+"""
+Runs a command once per role profile, with the roles' sessions assumed in
+parallel and injected through the environment
+"""
+
+import fnmatch
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from configparser import Error as ConfigError
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from awstemp import awstemp, mfa
+
+
+def resolve_sessions(cli, roles, workers):
+    """
+    Session credentials for each role, reusing valid sessions and
+    assuming the others concurrently under their single-flight locks.
+    Roles that could not be assumed map to the error instead.
+    """
+
+    store = threading.Lock()
+
+    def resolve(role):
+        alias = f"{role}_temp"
+        cfg = cli.role_config(role)
+        with store:
+            if not cli.is_expired(alias):
+                return dict(cli.credentials.items(alias), region=cfg["region"])
+
+        with awstemp.single_flight(alias):
+            session = cli.stored_session(alias)
+            if session is None:
+                fresh, _ = cli.fetch_session(cfg)
+                with store:
+                    cli.store_sessions({alias: (cfg["region"], fresh)})
+                    session = dict(cli.credentials.items(alias))
+        return dict(session, region=cfg["region"])
+
+    sessions = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {role: pool.submit(resolve, role) for role in roles}
+        for role, future in futures.items():
+            try:
+                sessions[role] = future.result()
+            except (BotoCoreError, ClientError, ConfigError, mfa.MFAError) as error:
+                sessions[role] = str(error)
+    return sessions
+
+
+def run_command(role, command, session):
+    """Run a command with a role's session injected through the environment"""
+
+    env = dict(os.environ)
+    env.pop("AWS_PROFILE", None)
+    env.update(
+        AWS_ACCESS_KEY_ID=session["aws_access_key_id"],
+        AWS_SECRET_ACCESS_KEY=session["aws_secret_access_key"],
+        AWS_SESSION_TOKEN=session["aws_session_token"],
+        AWS_REGION=session["region"],
+        AWS_DEFAULT_REGION=session["region"],
+        AWSTEMP_ROLE=role,
+    )
+
+    start = time.monotonic()
+    try:
+        process = subprocess.run(
+            command, env=env, capture_output=True, text=True, check=False
+        )
+        result = {
+            "exit_code": process.returncode,
+            "stdout": process.stdout,
+            "stderr": process.stderr,
+        }
+    except OSError as error:
+        result = {"exit_code": 127, "stdout": "", "stderr": f"{error}\n"}
+    result["seconds"] = round(time.monotonic() - start, 3)
+    return {"role": role, **result}
+
+
+def print_prefixed(result):
+    """Print a command's output with every line prefixed by its role"""
+
+    for line in result["stdout"].splitlines():
+        print(f"[{result['role']}] {line}")
+    for line in result["stderr"].splitlines():
+        print(f"[{result['role']}] {line}", file=sys.stderr)
+    if result["exit_code"]:
+        print(f"[{result['role']}] exit code {result['exit_code']}", file=sys.stderr)
+
+
+def each(cli, patterns, command, workers=8, as_json=False):
+    """Run a command once per role matching the globs, in parallel"""
+
+    if command[:1] == ["--"]:
+        command = command[1:]
+    roles = [
+        x
+        for x in cli.role_profiles()
+        if any(fnmatch.fnmatchcase(x, pattern) for pattern in patterns)
+    ]
+    if not roles or not command:
+        print("No matching roles" if command else "No command given")
+        sys.exit(1)
+
+    results = []
+    sessions = resolve_sessions(cli, roles, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for role, session in sessions.items():
+            if isinstance(session, str):
+                results.append({"role": role, "exit_code": None, "error": session})
+                continue
+            futures.append(pool.submit(run_command, role, command, session))
+
+        for future in as_completed(futures):
+            results.append(future.result())
+            if not as_json:
+                print_prefixed(results[-1])
+
+    results.sort(key=lambda x: x["role"])
+    if as_json:
+        print(json.dumps(results))
+    else:
+        for result in results:
+            if "error" in result:
+                print(f"[{result['role']}] {result['error']}", file=sys.stderr)
+    if any(x["exit_code"] != 0 for x in results):
+        sys.exit(1)
@@ -0,0 +1,76 @@
+"""
+Advisory file locks shared by every awstemp process on a host
+"""
+
+import fcntl
+import os
+import time
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a lock could not be acquired in time"""
+
+
+class FileLock:
+    """Exclusive flock on a file, optionally giving up after a timeout"""
+
+    def __init__(self, path, timeout=None, poll=0.05):
+        """Lock path, creating it and its directory if needed"""
+
+        self.path = path
+        self.timeout = timeout
+        self.poll = poll
+        self.fd = None
+
+    def acquire(self):
+        """Block until the lock is held or the timeout passes"""
+
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        if self.timeout is None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            return self
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self.release()
+                    raise LockTimeout(f"Timed out waiting for {self.path}") from None
+                time.sleep(self.poll)
+
+    def release(self):
+        """Release the lock and close the file"""
+
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    def read(self):
+        """Read the locked file's content"""
+
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def write(self, content):
+        """Replace the locked file's content"""
+
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.ftruncate(self.fd, 0)
+        os.write(self.fd, content)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *_):
+        self.release()
@@ -0,0 +1,114 @@
+"""
+MFA token providers, chosen per role profile in the config file
+"""
+
+import json
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+
+from awstemp.locks import FileLock
+
+WINDOW = 30
+TOKEN = re.compile(r"^[0-9]{6}$")
+PROMPT_LOCK = threading.Lock()
+
+
+class MFAError(Exception):
+    """Raised when a provider could not produce a token"""
+
+
+# pylint: disable=R0903
+class PromptProvider:
+    """Asks for the token on stdin, one prompt at a time per process"""
+
+    @staticmethod
+    def token(serial):
+        """Token for an MFA device"""
+
+        with PROMPT_LOCK:
+            try:
+                return input("MFA Token: ").strip()
+            except EOFError:
+                raise MFAError(f"No MFA token entered for {serial}") from None
+
+
+class CommandProvider:
+    """
+    Runs a command printing the token, such as a hardware token CLI. The
+    device is passed in AWSTEMP_MFA_SERIAL and stderr is left on the
+    terminal for touch prompts.
+    """
+
+    def __init__(self, command, timeout=60):
+        """command: shell style command line"""
+
+        self.command = command
+        self.timeout = timeout
+
+    def token(self, serial):
+        """Token for an MFA device"""
+
+        try:
+            result = subprocess.run(
+                shlex.split(self.command),
+                stdout=subprocess.PIPE,
+                env=dict(os.environ, AWSTEMP_MFA_SERIAL=serial),
+                timeout=self.timeout,
+                check=False,
+            )
+        except (OSError, subprocess.TimeoutExpired) as error:
+            raise MFAError(f"MFA command failed for {serial}: {error}") from None
+
+        token = result.stdout.decode(errors="replace").strip()
+        if result.returncode:
+            raise MFAError(
+                f"MFA command failed for {serial}: exit code {result.returncode}"
+            )
+        if not TOKEN.match(token):
+            raise MFAError(f"MFA command printed no token for {serial}")
+        return token
+
+
+class CachedProvider:
+    """
+    Reuses a token within the 30 second window it was obtained in. The
+    token is shared through a locked file, so concurrent assumes on the
+    host wait for the first to obtain it instead of asking again.
+    """
+
+    def __init__(self, source, directory):
+        """source: provider of new tokens, directory: for the lock files"""
+
+        self.source = source
+        self.directory = directory
+
+    def token(self, serial):
+        """Token for an MFA device"""
+
+        name = re.sub(r"[^A-Za-z0-9_.@+=,-]", "_", serial)
+        with FileLock(os.path.join(self.directory, f"mfa-{name}.lock")) as lock:
+            try:
+                cached = json.loads(lock.read())
+            except ValueError:
+                cached = {}
+            if cached.get("window") == int(time.time() // WINDOW):
+                return cached["token"]
+
+            token = self.source.token(serial)
+            cached = {"window": int(time.time() // WINDOW), "token": token}
+            lock.write(json.dumps(cached).encode())
+        return token
+
+
+def provider(command=None, cache=False, directory=None):
+    """
+    The provider for a profile's awstemp_mfa_command and awstemp_mfa_cache
+    settings: the command if one is set, else the prompt
+    """
+
+    source = CommandProvider(command) if command else PromptProvider()
+    return CachedProvider(source, directory) if cache else source
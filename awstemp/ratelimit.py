@@ -0,0 +1,166 @@
+"""
+Host-wide STS rate limiting with additive increase, multiplicative decrease
+"""
+
+import json
+import random
+import time
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from awstemp.locks import FileLock
+
+THROTTLING = {
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+}
+TRANSIENT = {
+    "InternalFailure",
+    "ServiceException",
+    "ServiceUnavailable",
+    "RequestTimeout",
+}
+NETWORK = (
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+WINDOW = 60
+
+
+class RateLimiter:
+    """
+    Token bucket stored in a locked state file so that every awstemp process
+    on the host draws from the same budget. The rate halves on throttling
+    and probes upwards after each success.
+
+    This adapts the call rate rather than the number of calls in flight:
+    STS throttles on request rate, and a slow response is not a signal to
+    back off.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self, path, *, rate=10.0, minimum=0.5, maximum=50.0, increase=0.5, retries=5
+    ):
+        """path: shared state file, rates are in calls per second"""
+
+        self.path = path
+        self.initial = rate
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.retries = retries
+
+    def update(self, change):
+        """Apply change(state, now) to the shared state under the lock"""
+
+        with FileLock(self.path) as lock:
+            try:
+                state = json.loads(lock.read())
+            except ValueError:
+                state = {}
+            now = time.time()
+            state.setdefault("rate", self.initial)
+            state.setdefault("tokens", state["rate"])
+            state.setdefault("updated", now)
+            state.setdefault("calls", 0)
+            state.setdefault("throttles", 0)
+            state.setdefault("seconds", [])
+
+            state["tokens"] = min(
+                state["rate"],
+                state["tokens"] + max(now - state["updated"], 0) * state["rate"],
+            )
+            state["updated"] = now
+
+            result = change(state, now)
+            lock.write(json.dumps(state).encode())
+        return result
+
+    def acquire(self):
+        """Wait for a token from the shared bucket"""
+
+        def take(state, _):
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0.0
+            return (1 - state["tokens"]) / state["rate"]
+
+        while True:
+            wait = self.update(take)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def success(self):
+        """Record a successful call and probe the rate upwards"""
+
+        def record(state, now):
+            state["rate"] = min(self.maximum, state["rate"] + self.increase)
+            state["calls"] += 1
+            second = int(now)
+            seconds = [x for x in state["seconds"] if second - x[0] < WINDOW]
+            if seconds and seconds[-1][0] == second:
+                seconds[-1][1] += 1
+            else:
+                seconds.append([second, 1])
+            state["seconds"] = seconds
+
+        self.update(record)
+
+    def throttled(self):
+        """Record a throttled call and halve the rate"""
+
+        def record(state, _):
+            state["rate"] = max(self.minimum, state["rate"] / 2)
+            state["tokens"] = min(state["tokens"], 0)
+            state["throttles"] += 1
+
+        self.update(record)
+
+    def call(self, method, **kwargs):
+        """Call a botocore client method within the shared rate limit"""
+
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                response = method(**kwargs)
+            except (ClientError, *NETWORK) as error:
+                client = isinstance(error, ClientError)
+                code = error.response.get("Error", {}).get("Code") if client else None
+                if code in THROTTLING:
+                    self.throttled()
+                elif client and code not in TRANSIENT:
+                    raise
+                if attempt == self.retries:
+                    raise
+                time.sleep(random.uniform(0, min(0.1 * 2**attempt, 5)))
+                attempt += 1
+                continue
+            self.success()
+            return response
+
+    def metrics(self):
+        """Current shared rate, observed rate and counters"""
+
+        def read(state, now):
+            recent = [x[1] for x in state["seconds"] if int(now) - x[0] < WINDOW]
+            return {
+                "rate": round(state["rate"], 2),
+                "observed_rate": round(sum(recent) / WINDOW, 2),
+                "calls": state["calls"],
+                "throttles": state["throttles"],
+            }
+
+        return self.update(read)
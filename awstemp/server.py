@@ -0,0 +1,245 @@
+"""
+Resident awstemp server keeping a warm interpreter behind a Unix socket
+
+Each call forwarded by the shim runs in a fork of the server. The fork
+starts with boto3 imported, the INI files parsed and STS clients created,
+and takes over the caller's environment, working directory and terminal.
+"""
+
+import contextlib
+import fcntl
+import os
+import socket
+import struct
+import sys
+import time
+import traceback
+
+from botocore.exceptions import BotoCoreError
+
+from awstemp import awstemp, cli, shim, usage
+from awstemp.locks import FileLock, LockTimeout
+
+PEERCRED = struct.Struct("3i")
+STATE_ENV = (
+    "HOME",
+    "AWS_SHARED_CREDENTIALS_FILE",
+    "AWS_CONFIG_FILE",
+    "AWSTEMP_CREDENTIALS_DIR",
+    "AWSTEMP_STATE_DIR",
+)
+POLL = 1.0
+
+
+def exit_code(status):
+    """Shell style exit code of a wait status"""
+
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def install_fds(targets, fds):
+    """
+    Move received descriptors onto the caller's descriptor numbers and close
+    the forwarded numbers the caller did not have open
+    """
+
+    moved = [fcntl.fcntl(fd, fcntl.F_DUPFD, max(shim.FORWARDED_FDS) + 1) for fd in fds]
+    for fd in fds:
+        os.close(fd)
+    for target, fd in zip(targets, moved):
+        os.dup2(fd, target)
+        os.close(fd)
+    for target in set(shim.FORWARDED_FDS) - set(targets):
+        with contextlib.suppress(OSError):
+            os.close(target)
+
+
+def reopen_streams():
+    """Rebuild the standard streams over the installed descriptors"""
+
+    for name, fd, mode in [("stdin", 0, "r"), ("stdout", 1, "w"), ("stderr", 2, "w")]:
+        try:
+            os.fstat(fd)
+        except OSError:
+            fd = os.open(os.devnull, os.O_RDWR)
+        interactive = name == "stderr" or (mode == "w" and os.isatty(fd))
+        stream = open(  # pylint: disable=R1732
+            fd,
+            mode,
+            buffering=1 if interactive else -1,
+            encoding=awstemp.ENCODING,
+            closefd=False,
+        )
+        setattr(sys, name, stream)
+
+
+def run_request(request, fds, instance):
+    """Run a forwarded call as the caller would have, returning its exit code"""
+
+    install_fds(request["fds"], fds)
+    reopen_streams()
+    os.environ.clear()
+    os.environ.update(request["env"])
+    with contextlib.suppress(OSError):
+        os.chdir(request["cwd"])
+    sys.argv = request["argv"]
+    instance.usage = usage.Usage(instance.usage.path)
+
+    code = 0
+    try:
+        cli.main(instance)
+    except SystemExit as error:
+        code = error.code
+        if not isinstance(code, int):
+            print(code, file=sys.stderr)
+            code = 0 if code is None else 1
+    except KeyboardInterrupt:
+        code = 130
+    except Exception:  # pylint: disable=W0703
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return code
+
+
+class Server:
+    """
+    Accepts forwarded calls from the current user, keeping one AWSTEMP per
+    set of file locations until its files change, and exits after idle
+    seconds without calls. AWSTEMP_SERVER_IDLE sets the default.
+    """
+
+    def __init__(self, path=None, idle=None):
+        """path: Unix socket, defaults to shim.socket_path()"""
+
+        self.path = path or shim.socket_path()
+        self.idle = (
+            float(os.environ.get("AWSTEMP_SERVER_IDLE", "900"))
+            if idle is None
+            else idle
+        )
+        self.instances = {}
+        self.children = set()
+
+    def instance(self, env):
+        """The warm AWSTEMP for a caller's environment, rebuilt on file changes"""
+
+        key = tuple(env.get(x) for x in STATE_ENV)
+        stamp, instance = self.instances.get(key, (None, None))
+        if instance is not None and stamp == instance.stamp():
+            return instance
+
+        saved = dict(os.environ)
+        os.environ.clear()
+        os.environ.update(env)
+        try:
+            instance = awstemp.AWSTEMP()
+            for profile in instance.source_profiles():
+                with contextlib.suppress(BotoCoreError):
+                    instance.sts_client(profile)
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+
+        self.instances[key] = (instance.stamp(), instance)
+        return instance
+
+    @staticmethod
+    def supervise(conn, request, fds, instance):
+        """
+        In the fork for one call: run it in a further fork, send its pid so
+        the caller can interrupt it, then its exit code. Never returns.
+        """
+
+        try:
+            pid = os.fork()
+            if pid == 0:
+                conn.close()
+                os._exit(run_request(request, fds, instance))
+            for fd in fds:
+                os.close(fd)
+            conn.sendall(shim.CODE.pack(pid))
+            conn.sendall(shim.CODE.pack(exit_code(os.waitpid(pid, 0)[1])))
+        finally:
+            os._exit(0)
+
+    def handle(self, conn):
+        """
+        Receive one call from the current user and fork to run it. Calls
+        that cannot be set up are refused so the shim runs them locally.
+        """
+
+        conn.settimeout(5)
+        try:
+            creds = conn.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, PEERCRED.size
+            )
+            if PEERCRED.unpack(creds)[1] != os.getuid():
+                return
+            request, fds = shim.receive_request(conn)
+        except (OSError, ValueError):
+            return
+
+        try:
+            instance = self.instance(request["env"])
+            pid = os.fork()
+            if pid == 0:
+                self.supervise(conn, request, fds, instance)
+            self.children.add(pid)
+        except Exception:  # pylint: disable=W0703
+            # Broken files or settings: the caller runs the call itself and
+            # reports the error, the server stays up for the next call
+            with contextlib.suppress(OSError):
+                conn.sendall(shim.CODE.pack(shim.REFUSED))
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def reap(self):
+        """Collect finished calls, returning whether any are still running"""
+
+        for pid in list(self.children):
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                self.children.discard(pid)
+        return bool(self.children)
+
+    def serve(self):
+        """Serve calls until idle, unless another server already is"""
+
+        try:
+            lock = FileLock(f"{self.path}.lock", timeout=0).acquire()
+        except LockTimeout:
+            return
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.path)
+            os.chmod(self.path, 0o600)
+            sock.listen()
+            sock.settimeout(min(POLL, self.idle))
+
+            last = time.monotonic()
+            while True:
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    if self.reap():
+                        last = time.monotonic()
+                    elif time.monotonic() - last >= self.idle:
+                        return
+                    continue
+                with conn:
+                    self.handle(conn)
+                self.reap()
+                last = time.monotonic()
+        finally:
+            sock.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+            lock.release()
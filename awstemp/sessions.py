@@ -0,0 +1,151 @@
+"""
+Prints the stored profiles and sessions: listings with each session's time
+to live, shell exports and credential_process output
+"""
+
+import datetime
+import json
+import os
+import sys
+
+import humanize
+from dateutil.parser import parse
+
+from awstemp import awstemp
+from awstemp.watch import Watcher
+
+
+def session_expiries(cli):
+    """Parse the expiry of every session section once"""
+
+    return {
+        section: parse(cli.credentials.get(section, "aws_expiration"))
+        for section in cli.credentials.sections()
+        if cli.credentials.has_option(section, "aws_session_token")
+    }
+
+
+def session_line(section, expiry, now):
+    """Format a session with its remaining time to live"""
+
+    delta = expiry - now
+    if delta.total_seconds() > 0:
+        return f"{section} ({humanize.naturaltime(-delta)[:-9]})"
+    return f"{section} (expired)"
+
+
+def next_tick(expiries, now):
+    """Seconds until any remaining countdown crosses a minute boundary"""
+
+    ticks = [60.0]
+    for expiry in expiries.values():
+        remaining = (expiry - now).total_seconds()
+        if remaining > 0:
+            ticks.append(remaining % 60 or 60.0)
+    return min(ticks) + 0.05
+
+
+def list_profiles(cli):
+    """List all credentials"""
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    expiries = session_expiries(cli)
+    for section in sorted(cli.credentials.sections()):
+        if section in expiries:
+            print(session_line(section, expiries[section], now))
+        else:
+            print(section)
+
+
+def sessions(cli, watch=False):
+    """List all sessions"""
+
+    if watch:
+        watch_sessions(cli)
+        return
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    expiries = session_expiries(cli)
+    for section in sorted(expiries):
+        print(session_line(section, expiries[section], now))
+
+
+def watch_sessions(cli):
+    """Redraw sessions when the credentials change or a countdown ticks"""
+
+    watcher = Watcher([cli.credentials_path, cli.shards_path])
+    expiries = session_expiries(cli)
+
+    try:
+        while True:
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            lines = [
+                session_line(section, expiries[section], now)
+                for section in sorted(expiries)
+            ]
+            print("\033[H\033[J" + "\n".join(lines), flush=True)
+
+            if watcher.wait(next_tick(expiries, now)):
+                cli.load_credentials()
+                expiries = session_expiries(cli)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def export(cli, profile=None):
+    """print export statements to console out"""
+
+    if profile is None:
+        profile = os.environ.get("AWS_PROFILE", "default")
+
+    if profile not in cli.credentials.sections():
+        print(f"Profile not found: {profile}")
+        sys.exit(1)
+
+    print(f"Profile: {profile}")
+
+    print(
+        "export AWS_ACCESS_KEY_ID=" + cli.credentials.get(profile, "aws_access_key_id")
+    )
+    print(
+        "export AWS_SECRET_ACCESS_KEY="
+        + cli.credentials.get(profile, "aws_secret_access_key")
+    )
+    if cli.credentials.has_option(profile, "aws_session_token"):
+        print(
+            "export AWS_SESSION_TOKEN="
+            + cli.credentials.get(profile, "aws_session_token")
+        )
+
+    cli.usage.record("export", profile)
+
+
+def credential_process(cli, profile):
+    """print a session as credential_process JSON for the AWS SDKs"""
+
+    if cli.is_expired(profile):
+        # wait for a refresh in progress in another process
+        with awstemp.single_flight(profile):
+            cli.load_credentials()
+
+    if cli.is_expired(profile) or not cli.credentials.has_option(
+        profile, "aws_session_token"
+    ):
+        print(f"Session not found or expired: {profile}", file=sys.stderr)
+        sys.exit(1)
+
+    print(
+        json.dumps(
+            {
+                "Version": 1,
+                "AccessKeyId": cli.credentials.get(profile, "aws_access_key_id"),
+                "SecretAccessKey": cli.credentials.get(
+                    profile, "aws_secret_access_key"
+                ),
+                "SessionToken": cli.credentials.get(profile, "aws_session_token"),
+                "Expiration": cli.credentials.get(profile, "aws_expiration"),
+            }
+        )
+    )
@@ -0,0 +1,141 @@
+"""
+Console entry point that hands the call to a resident awstemp server
+
+Only the standard library is imported here so that a forwarded call costs
+little more than interpreter startup. Without AWSTEMP_SERVER, or when no
+server can be reached, the command runs in this process as usual.
+"""
+
+import array
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+HEADER = struct.Struct("!I")
+CODE = struct.Struct("!i")
+FORWARDED_FDS = (0, 1, 2, 8, 9)
+REFUSED = -1
+START_TIMEOUT = 10.0
+
+
+def socket_path():
+    """Unix socket of the resident server, AWSTEMP_SERVER_SOCKET overrides it"""
+
+    state = os.environ.get("AWSTEMP_STATE_DIR", os.path.expanduser("~/.aws/awstemp"))
+    return os.environ.get("AWSTEMP_SERVER_SOCKET", os.path.join(state, "server.sock"))
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes, raising ConnectionError if the peer goes away"""
+
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("awstemp server connection closed")
+        data += chunk
+    return data
+
+
+def send_request(sock, request, fds):
+    """Send a JSON request with the file descriptors attached"""
+
+    payload = json.dumps(request).encode()
+    rights = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))]
+    sock.sendmsg([HEADER.pack(len(payload))], rights)
+    sock.sendall(payload)
+
+
+def receive_request(sock):
+    """Receive a request sent by send_request and the descriptors it carries"""
+
+    fds = array.array("i")
+    header, ancdata, _, _ = sock.recvmsg(
+        HEADER.size, socket.CMSG_SPACE(len(FORWARDED_FDS) * fds.itemsize)
+    )
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[: len(data) - len(data) % fds.itemsize])
+    header += recv_exact(sock, HEADER.size - len(header))
+    return json.loads(recv_exact(sock, HEADER.unpack(header)[0])), list(fds)
+
+
+def open_fds():
+    """The forwarded descriptors this process has open"""
+
+    fds = []
+    for fd in FORWARDED_FDS:
+        try:
+            os.fstat(fd)
+        except OSError:
+            continue
+        fds.append(fd)
+    return fds
+
+
+def forward(argv, path=None):
+    """
+    Run argv on the resident server with this process's environment, working
+    directory and terminal. Returns the exit code, None when no server
+    answered, or REFUSED when the server could not run the call and it
+    should run here instead. Ctrl-C is passed on to the command.
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            sock.connect(path or socket_path())
+            fds = open_fds()
+            request = {"argv": argv, "env": dict(os.environ), "cwd": os.getcwd()}
+            send_request(sock, {**request, "fds": fds}, fds)
+            pid = CODE.unpack(recv_exact(sock, CODE.size))[0]
+        except OSError:
+            return None
+        if pid == REFUSED:
+            return REFUSED
+
+        while True:
+            try:
+                return CODE.unpack(recv_exact(sock, CODE.size))[0]
+            except KeyboardInterrupt:
+                os.kill(pid, signal.SIGINT)
+            except OSError as error:
+                print(f"awstemp server: {error}", file=sys.stderr)
+                return 1
+
+
+def start_server():
+    """Start a detached resident server that outlives this call"""
+
+    subprocess.Popen(  # pylint: disable=R1732
+        [sys.executable, "-c", "from awstemp import server; server.Server().serve()"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def main():
+    """Forward the call when AWSTEMP_SERVER is set, else run it here"""
+
+    if os.environ.get("AWSTEMP_SERVER", "0") != "0":
+        code = forward(sys.argv)
+        if code is None:
+            start_server()
+            deadline = time.monotonic() + START_TIMEOUT
+            while code is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+                code = forward(sys.argv)
+        if code not in (None, REFUSED):
+            sys.exit(code)
+
+    # Imported here so that forwarded calls never load boto3
+    from awstemp import cli  # pylint: disable=C0415
+
+    cli.main()
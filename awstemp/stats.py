@@ -0,0 +1,41 @@
+"""
+Reports on awstemp's own behaviour: the shared STS rate limiter and the
+latencies in the local usage log
+"""
+
+import json
+
+from awstemp import awstemp, usage
+
+
+def ratelimit(as_json=False):
+    """Print the host wide STS rate limiter metrics"""
+
+    metrics = awstemp.sts_limiter().metrics()
+    if as_json:
+        print(json.dumps(metrics))
+    else:
+        for key, value in metrics.items():
+            print(f"{key}: {value}")
+
+
+def stats(cli, as_json=False):
+    """Print latency percentiles and STS calls avoided from the usage log"""
+
+    result = usage.report(usage.read(cli.usage.path))
+    if as_json:
+        print(json.dumps(result))
+        return
+
+    columns = ["kind", "name", "count", *[f"p{x}" for x in usage.PERCENTILES]]
+    awstemp.print_columns(
+        columns,
+        [
+            [str(x[c]) if c in columns[:3] else f"{x[c]:.1f}ms" for c in columns]
+            for x in result["latencies"]
+        ],
+    )
+    print(
+        f"STS calls made: {result['sts']['made']},"
+        f" avoided: {result['sts']['avoided']}"
+    )
@@ -0,0 +1,131 @@
+"""
+Compact rotating log of awstemp invocations and its latency report
+"""
+
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+MAX_BYTES = 1024 * 1024
+PERCENTILES = (50, 95, 99)
+PHASES = ("sts", "mfa", "io")
+
+
+class Usage:
+    """
+    Timings of one invocation, appended as a single JSON line. Phases (sts,
+    mfa, io) are accumulated in milliseconds, the total runs from creation.
+    """
+
+    def __init__(self, path):
+        """path: log file, rotated to path.1 once it exceeds MAX_BYTES"""
+
+        self.path = path
+        self.start = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def timer(self, phase):
+        """Add the time spent in the block to a phase"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+
+    def record(self, command, role=None, cache=None):
+        """
+        Append the invocation to the log. A single O_APPEND write keeps
+        concurrent lines intact; failures never affect the command.
+        """
+
+        entry = {
+            "time": int(time.time()),
+            "command": command,
+            "role": role,
+            "cache": cache,
+            "total": round((time.perf_counter() - self.start) * 1000, 2),
+            **{key: round(value, 2) for key, value in self.phases.items()},
+        }
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size >= MAX_BYTES:
+                    os.replace(self.path, f"{self.path}.1")
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+def read(path):
+    """
+    Every readable record of the rotated and the current log, oldest first.
+    Lines that are not an object with a command and a total are skipped.
+    """
+
+    records = []
+    for name in [f"{path}.1", path]:
+        try:
+            with open(name, "r", encoding="utf-8") as log_file:
+                lines = log_file.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "command" in record and "total" in record:
+                records.append(record)
+    return records
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of sorted values"""
+
+    return values[max(math.ceil(pct / 100 * len(values)) - 1, 0)]
+
+
+def report(records):
+    """
+    Latency percentiles per subcommand, per phase and per role, and STS calls
+    avoided. A phase only counts the invocations that spent time in it.
+    """
+
+    groups = {}
+    for record in records:
+        groups.setdefault(("command", record["command"]), []).append(record["total"])
+        if record.get("role"):
+            groups.setdefault(("role", record["role"]), []).append(record["total"])
+        for phase in PHASES:
+            if phase in record:
+                groups.setdefault(("phase", phase), []).append(record[phase])
+
+    latencies = []
+    for (kind, name), values in sorted(groups.items()):
+        values = sorted(values)
+        latencies.append(
+            {
+                "kind": kind,
+                "name": name,
+                "count": len(values),
+                **{f"p{x}": percentile(values, x) for x in PERCENTILES},
+            }
+        )
+
+    return {
+        "latencies": latencies,
+        "sts": {
+            "made": sum(x.get("cache") == "miss" for x in records),
+            "avoided": sum(x.get("cache") == "hit" for x in records),
+        },
+    }
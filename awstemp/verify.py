@@ -0,0 +1,174 @@
+"""
+Verifies profiles against STS GetCallerIdentity, concurrently and with
+positive results cached
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+from awstemp import awstemp
+from awstemp.ratelimit import RateLimiter
+
+
+def region(cli, profile):
+    """Region configured for a profile"""
+
+    section = "default" if profile == "default" else f"profile {profile}"
+    return cli.config.get(
+        section,
+        "region",
+        fallback=os.environ.get("AWS_DEFAULT_REGION", "eu-west-1"),
+    )
+
+
+def access_key(cli, profile):
+    """Access key id of a credentials profile, if it has one"""
+    return cli.credentials.get(profile, "aws_access_key_id", fallback=None)
+
+
+def rate_limiter():
+    """
+    Rate limiter for GetCallerIdentity. The calls are made with each
+    profile's own credentials and so spread over many accounts' quotas,
+    they get a bucket of their own rather than the one protecting assumes.
+    """
+
+    return RateLimiter(
+        os.path.join(awstemp.state_path(), "verify-ratelimit.json"),
+        rate=100.0,
+        maximum=500.0,
+        increase=5.0,
+    )
+
+
+def caller_identity(cli, profile, session, lock, limiter):
+    """Call GetCallerIdentity for a single profile"""
+
+    result = {"profile": profile, "account": None, "arn": None, "cached": False}
+
+    if cli.credentials.has_option(profile, "aws_expiration") and cli.is_expired(
+        profile
+    ):
+        return {**result, "status": "expired", "latency": 0.0}
+
+    try:
+        # client creation shares the session's loader, which is not thread safe
+        with lock:
+            if access_key(cli, profile):
+                sts = awstemp.client(
+                    session,
+                    "sts",
+                    region_name=region(cli, profile),
+                    aws_access_key_id=access_key(cli, profile),
+                    aws_secret_access_key=cli.credentials.get(
+                        profile, "aws_secret_access_key"
+                    ),
+                    aws_session_token=cli.credentials.get(
+                        profile, "aws_session_token", fallback=None
+                    ),
+                )
+            else:
+                sts = awstemp.client(
+                    boto3.Session(profile_name=profile),
+                    "sts",
+                    region_name=region(cli, profile),
+                )
+
+        start = time.monotonic()
+        response = limiter.call(sts.get_caller_identity)
+        latency = time.monotonic() - start
+    except ClientError as error:
+        return {**result, "status": error.response["Error"]["Code"], "latency": 0.0}
+    except BotoCoreError as error:
+        return {**result, "status": type(error).__name__, "latency": 0.0}
+
+    return {
+        **result,
+        "status": "ok",
+        "account": response["Account"],
+        "arn": response["Arn"],
+        "latency": round(latency * 1000, 1),
+    }
+
+
+def caller_identities(cli, profiles, workers):
+    """Call GetCallerIdentity for many profiles on a bounded thread pool"""
+
+    session = boto3.Session()
+    lock = threading.Lock()
+    limiter = rate_limiter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                lambda x: caller_identity(cli, x, session, lock, limiter), profiles
+            )
+        )
+
+
+def verify(cli, profiles=None, workers=16, cache_ttl=60, as_json=False):
+    """Verify profiles against STS concurrently, caching positive results"""
+
+    if not profiles:
+        profiles = [os.environ.get("AWS_PROFILE", "default")]
+
+    cache_path = os.path.join(awstemp.state_path(), "verify.json")
+    cache = awstemp.read_json(cache_path, {})
+
+    now = time.time()
+    results = {}
+    for profile in profiles:
+        cached = cache.get(profile)
+        if (
+            cached
+            and now - cached["checked"] < cache_ttl
+            and cached["key"] == access_key(cli, profile)
+        ):
+            results[profile] = {**cached["result"], "cached": True}
+
+    pending = [x for x in profiles if x not in results]
+    if pending:
+        for result in caller_identities(cli, pending, workers):
+            profile = result["profile"]
+            results[profile] = result
+            if result["status"] == "ok":
+                cache[profile] = {
+                    "checked": now,
+                    "key": access_key(cli, profile),
+                    "result": result,
+                }
+
+        os.makedirs(awstemp.state_path(), mode=0o700, exist_ok=True)
+        awstemp.atomic_write(cache_path, json.dumps(cache))
+
+    ordered = [results[profile] for profile in profiles]
+    if as_json:
+        print(json.dumps(ordered, indent=2))
+    else:
+        print_table(ordered)
+
+    if any(x["status"] != "ok" for x in ordered):
+        sys.exit(1)
+
+
+def print_table(results):
+    """Print verification results as aligned columns"""
+
+    columns = ["profile", "status", "account", "arn", "latency"]
+    rows = [
+        [
+            x["profile"],
+            x["status"] + (" (cached)" if x["cached"] else ""),
+            x["account"] or "-",
+            x["arn"] or "-",
+            f"{x['latency']}ms" if x["status"] == "ok" else "-",
+        ]
+        for x in results
+    ]
+    awstemp.print_columns(columns, rows)
@@ -0,0 +1,156 @@
+"""
+Change notification for the credential files, using inotify where available
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+
+EVENT = struct.Struct("iIII")
+POLL_INTERVAL = 1.0
+
+
+def load_inotify():
+    """Return libc when it provides inotify, otherwise None"""
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1  # pylint: disable=W0104
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class Watcher:
+    """Waits for files, or anything in a directory, to change"""
+
+    def __init__(self, paths, inotify=True):
+        """Watch the given files and directories, ignoring None entries"""
+
+        self.paths = [os.path.abspath(x) for x in paths if x]
+        self.fd = None
+        self.watches = {}
+
+        self.libc = load_inotify() if inotify else None
+        if self.libc is not None:
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            self.fd = fd if fd >= 0 else None
+
+        if self.fd is not None:
+            # parents catch files being replaced and directories being
+            # (re)created, the directories themselves catch their content
+            for path in self.paths:
+                self.add_watch(os.path.dirname(path))
+                if os.path.isdir(path):
+                    self.add_watch(path)
+
+        self.state = self.signature()
+
+    def add_watch(self, directory):
+        """Start watching a directory unless it is already watched"""
+
+        if directory in self.watches.values():
+            return
+        wd = self.libc.inotify_add_watch(self.fd, directory.encode(), IN_MASK)
+        if wd >= 0:
+            self.watches[wd] = directory
+
+    def signature(self):
+        """Snapshot of the watched paths used by the polling fallback"""
+
+        state = []
+        for path in self.paths:
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                state.append(None)
+                continue
+            state.append((info.st_ino, info.st_size, info.st_mtime_ns))
+            if os.path.isdir(path):
+                state.extend(self.signature_dir(path))
+        return state
+
+    @staticmethod
+    def signature_dir(path):
+        """Snapshot of the files in a watched directory"""
+
+        return [
+            (entry.name, entry.stat().st_mtime_ns)
+            for entry in sorted(os.scandir(path), key=lambda x: x.name)
+        ]
+
+    def relevant(self, directory, name):
+        """Check whether an event in a watched directory concerns a watched path"""
+
+        return directory in self.paths or os.path.join(directory, name) in self.paths
+
+    def read_events(self):
+        """Drain pending inotify events, return True if any were relevant"""
+
+        changed = False
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT.unpack_from(buffer, offset)
+            start, offset = offset + EVENT.size, offset + EVENT.size + length
+            name = buffer[start:offset].rstrip(b"\0").decode()
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd, "")
+            if not self.relevant(directory, name):
+                continue
+            changed = True
+            path = os.path.join(directory, name)
+            if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                self.add_watch(path)
+        return changed
+
+    def wait(self, timeout):
+        """Block up to timeout seconds, return True if a watched path changed"""
+
+        if self.fd is not None:
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = max(deadline - time.monotonic(), 0)
+                readable, _, _ = select.select([self.fd], [], [], remaining)
+                if not readable:
+                    return False
+                if self.read_events():
+                    return True
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(POLL_INTERVAL, remaining))
+            state = self.signature()
+            if state != self.state:
+                self.state = state
+                return True
+
+    def close(self):
+        """Release the inotify descriptor"""
+
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
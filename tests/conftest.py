@@ -8,11 +8,11 @@ from configparser import ConfigParser
 import pytest
 
 from awstemp import awstemp
-from tests.helpers import data
+from tests.helpers import data, fakests
 
 
 @pytest.fixture(name="instance", autouse=True)
-def fixture_instance(monkeypatch):
+def fixture_instance(monkeypatch, tmp_path):
     """
     Fixture to create a patched instance of the AWSTEMP class
     """
@@ -60,9 +60,84 @@ def fixture_instance(monkeypatch):
 
     monkeypatch.setenv("AWS_CONFIG_FILE", data.AWS_CONFIG_FILE)
     monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", data.AWS_SHARED_CREDENTIALS_FILE)
+    monkeypatch.delenv("AWSTEMP_CREDENTIALS_DIR", raising=False)
+    monkeypatch.setenv("AWSTEMP_STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(awstemp, "CLIENTS", {})
 
     patched_instance = awstemp.AWSTEMP()
     patched_instance.config = mock_config
     patched_instance.credentials = mock_credentials
 
     yield patched_instance
+
+
+@pytest.fixture(name="written")
+def fixture_written(instance, tmp_path):
+    """
+    Fixture writing the patched instance's profiles to real files
+    """
+
+    instance.credentials_path = str(tmp_path / "credentials")
+    instance.config_path = str(tmp_path / "config")
+
+    for path, parser in [
+        (instance.credentials_path, instance.credentials),
+        (instance.config_path, instance.config),
+    ]:
+        with open(path, "w", encoding="utf-8") as ini_file:
+            parser.write(ini_file)
+
+    yield instance
+
+
+@pytest.fixture(name="sharded")
+def fixture_sharded(instance, tmp_path):
+    """
+    Fixture to point the patched instance at real files with sharded sessions
+    """
+
+    instance.credentials_path = str(tmp_path / "credentials")
+    instance.config_path = str(tmp_path / "config")
+    instance.shards_path = str(tmp_path / "credentials.d")
+
+    for path in [instance.credentials_path, instance.config_path]:
+        with open(path, "w", encoding="utf-8") as ini_file:
+            ini_file.write("")
+
+    yield instance
+
+
+@pytest.fixture(name="fake_sts")
+def fixture_fake_sts(monkeypatch, tmp_path):
+    """
+    Fixture running a local fake STS service against real credential files
+    """
+
+    credentials = tmp_path / "credentials"
+    credentials.write_text(
+        "[default]\n"
+        f"aws_access_key_id = {data.AWS_ACCESS_KEY_ID}\n"
+        f"aws_secret_access_key = {data.AWS_SECRET_ACCESS_KEY}\n",
+        encoding="utf-8",
+    )
+    config = tmp_path / "config"
+    config.write_text(
+        "[default]\nregion = eu-west-1\n"
+        f"[profile role1]\nrole_arn = {data.FAKE_ROLE_ARN}\n"
+        f"[profile role2]\nrole_arn = {data.FAKE_ROLE_ARN}\n"
+        f"mfa_serial = {data.MFA_SERIAL}\n",
+        encoding="utf-8",
+    )
+
+    server = fakests.FakeSTSServer().start()
+
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(credentials))
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(config))
+    monkeypatch.setenv("AWS_ENDPOINT_URL_STS", server.url)
+    monkeypatch.setenv("AWS_EC2_METADATA_DISABLED", "true")
+    for name in ["AWS_PROFILE", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        monkeypatch.delenv(name, raising=False)
+
+    yield server
+
+    server.stop()
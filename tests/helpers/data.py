@@ -9,3 +9,5 @@ AWS_CONFIG_FILE = "AWS_CONFIG_FILE"
 AWS_SHARED_CREDENTIALS_FILE = "AWS_SHARED_CREDENTIALS_FILE"
 ROLE_ARN = "ROLE_ARN"
 MFA_SERIAL = "MFA_SERIAL"
+ACCOUNT = "123456789012"
+FAKE_ROLE_ARN = "arn:aws:iam::111111111111:role/role1"
@@ -0,0 +1,419 @@
+"""
+Local stand-in for the AWS STS query API, and the read only parts of the
+Organizations JSON API, with latency and fault injection.
+
+Run standalone with:
+
+    python -m tests.helpers.fakests --port 4566 --latency lognormal:0.05:0.5
+
+and point awstemp at it with AWS_ENDPOINT_URL_STS=http://127.0.0.1:4566
+(and AWS_ENDPOINT_URL_ORGANIZATIONS for discover)
+"""
+
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from xml.sax.saxutils import escape
+
+from tests.helpers import data
+
+NAMESPACE = "https://sts.amazonaws.com/doc/2011-06-15/"
+ORGANIZATIONS = "AWSOrganizationsV20161128."
+CREDENTIAL = re.compile(r"Credential=([^/]+)/")
+
+
+def latency(spec):
+    """
+    Build a latency sampler from a spec string:
+    fixed:SECONDS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA
+    """
+
+    kind, *args = spec.split(":")
+    args = [float(x) for x in args]
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: random.uniform(*args)
+    if kind == "lognormal":
+        median, sigma = args
+        return lambda: median * random.lognormvariate(0, sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+# pylint: disable=R0902
+class FakeSTS:
+    """State and fault injection settings shared by the request handlers"""
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        *,
+        delay=None,
+        throttle_rate=0.0,
+        error_rate=0.0,
+        max_rps=None,
+        duration=3600,
+        organization=None,
+    ):
+        """
+        delay: callable returning seconds to wait before answering
+        throttle_rate: probability of a Throttling response
+        error_rate: probability of an InternalFailure response
+        max_rps: throttle requests above this sustained rate
+        duration: lifetime of issued credentials in seconds
+        organization: FakeOrganization served on the Organizations API
+        """
+
+        self.delay = delay or (lambda: 0.0)
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.duration = duration
+        self.organization = organization
+
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.revoked = set()
+        self.requests = []
+        self.active = 0
+        self.peak = 0
+        self.tokens = max_rps or 0
+        self.refilled = time.monotonic()
+
+    def count(self, action=None, status=None):
+        """Count recorded requests by action and/or response status"""
+
+        return len(
+            [
+                x
+                for x in self.requests
+                if action in (None, x[0]) and status in (None, x[1])
+            ]
+        )
+
+    def over_limit(self):
+        """Token bucket check for max_rps"""
+
+        if not self.max_rps:
+            return False
+        now = time.monotonic()
+        self.tokens = min(
+            self.max_rps, self.tokens + (now - self.refilled) * self.max_rps
+        )
+        self.refilled = now
+        if self.tokens < 1:
+            return True
+        self.tokens -= 1
+        return False
+
+    def fault(self):
+        """Decide whether the current request fails, returns (status, code)"""
+
+        with self.lock:
+            if self.over_limit() or random.random() < self.throttle_rate:
+                return 400, "Throttling"
+        if random.random() < self.error_rate:
+            return 500, "InternalFailure"
+        return None
+
+    def issue(self, arn):
+        """Mint a set of temporary credentials"""
+
+        key = "ASIA" + uuid.uuid4().hex[:16].upper()
+        expiration = datetime.datetime.now(
+            tz=datetime.timezone.utc
+        ) + datetime.timedelta(seconds=self.duration)
+        with self.lock:
+            self.sessions[key] = arn
+        return (
+            "<Credentials>"
+            f"<AccessKeyId>{key}</AccessKeyId>"
+            f"<SecretAccessKey>{uuid.uuid4().hex}</SecretAccessKey>"
+            f"<SessionToken>{uuid.uuid4().hex}</SessionToken>"
+            f"<Expiration>{expiration.strftime('%Y-%m-%dT%H:%M:%SZ')}</Expiration>"
+            "</Credentials>"
+        )
+
+    def assume_role(self, params, _):
+        """AssumeRole result body"""
+
+        role_arn = params["RoleArn"]
+        account = role_arn.split(":")[4] if role_arn.count(":") >= 5 else data.ACCOUNT
+        name = role_arn.rsplit("/", 1)[-1]
+        arn = f"arn:aws:sts::{account}:assumed-role/{name}/{params['RoleSessionName']}"
+        return (
+            self.issue(arn) + "<AssumedRoleUser>"
+            f"<AssumedRoleId>AROA{uuid.uuid4().hex[:16].upper()}</AssumedRoleId>"
+            f"<Arn>{escape(arn)}</Arn>"
+            "</AssumedRoleUser>"
+        )
+
+    def get_session_token(self, _, caller):
+        """GetSessionToken result body"""
+        return self.issue(
+            self.sessions.get(caller, f"arn:aws:iam::{data.ACCOUNT}:user/fake")
+        )
+
+    def get_caller_identity(self, _, caller):
+        """GetCallerIdentity result body"""
+
+        arn = self.sessions.get(caller, f"arn:aws:iam::{data.ACCOUNT}:user/fake")
+        return (
+            f"<UserId>{escape(caller)}</UserId>"
+            f"<Account>{arn.split(':')[4]}</Account>"
+            f"<Arn>{escape(arn)}</Arn>"
+        )
+
+
+class FakeOrganization:
+    """A generated organization tree with nested OUs"""
+
+    def __init__(self, accounts=100, units=10, page_size=20):
+        """Spread accounts over the root and units, half of them nested"""
+
+        self.page_size = page_size
+        self.parents = {"r-root": []}
+        self.accounts = {"r-root": []}
+
+        for index in range(units):
+            unit = f"ou-root-{index:08d}"
+            parent = "r-root" if index < units / 2 else f"ou-root-{index // 2:08d}"
+            self.parents.setdefault(parent, []).append(
+                {"Id": unit, "Arn": f"arn:aws:organizations:::ou/{unit}", "Name": unit}
+            )
+            self.parents[unit] = []
+            self.accounts[unit] = []
+
+        parents = sorted(self.accounts)
+        for index in range(accounts):
+            account = f"{index + 100000000000:012d}"
+            self.accounts[parents[index % len(parents)]].append(
+                {
+                    "Id": account,
+                    "Arn": f"arn:aws:organizations:::account/{account}",
+                    "Email": f"aws+{index}@example.com",
+                    "Name": f"Account {index}",
+                    "Status": "SUSPENDED" if index % 50 == 49 else "ACTIVE",
+                    "JoinedMethod": "CREATED",
+                    "JoinedTimestamp": 1600000000,
+                }
+            )
+
+    def page(self, items, key, params):
+        """Slice a listing by NextToken"""
+
+        start = int(params.get("NextToken") or 0)
+        size = min(int(params.get("MaxResults") or self.page_size), self.page_size)
+        end = start + size
+        response = {key: items[start:end]}
+        if end < len(items):
+            response["NextToken"] = str(end)
+        return response
+
+    def list_roots(self, params):
+        """ListRoots"""
+
+        root = {"Id": "r-root", "Arn": "arn:aws:organizations:::root/r-root"}
+        return self.page([{**root, "Name": "Root", "PolicyTypes": []}], "Roots", params)
+
+    def list_organizational_units_for_parent(self, params):
+        """ListOrganizationalUnitsForParent"""
+        return self.page(
+            self.parents[params["ParentId"]], "OrganizationalUnits", params
+        )
+
+    def list_accounts_for_parent(self, params):
+        """ListAccountsForParent"""
+        return self.page(self.accounts[params["ParentId"]], "Accounts", params)
+
+
+def handler(fake):
+    """Request handler class bound to a FakeSTS instance"""
+
+    class Handler(BaseHTTPRequestHandler):
+        """STS query protocol handler"""
+
+        actions = {
+            "AssumeRole": fake.assume_role,
+            "GetSessionToken": fake.get_session_token,
+            "GetCallerIdentity": fake.get_caller_identity,
+        }
+
+        def log_message(self, *_):  # pylint: disable=W0221
+            """Keep test output quiet"""
+
+        def reply(self, status, body, content_type="text/xml"):
+            """Send a response document"""
+
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        @staticmethod
+        def error(status, code, message):
+            """STS error document"""
+
+            return (
+                status,
+                f'<ErrorResponse xmlns="{NAMESPACE}"><Error>'
+                f"<Type>{'Sender' if status < 500 else 'Receiver'}</Type>"
+                f"<Code>{code}</Code><Message>{escape(message)}</Message>"
+                f"</Error><RequestId>{uuid.uuid4()}</RequestId></ErrorResponse>",
+            )
+
+        def do_POST(self):  # pylint: disable=C0103
+            """Dispatch an STS or Organizations action"""
+
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode()
+            target = self.headers.get("X-Amz-Target", "")
+            match = CREDENTIAL.search(self.headers.get("Authorization", ""))
+            caller = match.group(1) if match else ""
+
+            if target.startswith(ORGANIZATIONS):
+                action = target.split(".", 1)[1]
+                respond, content_type = (
+                    self.respond_json,
+                    "application/x-amz-json-1.1",
+                )
+                params = json.loads(body or "{}")
+            else:
+                params = {k: v[0] for k, v in parse_qs(body).items()}
+                action = params.get("Action")
+                respond, content_type = self.respond, "text/xml"
+
+            with fake.lock:
+                fake.active += 1
+                fake.peak = max(fake.peak, fake.active)
+            status = None
+            try:
+                time.sleep(fake.delay())
+                status, body = respond(action, params, caller)
+            finally:
+                with fake.lock:
+                    fake.active -= 1
+                    fake.requests.append((action, status))
+
+            self.reply(status, body, content_type)
+
+        @staticmethod
+        def respond_json(action, params, _):
+            """Build the response for an Organizations action"""
+
+            method = "".join(
+                f"_{x.lower()}" if x.isupper() else x for x in action
+            ).lstrip("_")
+            if fake.organization is None:
+                return 400, json.dumps({"__type": "AccessDeniedException"})
+            if not method.startswith("list_") or not hasattr(FakeOrganization, method):
+                return 400, json.dumps({"__type": "UnknownOperationException"})
+            fault = fake.fault()
+            if fault:
+                status, code = fault
+                code = {
+                    "Throttling": "TooManyRequestsException",
+                    "InternalFailure": "ServiceException",
+                }[code]
+                return status, json.dumps({"__type": code, "Message": code})
+            return 200, json.dumps(getattr(fake.organization, method)(params))
+
+        def respond(self, action, params, caller):
+            """Build the response for an action, returns (status, body)"""
+
+            if action not in self.actions:
+                return self.error(400, "InvalidAction", f"Unknown action {action}")
+            if caller in fake.revoked:
+                return self.error(403, "InvalidClientTokenId", "Token revoked")
+            fault = fake.fault()
+            if fault:
+                return self.error(*fault, "Rate exceeded")
+
+            result = self.actions[action](params, caller)
+            return 200, (
+                f'<{action}Response xmlns="{NAMESPACE}">'
+                f"<{action}Result>{result}</{action}Result>"
+                f"<ResponseMetadata><RequestId>{uuid.uuid4()}</RequestId>"
+                f"</ResponseMetadata></{action}Response>"
+            )
+
+    return Handler
+
+
+class FakeSTSServer:
+    """Threaded HTTP server hosting a FakeSTS on localhost"""
+
+    def __init__(self, fake=None, port=0):
+        """Bind to localhost, port 0 picks a free port"""
+
+        self.fake = fake or FakeSTS()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler(self.fake))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """Endpoint URL for botocore"""
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        """Serve in a background thread"""
+
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, args=(0.05,), daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Shut the server down"""
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    """Run the fake STS service in the foreground"""
+
+    parser = argparse.ArgumentParser(description="Local fake STS service")
+    parser.add_argument("--port", type=int, default=4566)
+    parser.add_argument("--latency", type=latency, default=None)
+    parser.add_argument("--throttle", type=float, default=0.0)
+    parser.add_argument("--error", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=float, default=None)
+    parser.add_argument("--duration", type=int, default=3600)
+    parser.add_argument("--accounts", type=int, default=0)
+    parser.add_argument("--units", type=int, default=10)
+    args = parser.parse_args()
+
+    server = FakeSTSServer(
+        FakeSTS(
+            delay=args.latency,
+            throttle_rate=args.throttle,
+            error_rate=args.error,
+            max_rps=args.max_rps,
+            duration=args.duration,
+            organization=(
+                FakeOrganization(args.accounts, args.units) if args.accounts else None
+            ),
+        ),
+        args.port,
+    )
+    print(f"Fake STS listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
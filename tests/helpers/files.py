@@ -0,0 +1,69 @@
+"""
+Helpers reading and writing the credential files as other awstemp
+processes would
+"""
+
+import datetime
+import sys
+import threading
+import time
+from configparser import ConfigParser
+
+from awstemp import awstemp, locks
+
+ENCODING = "utf-8"
+
+
+def read_ini(path):
+    """Parse an ini file strictly and count its vim modelines"""
+
+    parser = ConfigParser()
+    parser.read(path)
+    with open(path, encoding=ENCODING) as ini_file:
+        modelines = ini_file.readlines().count(awstemp.AWSTEMP.vimsyntax)
+    return parser, modelines
+
+
+def write_session(path, alias, hours=1):
+    """Append a session to a credentials file as another process would"""
+
+    expiry = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
+        hours=hours
+    )
+    with open(path, "a", encoding=ENCODING) as credentials_file:
+        credentials_file.write(
+            f"[{alias}]\naws_access_key_id = OTHER\n"
+            f"aws_secret_access_key = SECRET\naws_session_token = TOKEN\n"
+            f"aws_expiration = {expiry.isoformat()}\n"
+        )
+
+
+def hold_session_lock(alias, seconds, write=None):
+    """Hold a session's single-flight lock in a thread, then write the session"""
+
+    lock = locks.FileLock(f"{awstemp.state_path()}/locks/session-{alias}.lock")
+    lock.acquire()
+
+    def release():
+        time.sleep(seconds)
+        if write:
+            write_session(write, alias)
+        lock.release()
+
+    thread = threading.Thread(target=release)
+    thread.start()
+    return thread
+
+
+def mfa_command(tmp_path, code):
+    """Command line recording each call and printing an MFA token"""
+
+    script = tmp_path / "token.py"
+    script.write_text(
+        "import os, sys\n"
+        f"with open({str(tmp_path / 'calls')!r}, 'a') as calls:\n"
+        "    calls.write(os.environ['AWSTEMP_MFA_SERIAL'] + '\\n')\n"
+        f"print('123456')\nsys.exit({code})\n",
+        encoding="utf-8",
+    )
+    return f"{sys.executable} {script}"
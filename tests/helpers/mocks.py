@@ -37,6 +37,12 @@ class MockBotoSession:
             }
         }
 
+        get_caller_identity_response = {
+            "UserId": data.AWS_ACCESS_KEY_ID,
+            "Account": data.ACCOUNT,
+            "Arn": data.ROLE_ARN,
+        }
+
         def __init__(self, *args, **kwargs):
             """Initialisation method for boto3.Session.client mock object"""
             print(f"MockBotoSessionClient.__init__: {args}, {kwargs}")
@@ -46,6 +52,11 @@ class MockBotoSession:
             print(f"MockBotoSessionClient.assume_role: {args}, {kwargs}")
             return self.assume_role_response
 
+        def get_caller_identity(self, *args, **kwargs):
+            """Mock boto3.Session.client("sts").get_caller_identity"""
+            print(f"MockBotoSessionClient.get_caller_identity: {args}, {kwargs}")
+            return self.get_caller_identity_response
+
     def __init__(self, *args, **kwargs):
         """Initialisation method for boto3.Session object"""
         print(f"MockBotoSession.__init__: {args}, {kwargs}")
@@ -0,0 +1,248 @@
+"""
+Multi-process stress harness for the credentials and config files.
+
+Worker processes mix assume, clean, backup and completion, as concurrent
+CLI calls from several terminals would, against temporary files and the
+fake STS service. Afterwards the files are checked for lost or corrupt
+sections and duplicated vim modelines, and the throughput is reported.
+
+Run standalone with:
+
+    python -m tests.helpers.stress --processes 8 --operations 50 [--sharded]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from configparser import ConfigParser
+from configparser import Error as ConfigError
+
+from awstemp import awstemp, clean
+from tests.helpers import data, fakests
+
+OPERATIONS = ("assume", "clean", "backup", "complete")
+SESSION_KEYS = (
+    "aws_access_key_id",
+    "aws_secret_access_key",
+    "aws_session_token",
+    "aws_expiration",
+)
+
+
+def prepare(directory, roles, sharded):
+    """Write the starting files and return the environment for the workers"""
+
+    aws = os.path.join(directory, ".aws")
+    os.makedirs(aws, exist_ok=True)
+    env = {
+        "HOME": directory,
+        "AWS_SHARED_CREDENTIALS_FILE": os.path.join(aws, "credentials"),
+        "AWS_CONFIG_FILE": os.path.join(aws, "config"),
+        "AWSTEMP_STATE_DIR": os.path.join(aws, "awstemp"),
+        "AWS_EC2_METADATA_DISABLED": "true",
+    }
+    if sharded:
+        env["AWSTEMP_CREDENTIALS_DIR"] = os.path.join(aws, "credentials.d")
+
+    credentials = ConfigParser()
+    config = ConfigParser()
+    config["default"] = {"region": "eu-west-1"}
+    for name in ["default", "static"]:
+        credentials[name] = {
+            "aws_access_key_id": data.AWS_ACCESS_KEY_ID,
+            "aws_secret_access_key": data.AWS_SECRET_ACCESS_KEY,
+        }
+    for index in range(roles):
+        config[f"profile role{index}"] = {"role_arn": data.FAKE_ROLE_ARN}
+        credentials[f"stale{index}_temp"] = {
+            "aws_session_token": data.AWS_SESSION_TOKEN,
+            "aws_expiration": "2021-07-29T16:18:13+00:00",
+        }
+        config[f"profile stale{index}_temp"] = {"region": "eu-west-1"}
+
+    for path, parser in [
+        (env["AWS_SHARED_CREDENTIALS_FILE"], credentials),
+        (env["AWS_CONFIG_FILE"], config),
+    ]:
+        with open(path, "w", encoding="utf-8") as ini_file:
+            parser.write(ini_file)
+            ini_file.write(awstemp.AWSTEMP.vimsyntax)
+    return env
+
+
+def operate(cli, operation, rng, seed, roles):
+    """Run one operation, returning the alias of an assumed session"""
+
+    if operation == "assume":
+        role = f"role{rng.randrange(roles)}"
+        alias = f"w{seed}_{role}_temp"
+        cli.assume(role, alias)
+        return alias
+    if operation == "clean":
+        clean.clean(cli)
+    elif operation == "backup":
+        cli.backup()
+    else:
+        cli.role_completer()
+        cli.export_completer()
+    return None
+
+
+def worker(env, roles, operations, seed):
+    """
+    Run random operations in a fresh interpreter, with a new AWSTEMP for
+    each one like separate CLI calls. Returns the aliases assumed, the
+    errors and the start and end time.
+    """
+
+    os.environ.pop("AWSTEMP_CREDENTIALS_DIR", None)
+    os.environ.update(env)
+    rng = random.Random(seed)
+    assumed, errors = set(), []
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(operations):
+            operation = rng.choice(OPERATIONS)
+            try:
+                alias = operate(awstemp.AWSTEMP(), operation, rng, seed, roles)
+            except Exception as error:  # pylint: disable=W0703
+                errors.append(f"worker {seed} {operation}: {error!r}")
+                continue
+            if alias:
+                assumed.add(alias)
+    return sorted(assumed), errors, start, time.time()
+
+
+def assume_at(env, role, start):
+    """Assume a role in a fresh interpreter once the shared start time arrives"""
+
+    os.environ.pop("AWSTEMP_CREDENTIALS_DIR", None)
+    os.environ.update(env)
+    time.sleep(max(start - time.time(), 0))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return awstemp.AWSTEMP().assume(role)
+
+
+def contend(processes=4, sharded=False, directory=None):
+    """
+    Let several processes assume the same role at the same moment and
+    return their results and the number of STS calls made
+    """
+
+    with contextlib.ExitStack() as stack:
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+        server = fakests.FakeSTSServer().start()
+        stack.callback(server.stop)
+
+        env = prepare(directory, 1, sharded)
+        env["AWS_ENDPOINT_URL_STS"] = server.url
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            start = time.time() + 2
+            results = pool.starmap(
+                assume_at, [(env, "role0", start) for _ in range(processes)]
+            )
+        return sorted(results), server.fake.count("AssumeRole", 200)
+
+
+def read_ini(path, problems):
+    """Parse an ini file strictly, recording corruption and extra modelines"""
+
+    parser = ConfigParser()
+    try:
+        with open(path, "r", encoding="utf-8") as ini_file:
+            content = ini_file.read()
+        parser.read_string(content, source=path)
+    except (OSError, ConfigError) as error:
+        problems.append(f"{path}: {error}")
+        return parser
+
+    modelines = content.splitlines(keepends=True).count(awstemp.AWSTEMP.vimsyntax)
+    if modelines > 1:
+        problems.append(f"{path}: {modelines} vim modelines")
+    return parser
+
+
+def check(env, roles, assumed):
+    """Every lost, corrupt or duplicated piece of the files after a run"""
+
+    problems = []
+    credentials = read_ini(env["AWS_SHARED_CREDENTIALS_FILE"], problems)
+    config = read_ini(env["AWS_CONFIG_FILE"], problems)
+
+    shards = env.get("AWSTEMP_CREDENTIALS_DIR")
+    for name in sorted(os.listdir(shards)) if shards and os.path.isdir(shards) else []:
+        if not name.startswith("."):
+            shard = read_ini(os.path.join(shards, name), problems)
+            for section in shard.sections():
+                credentials[section] = dict(shard.items(section))
+
+    for section in ["default", "static"]:
+        if not credentials.has_option(section, "aws_access_key_id"):
+            problems.append(f"lost static credentials: {section}")
+    for alias in assumed:
+        missing = [x for x in SESSION_KEYS if not credentials.has_option(alias, x)]
+        if missing:
+            problems.append(f"lost session {alias}: {', '.join(missing)}")
+        if not config.has_section(f"profile {alias}"):
+            problems.append(f"lost config profile: {alias}")
+    for index in range(roles):
+        if not config.has_option(f"profile role{index}", "role_arn"):
+            problems.append(f"lost role profile: role{index}")
+    return problems
+
+
+def run(processes=4, operations=20, roles=4, sharded=False, directory=None):
+    """Run the harness against a fake STS service and summarise the run"""
+
+    with contextlib.ExitStack() as stack:
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+        server = fakests.FakeSTSServer().start()
+        stack.callback(server.stop)
+
+        env = prepare(directory, roles, sharded)
+        env["AWS_ENDPOINT_URL_STS"] = server.url
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            results = pool.starmap(
+                worker, [(env, roles, operations, seed) for seed in range(processes)]
+            )
+
+        assumed = sorted(x for result in results for x in result[0])
+        seconds = max(x[3] for x in results) - min(x[2] for x in results)
+        return {
+            "processes": processes,
+            "operations": processes * operations,
+            "seconds": round(seconds, 3),
+            "ops_per_second": round(processes * operations / seconds, 1),
+            "sts_calls": server.fake.count("AssumeRole", 200),
+            "sessions": len(assumed),
+            "errors": [x for result in results for x in result[1]],
+            "problems": check(env, roles, assumed),
+        }
+
+
+def main():
+    """Run the stress harness and print its report as JSON"""
+
+    parser = argparse.ArgumentParser(description="awstemp file integrity stress")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=50)
+    parser.add_argument("--roles", type=int, default=8)
+    parser.add_argument("--sharded", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.processes, args.operations, args.roles, args.sharded)
+    print(json.dumps(report, indent=2))
+    raise SystemExit(1 if report["errors"] or report["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,17 @@
 pytest module: awstemp/awstemp.py
 """
 
-from unittest.mock import call, mock_open, patch
+import datetime
+import os
+import stat
+from configparser import ConfigParser
+from unittest.mock import Mock, call, patch
 
 import pytest
+from botocore.credentials import AssumeRoleCredentialFetcher, JSONFileCache
 
-from awstemp import awstemp
-from tests.helpers import data, mocks
+from awstemp import awstemp, clean, sessions, usage, verify
+from tests.helpers import data, files, mocks
 
 ENCODING = "utf-8"
 
@@ -61,46 +66,10 @@ def test_is_expired(instance, role, outcome):
     assert instance.is_expired(role) == outcome
 
 
-@patch("builtins.open", new_callable=mock_open, read_data="data")
-def test_clean(mock_file, instance):
-    """Test that clean is not writing expired sections"""
-    instance.syntax = lambda a: None
-    instance.clean()
-
-    assert mock_file.call_args_list == [
-        call("AWS_SHARED_CREDENTIALS_FILE", "w", encoding=ENCODING),
-        call("AWS_CONFIG_FILE", "w", encoding=ENCODING),
-    ]
-
-    for call_args in mock_file.mock_calls:
-        assert call_args != call().write("[profile expired_temp]\n")
-        assert call_args != call().write("[expired_temp]\n")
-
-
-@patch("builtins.open", new_callable=mock_open, read_data="data")
-def test_syntax(mock_file, instance):
-    """Test that # vim syntax is added when not exists in file"""
-    instance.syntax("path")
-
-    assert call("path", "r", encoding=ENCODING) in mock_file.mock_calls
-    assert call("path", "a", encoding=ENCODING) in mock_file.mock_calls
-    assert call().write(awstemp.AWSTEMP.vimsyntax) in mock_file.mock_calls
-
-
-@patch("builtins.open", new_callable=mock_open, read_data=awstemp.AWSTEMP.vimsyntax)
-def test_syntax_skipped(mock_file, instance):
-    """Test that # vim syntax is skipped added when exists in file"""
-    instance.syntax("path")
-
-    assert call("path", "r", encoding=ENCODING) in mock_file.mock_calls
-    assert call("path", "a", encoding=ENCODING) not in mock_file.mock_calls
-    assert call().write(awstemp.AWSTEMP.vimsyntax) not in mock_file.mock_calls
-
-
 @patch("os.path.expanduser")
-@patch("os.mkdir")
+@patch("os.makedirs")
 @patch("shutil.copy")
-def test_backup(mock_shutil_copy, mock_os_mkdir, mock_os_path_expanduser, instance):
+def test_backup(mock_shutil_copy, mock_os_makedirs, mock_os_path_expanduser, instance):
     """Test that the backup function calls correctly"""
 
     backup_dir = "BACKUP_DIR"
@@ -108,7 +77,7 @@ def test_backup(mock_shutil_copy, mock_os_mkdir, mock_os_path_expanduser, instan
 
     instance.backup()
 
-    assert mock_os_mkdir.is_called_with(backup_dir)
+    assert mock_os_makedirs.call_args_list == [call(backup_dir, exist_ok=True)]
     assert mock_shutil_copy.call_args_list == [
         call("AWS_SHARED_CREDENTIALS_FILE", f"{backup_dir}/credentials"),
         call("AWS_CONFIG_FILE", f"{backup_dir}/config"),
@@ -116,141 +85,558 @@ def test_backup(mock_shutil_copy, mock_os_mkdir, mock_os_path_expanduser, instan
 
 
 @pytest.mark.parametrize(
-    "role,session",
-    [
-        (None, False),
-        ("default", False),
-        ("valid_temp", True),
-    ],
+    "role,expected",
+    [(None, 0), ("default", 0), ("valid_temp", 0), ("expired_temp", 1)],
     ids=[
         "None",
         "default",
         "temporary credentials with session token",
+        "temporary credentials with expired session token",
     ],
 )
-@patch("builtins.print")
-def test_export(mock_print, instance, role, session):
-    """Test export method for existing credentials"""
-    instance.export(role)
+def test_status(instance, role, expected):
+    """Test status method to check if credentials have expired"""
+    with pytest.raises(SystemExit) as exception:
+        instance.status(role)
 
-    if role is None:
-        role = "default"
+    assert exception.value.code == expected
 
-    expected = [
-        call(f"Profile: {role}"),
-        call(f"export AWS_ACCESS_KEY_ID={data.AWS_ACCESS_KEY_ID}"),
-        call(f"export AWS_SECRET_ACCESS_KEY={data.AWS_SECRET_ACCESS_KEY}"),
-    ]
 
-    if session:
-        expected.append(call(f"export AWS_SESSION_TOKEN={data.AWS_SESSION_TOKEN}"))
+def test_load_credentials(sharded):
+    """Test that reloading picks up sessions written by another process"""
 
-    assert mock_print.call_args_list == expected
+    with open(sharded.credentials_path, "w", encoding=ENCODING) as credentials_file:
+        credentials_file.write("[other_temp]\n")
 
+    sharded.load_credentials()
 
-@patch("builtins.print")
-def test_export_unknown(mock_print, instance):
-    """Test export method for unknown credentials"""
+    assert sharded.credentials.sections() == ["other_temp"]
+    assert sharded.shards == {}
 
-    role = "unknown"
+
+@pytest.mark.parametrize(
+    "role,expected,config_written",
+    [
+        ("valid", "skipping", False),
+        ("expired", "created", False),
+        ("role1", "created", True),
+    ],
+)
+def test_assume_without_mfa(
+    monkeypatch, written, role, expected, config_written
+):  # pylint: disable=R0913
+    """Test that sessions are merged into the files, valid ones are skipped"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    config_mtime = os.stat(written.config_path).st_mtime_ns
+    credentials_mtime = os.stat(written.credentials_path).st_mtime_ns
+
+    assert written.assume(role) == expected
+
+    credentials, modelines = files.read_ini(written.credentials_path)
+    if expected == "skipping":
+        assert os.stat(written.credentials_path).st_mtime_ns == credentials_mtime
+    else:
+        assert modelines == 1
+        assert credentials.get(f"{role}_temp", "aws_session_token") == (
+            data.AWS_SESSION_TOKEN
+        )
+        assert not written.is_expired(f"{role}_temp")
+    assert (os.stat(written.config_path).st_mtime_ns != config_mtime) == (
+        config_written
+    )
+    config, _ = files.read_ini(written.config_path)
+    assert config.has_section(f"profile {role}_temp")
+
+
+@patch("builtins.input", lambda token: "TOKEN")
+def test_assume_with_mfa(monkeypatch, written):
+    """Test that an MFA role is assumed with the entered token"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+
+    assert written.assume("role2") == "created"
+
+    credentials, _ = files.read_ini(written.credentials_path)
+    assert credentials.get("role2_temp", "aws_session_token") == (
+        data.AWS_SESSION_TOKEN
+    )
+
+
+def test_assume_concurrent_instances(tmp_path, fake_sts):
+    """Test that instances read before each other's writes keep both sessions"""
+
+    first, second = awstemp.AWSTEMP(), awstemp.AWSTEMP()
+
+    assert first.assume("role1", "r1_temp") == "created"
+    assert second.assume("role1", "r2_temp") == "created"
+    assert fake_sts.fake.count("AssumeRole", 200) == 2
+
+    for name in ["credentials", "config"]:
+        parser, modelines = files.read_ini(tmp_path / name)
+        assert modelines == 1
+        for alias in ["r1_temp", "r2_temp"]:
+            section = alias if name == "credentials" else f"profile {alias}"
+            assert parser.has_section(section)
+
+
+@patch("builtins.input", lambda token: raise_keyboard_interrupt())
+def test_assume_with_mfa_interrupted(monkeypatch, instance):
+    """Test assuming a role when credentials are already valid skips"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
 
     with pytest.raises(SystemExit) as exception:
-        instance.export(role)
+        assert instance.assume("role2")
 
-    assert exception.value.code == 1
-    assert mock_print.call_args_list == [call(f"Profile not found: {role}")]
+    assert exception.value.code == 0
 
 
 @pytest.mark.parametrize(
-    "role,expected",
-    [(None, 0), ("default", 0), ("valid_temp", 0), ("expired_temp", 1)],
-    ids=[
-        "None",
-        "default",
-        "temporary credentials with session token",
-        "temporary credentials with expired session token",
+    "content,expected",
+    [
+        ("role1\n", ("role1", None)),
+        ("# team account\n\n  role1 project_temp extra\n", ("role1", "project_temp")),
     ],
 )
-def test_status(instance, role, expected):
-    """Test status method to check if credentials have expired"""
-    with pytest.raises(SystemExit) as exception:
-        instance.status(role)
+def test_directory_role(monkeypatch, tmp_path, content, expected):
+    """Test that the nearest .awstemp file in the parents names the role"""
 
-    assert exception.value.code == expected
+    (tmp_path / "repo" / "src").mkdir(parents=True)
+    (tmp_path / "repo" / ".awstemp").write_text(content, encoding=ENCODING)
+    (tmp_path / ".awstemp").write_text("outer\n", encoding=ENCODING)
+    monkeypatch.chdir(tmp_path / "repo" / "src")
 
+    assert awstemp.directory_role() == expected
+    assert awstemp.directory_role(str(tmp_path)) == ("outer", None)
 
+
+@pytest.mark.parametrize("content", [None, "# only a comment\n"])
 @patch("builtins.print")
-def test_sessions(mock_print, instance):
-    """Test sessions command lists expiry status of all temporary credentials"""
-    instance.sessions()
+def test_directory_role_missing(mock_print, monkeypatch, tmp_path, content):
+    """Test that a missing or empty .awstemp file is reported"""
+
+    if content:
+        (tmp_path / ".awstemp").write_text(content, encoding=ENCODING)
+    else:
+        monkeypatch.setattr(awstemp.os.path, "isfile", lambda path: False)
+
+    with pytest.raises(SystemExit) as exception:
+        awstemp.directory_role(str(tmp_path))
 
+    assert exception.value.code == 1
     assert mock_print.call_args_list == [
-        call("expired_temp (expired)"),
-        call("valid_temp (59 minutes)"),
+        (
+            call(f"No role found in {tmp_path / '.awstemp'}")
+            if content
+            else call("No role given and no .awstemp file found")
+        )
     ]
 
 
-@patch("builtins.print")
-def test_list(mock_print, instance):
-    """Test list command lists credentials"""
-    instance.list()
+def test_assume_directory_role(monkeypatch, instance):
+    """Test that assume without a role uses the .awstemp file"""
 
-    assert mock_print.call_args_list == [
-        call("default"),
-        call("expired_temp (expired)"),
-        call("role1"),
-        call("role2"),
-        call("valid_temp (59 minutes)"),
-    ]
+    monkeypatch.setattr(awstemp, "directory_role", lambda: ("valid", "valid_temp"))
+    assert instance.assume() == "skipping"
+
+
+def test_load_shards(sharded):
+    """Test that sessions are loaded from the credentials directory"""
+
+    os.makedirs(sharded.shards_path)
+    with open(f"{sharded.shards_path}/valid_temp", "w", encoding=ENCODING) as shard:
+        shard.write("[valid_temp]\naws_access_key_id = SHARD\n")
+    with open(f"{sharded.shards_path}/shard_temp", "w", encoding=ENCODING) as shard:
+        shard.write("[shard_temp]\naws_access_key_id = SHARD\n")
+    with open(f"{sharded.shards_path}/.tmp", "w", encoding=ENCODING) as shard:
+        shard.write("[hidden_temp]\n")
+
+    sharded.load_shards()
+
+    assert sharded.shards == {
+        "shard_temp": f"{sharded.shards_path}/shard_temp",
+        "valid_temp": f"{sharded.shards_path}/valid_temp",
+    }
+    assert sharded.credentials.get("valid_temp", "aws_access_key_id") == "SHARD"
+    assert sharded.credentials.has_option("valid_temp", "aws_session_token")
+    assert not sharded.credentials.has_section("hidden_temp")
+
+
+def test_load_shards_missing(sharded):
+    """Test that a missing credentials directory is ignored"""
+    sharded.load_shards()
+    assert sharded.shards == {}
+
+
+def test_init_sharded(monkeypatch, tmp_path):
+    """Test that the constructor loads shards when the directory is configured"""
+
+    monkeypatch.setenv("AWSTEMP_CREDENTIALS_DIR", str(tmp_path))
+    with open(tmp_path / "shard_temp", "w", encoding=ENCODING) as shard:
+        shard.write("[shard_temp]\n")
+
+    assert awstemp.AWSTEMP().shards == {"shard_temp": str(tmp_path / "shard_temp")}
+
+
+def test_assume_sharded(monkeypatch, sharded):
+    """Test that assuming a role writes its own shard instead of the credentials"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+
+    assert sharded.assume("role1") == "created"
+
+    shard = f"{sharded.shards_path}/role1_temp"
+    assert sharded.shards == {"role1_temp": shard}
+    assert stat.S_IMODE(os.stat(shard).st_mode) == 0o600
+
+    written = ConfigParser()
+    written.read(shard)
+    assert written.sections() == ["role1_temp"]
+    assert written.get("role1_temp", "aws_session_token") == data.AWS_SESSION_TOKEN
+
+    with open(sharded.credentials_path, encoding=ENCODING) as credentials_file:
+        assert credentials_file.read() == ""
+
+    config = ConfigParser()
+    config.read(sharded.config_path)
+    assert config.get("profile role1_temp", "credential_process") == (
+        "awstemp credential-process role1_temp"
+    )
+
+
+def test_assume_sharded_existing_process(monkeypatch, sharded):
+    """Test that the config is not rewritten when credential_process exists"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    content = "[profile expired_temp]\ncredential_process = PROCESS\n\n"
+    with open(sharded.config_path, "w", encoding=ENCODING) as config_file:
+        config_file.write(content)
+    mtime = os.stat(sharded.config_path).st_mtime_ns
+
+    assert sharded.assume("expired") == "created"
+
+    assert os.stat(sharded.config_path).st_mtime_ns == mtime
+    with open(sharded.config_path, encoding=ENCODING) as config_file:
+        assert config_file.read() == content
+
+
+def test_assume_sharded_concurrent_instances(monkeypatch, tmp_path, fake_sts):
+    """Test that instances read before each other's writes keep both profiles"""
+
+    monkeypatch.setenv("AWSTEMP_CREDENTIALS_DIR", str(tmp_path / "credentials.d"))
+    first, second = awstemp.AWSTEMP(), awstemp.AWSTEMP()
+
+    assert first.assume("role1", "r1_temp") == "created"
+    assert second.assume("role1", "r2_temp") == "created"
+    assert fake_sts.fake.count("AssumeRole", 200) == 2
+
+    config = ConfigParser()
+    config.read(tmp_path / "config")
+    for alias in ["r1_temp", "r2_temp"]:
+        assert config.get(f"profile {alias}", "credential_process") == (
+            f"awstemp credential-process {alias}"
+        )
+    assert config.has_section("profile role2")
+    assert second.config.has_section("profile r1_temp")
+
+
+@pytest.mark.parametrize("alias", ["../escape", "a/b", ".hidden", "a b"])
+def test_assume_sharded_invalid_alias(monkeypatch, sharded, alias):
+    """Test that aliases unusable as shard file names are rejected"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    sharded.credentials["role1"] = {}
+
+    with pytest.raises(SystemExit) as error:
+        sharded.assume("role1", alias)
+    assert error.value.code == 1
+    assert not os.path.exists(sharded.shards_path)
+
+
+def test_write_shard_invalid_name(sharded):
+    """Test that shard names which could escape the directory are refused"""
+
+    with pytest.raises(ValueError):
+        sharded.write_shard("../credentials")
+
+
+def test_assume_sharded_without_region(monkeypatch, sharded):
+    """Test that credential_process is configured when no region is known"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "")
+
+    assert sharded.assume("role1") == "created"
+
+    config = ConfigParser()
+    config.read(sharded.config_path)
+    assert dict(config.items("profile role1_temp")) == {
+        "credential_process": "awstemp credential-process role1_temp"
+    }
 
 
 @pytest.mark.parametrize(
-    "parameters",
-    [
-        (("valid", [], "skipping")),
-        (("expired", ["AWS_SHARED_CREDENTIALS_FILE"], "created")),
-        (("role1", ["AWS_CONFIG_FILE", "AWS_SHARED_CREDENTIALS_FILE"], "created")),
-    ],
+    "extra_args",
+    [{}, {"SerialNumber": data.MFA_SERIAL}],
+    ids=["plain", "mfa"],
 )
-@patch("builtins.open", new_callable=mock_open, read_data="data")
-def test_assume_without_mfa(mock_file, monkeypatch, instance, parameters):
-    """Test assuming a role when credentials are already valid skips"""
+def test_cli_cache_key(extra_args):
+    """Test that cache keys match the ones botocore computes"""
 
-    role = parameters[0]
-    writes = parameters[1]
-    expected = parameters[2]
+    fetcher = AssumeRoleCredentialFetcher(
+        Mock(), Mock(), data.FAKE_ROLE_ARN, extra_args=dict(extra_args)
+    )
+    kwargs = {
+        "RoleArn": data.FAKE_ROLE_ARN,
+        "RoleSessionName": "role1-1",
+        "TokenCode": "123456",
+        **extra_args,
+    }
 
-    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    assert awstemp.cli_cache_key(kwargs) == fetcher._cache_key  # pylint: disable=W0212
 
-    instance.syntax = lambda a: None
 
-    assert instance.assume(role) == expected
-    assert mock_file.call_args_list == [call(x, "w", encoding=ENCODING) for x in writes]
+@pytest.fixture(name="cli_cache")
+def fixture_cli_cache(monkeypatch, tmp_path, fake_sts):
+    """
+    Fixture enabling the AWS CLI cache under a temporary home directory
+    """
 
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("AWSTEMP_CLI_CACHE", "1")
 
-@patch("builtins.input", lambda token: "TOKEN")
-@patch("builtins.open", new_callable=mock_open, read_data="data")
-def test_assume_with_mfa(mock_file, monkeypatch, instance):
-    """Test assuming a role when credentials are already valid skips"""
+    yield fake_sts, JSONFileCache(str(tmp_path / ".aws" / "cli" / "cache"))
+
+
+def test_cli_cache_written(cli_cache):
+    """Test that botocore reuses a session assumed by awstemp"""
+
+    fake_sts, cache = cli_cache
+
+    assert awstemp.AWSTEMP().assume("role1") == "created"
+
+    fetcher = AssumeRoleCredentialFetcher(
+        Mock(side_effect=AssertionError("STS")), None, data.FAKE_ROLE_ARN, cache=cache
+    )
+    credentials = fetcher.fetch_credentials()
+    config = ConfigParser()
+    config.read(os.environ["AWS_SHARED_CREDENTIALS_FILE"])
+    assert credentials["token"] == config.get("role1_temp", "aws_session_token")
+    assert fake_sts.fake.count("AssumeRole", 200) == 1
+
+
+@pytest.mark.parametrize(
+    "minutes,expected",
+    [(60, "hit"), (10, "miss"), (None, "miss")],
+    ids=["valid", "expiring", "corrupt"],
+)
+def test_cli_cache_read(cli_cache, minutes, expected):
+    """Test that a session cached by the AWS CLI is reused while fresh"""
+
+    fake_sts, cache = cli_cache
+    key = awstemp.cli_cache_key({"RoleArn": data.FAKE_ROLE_ARN})
+    expiration = datetime.datetime.now(tz=datetime.timezone.utc) + (
+        datetime.timedelta(minutes=minutes or 0)
+    )
+    cache[key] = {
+        "Credentials": {
+            "AccessKeyId": data.AWS_ACCESS_KEY_ID,
+            "SecretAccessKey": data.AWS_SECRET_ACCESS_KEY,
+            "SessionToken": "CACHED",
+            "Expiration": expiration if minutes else "never",
+        }
+    }
+
+    cli = awstemp.AWSTEMP()
+    assert cli.assume("role1") == "created"
+
+    records = usage.read(cli.usage.path)
+    config = ConfigParser()
+    config.read(os.environ["AWS_SHARED_CREDENTIALS_FILE"])
+    token = config.get("role1_temp", "aws_session_token")
+    assert [x["cache"] for x in records] == [expected]
+    assert fake_sts.fake.count("AssumeRole", 200) == (expected == "miss")
+    assert (token == "CACHED") == (expected == "hit")
+    assert cache[key]["Credentials"]["SessionToken"] == token
+
+
+def test_cli_cache_path_mfa(monkeypatch, instance, tmp_path):
+    """Test that the MFA device of a role is part of its cache key"""
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("AWSTEMP_CLI_CACHE", "1")
+    key = awstemp.cli_cache_key(
+        {"RoleArn": data.ROLE_ARN, "SerialNumber": data.MFA_SERIAL}
+    )
+
+    assert awstemp.cli_cache_path(instance.role_config("role2")) == str(
+        tmp_path / ".aws" / "cli" / "cache" / f"{key}.json"
+    )
+
+
+def test_cli_cache_disabled(monkeypatch, tmp_path, fake_sts):
+    """Test that the AWS CLI cache is left alone unless enabled"""
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    assert awstemp.AWSTEMP().assume("role1") == "created"
+
+    assert fake_sts.fake.count("AssumeRole", 200) == 1
+    assert not (tmp_path / ".aws" / "cli").exists()
+
+
+def test_assume_single_flight(monkeypatch, written):
+    """Test that a session assumed by another process meanwhile is reused"""
+
+    monkeypatch.setattr("boto3.Session", Mock(side_effect=AssertionError("STS")))
+    thread = files.hold_session_lock("role1_temp", 0.2, written.credentials_path)
+
+    assert written.assume("role1") == "skipping"
+    assert written.credentials.get("role1_temp", "aws_access_key_id") == "OTHER"
+    thread.join()
+
+
+def test_assume_single_flight_timeout(monkeypatch, capsys, written):
+    """Test that a lock held for too long is given up on"""
 
     monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    monkeypatch.setenv("AWSTEMP_LOCK_TIMEOUT", "0.05")
+    thread = files.hold_session_lock("role1_temp", 0.5)
+
+    assert written.assume("role1") == "created"
+    assert capsys.readouterr().err == (
+        "Timed out waiting for another assume of role1_temp\n"
+    )
+    thread.join()
+
+
+@pytest.mark.parametrize("hours", [1, -1], ids=["valid", "expired"])
+def test_stored_session(sharded, hours):
+    """Test that only valid sessions are read back from the shards on disk"""
+
+    os.makedirs(sharded.shards_path)
+    files.write_session(f"{sharded.shards_path}/role1_temp", "role1_temp", hours)
 
-    instance.syntax = lambda path: None
+    stored = sharded.stored_session("role1_temp")
 
-    assert instance.assume("role2") == "created"
-    assert mock_file.call_args_list == [
-        call("AWS_CONFIG_FILE", "w", encoding=ENCODING),
-        call("AWS_SHARED_CREDENTIALS_FILE", "w", encoding=ENCODING),
+    assert (stored or {}).get("aws_access_key_id") == ("OTHER" if hours > 0 else None)
+    assert sharded.stored_session("../escape") is None
+
+
+def test_assume_fake_sts(fake_sts):
+    """Test assuming and verifying a role through real botocore calls"""
+
+    assert awstemp.AWSTEMP().assume("role1") == "created"
+
+    cli = awstemp.AWSTEMP()
+    assert cli.credentials.get("role1_temp", "aws_access_key_id").startswith("ASIA")
+    assert not cli.is_expired("role1_temp")
+
+    results = verify.caller_identities(cli, ["role1_temp", "default"], 2)
+    assert [x["status"] for x in results] == ["ok", "ok"]
+    assert results[0]["account"] == "111111111111"
+    assert results[0]["arn"].startswith("arn:aws:sts::111111111111:assumed-role/role1/")
+    assert fake_sts.fake.count("AssumeRole", 200) == 1
+    assert fake_sts.fake.count("GetCallerIdentity", 200) == 2
+
+
+def test_client_endpoint(monkeypatch):
+    """Test that service specific endpoints take precedence over the global one"""
+
+    session = Mock()
+    monkeypatch.setenv("AWS_ENDPOINT_URL", "http://global")
+    awstemp.client(session, "sts")
+    monkeypatch.setenv("AWS_ENDPOINT_URL_STS", "http://sts")
+    awstemp.client(session, "sts", region_name="eu-west-1")
+
+    assert [x[1]["endpoint_url"] for x in session.client.call_args_list] == [
+        "http://global",
+        "http://sts",
     ]
+    assert session.client.call_args_list[1][1]["region_name"] == "eu-west-1"
 
 
-@patch("builtins.input", lambda token: raise_keyboard_interrupt())
-def test_assume_with_mfa_interrupted(monkeypatch, instance):
-    """Test assuming a role when credentials are already valid skips"""
+def test_stamp(written, tmp_path):
+    """Test that the stamp changes with the loaded files and marks missing ones"""
+
+    first = written.stamp()
+    assert first[2] is None
+
+    with open(written.config_path, "a", encoding="utf-8") as config_file:
+        config_file.write("[profile added]\n")
+
+    assert written.stamp()[:2] != first[:2]
+
+    written.shards_path = str(tmp_path / "credentials.d")
+    os.makedirs(written.shards_path)
+
+    assert written.stamp()[2] is not None
+
+
+def test_source_profiles(instance):
+    """Test that every role profile's source profile is listed once"""
+
+    instance.config["profile other"] = {
+        "role_arn": data.ROLE_ARN,
+        "source_profile": "main",
+    }
+
+    assert instance.source_profiles() == ["default", "main"]
+
+
+def test_sts_client_cached(written, monkeypatch):
+    """Test that STS clients are reused until the files change"""
+
+    session = Mock(side_effect=lambda **_: Mock())
+    monkeypatch.setattr("boto3.Session", session)
+
+    first = written.sts_client("default")
+    assert written.sts_client("default") is first
+    assert written.sts_client("other") is not first
+
+    with open(written.credentials_path, "a", encoding="utf-8") as credentials_file:
+        credentials_file.write("[added]\n")
+
+    assert written.sts_client("default") is not first
+    assert session.call_count == 3
+
+
+def test_usage_recorded(monkeypatch, written):
+    """Test that assume, export, status and clean are recorded"""
 
     monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    written.assume("role1")
+    written.assume("valid")
+    sessions.export(written, "valid_temp")
+    with pytest.raises(SystemExit):
+        written.status("valid_temp")
+    clean.clean(written)
+
+    records = usage.read(written.usage.path)
+    assert [(x["command"], x["role"], x["cache"]) for x in records] == [
+        ("assume", "role1", "miss"),
+        ("assume", "valid", "hit"),
+        ("export", "valid_temp", None),
+        ("status", "valid_temp", None),
+        ("clean", None, None),
+    ]
+    assert {"io", "sts"} <= set(records[0])
+
+
+@pytest.mark.usefixtures("fake_sts")
+def test_assume_mfa_command_fails(capsys, tmp_path):
+    """Test that a failing MFA command fails the assume"""
+
+    config = tmp_path / "config"
+    config.write_text(
+        config.read_text(encoding="utf-8")
+        + f"awstemp_mfa_command = {files.mfa_command(tmp_path, 3)}\n",
+        encoding="utf-8",
+    )
 
     with pytest.raises(SystemExit) as exception:
-        assert instance.assume("role2")
+        awstemp.AWSTEMP().assume("role2")
 
-    assert exception.value.code == 0
+    assert exception.value.code == 1
+    assert "exit code 3" in capsys.readouterr().out
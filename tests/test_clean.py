@@ -0,0 +1,249 @@
+"""
+pytest module: awstemp/clean.py
+"""
+
+import datetime
+import os
+import stat
+from configparser import ConfigParser
+from unittest.mock import call, patch
+
+import pytest
+
+from awstemp import awstemp, clean
+from tests.helpers import files, mocks
+
+ENCODING = "utf-8"
+
+
+@patch("builtins.print")
+def test_clean(mock_print, written):
+    """Test that clean removes expired sections and their config profiles"""
+
+    clean.clean(written)
+    clean.clean(written)
+
+    credentials, modelines = files.read_ini(written.credentials_path)
+    assert credentials.sections() == ["default", "role1", "role2", "valid_temp"]
+    assert modelines == 1
+    config, modelines = files.read_ini(written.config_path)
+    assert "profile expired_temp" not in config.sections()
+    assert "profile valid_temp" in config.sections()
+    assert modelines == 1
+    assert mock_print.call_args_list == [call("Removing expired: expired_temp")]
+    assert written.credentials.sections() == credentials.sections()
+
+
+def test_clean_keeps_concurrent_sessions(written):
+    """Test that sessions written by another process after our read are kept"""
+
+    with open(written.credentials_path, "a", encoding=ENCODING) as credentials_file:
+        credentials_file.write("[other_temp]\naws_session_token = TOKEN\n")
+
+    clean.clean(written)
+
+    credentials, _ = files.read_ini(written.credentials_path)
+    assert "other_temp" in credentials.sections()
+    assert "expired_temp" not in credentials.sections()
+
+
+@patch("builtins.print")
+def test_clean_symlinked(_, written, tmp_path):
+    """Test that symlinked files stay links and their targets are updated"""
+
+    for path in [written.credentials_path, written.config_path]:
+        target = tmp_path / f"dotfiles-{os.path.basename(path)}"
+        os.rename(path, target)
+        os.symlink(target, path)
+
+    clean.clean(written)
+
+    assert os.path.islink(written.credentials_path)
+    assert os.path.islink(written.config_path)
+    credentials, _ = files.read_ini(written.credentials_path)
+    assert "expired_temp" not in credentials.sections()
+    assert not [x for x in os.listdir(tmp_path) if x.startswith(".")]
+
+
+def test_clean_sharded(monkeypatch, sharded):
+    """Test that clean removes expired shards and keeps them out of credentials"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    sharded.assume("role1")
+
+    expired = f"{sharded.shards_path}/expired_temp"
+    with open(expired, "w", encoding=ENCODING) as shard:
+        shard.write("[expired_temp]\n")
+    sharded.shards["expired_temp"] = expired
+
+    clean.clean(sharded)
+
+    assert not os.path.exists(expired)
+    assert os.path.exists(f"{sharded.shards_path}/role1_temp")
+    assert "role1_temp" in sharded.credentials.sections()
+    assert "expired_temp" not in sharded.credentials.sections()
+
+    with open(sharded.credentials_path, encoding=ENCODING) as credentials_file:
+        assert credentials_file.read() == ""
+
+
+def test_clean_sharded_already_removed(sharded):
+    """Test that a shard removed by a concurrent clean is not an error"""
+
+    sharded.shards["expired_temp"] = f"{sharded.shards_path}/expired_temp"
+
+    clean.clean(sharded)
+
+    assert not sharded.shards
+
+
+def write_home(home, credentials, config=""):
+    """Create a user's ~/.aws files below a fake home directory"""
+
+    os.makedirs(home / ".aws")
+    (home / ".aws" / "credentials").write_text(credentials, encoding=ENCODING)
+    (home / ".aws" / "config").write_text(config, encoding=ENCODING)
+    return str(home / ".aws" / "credentials")
+
+
+def test_clean_users(capsys, tmp_path):
+    """Test that every matching user is cleaned, keeping owner and mode"""
+
+    valid = "[valid_temp]\naws_expiration = 2999-01-01T00:00:00+00:00\n\n"
+    expired = "[expired_temp]\naws_expiration = 2021-07-29T16:18:13+00:00\n\n"
+    alice = write_home(
+        tmp_path / "home" / "alice",
+        valid + expired + awstemp.AWSTEMP.vimsyntax,
+        "[profile expired_temp]\nregion = eu-west-1\n\n[profile role1]\n\n",
+    )
+    bob = write_home(tmp_path / "home" / "bob", valid)
+    owner = 1234 if os.geteuid() == 0 else os.getuid()
+    for path in ["", ".aws/config", ".aws/credentials"]:
+        os.chown(tmp_path / "home" / "alice" / path, owner, owner)
+    os.chmod(alice, 0o640)
+    untouched = os.stat(bob).st_mtime_ns
+
+    clean.clean_users([str(tmp_path / "home" / "*"), bob], 2)
+
+    with open(alice, encoding=ENCODING) as credentials_file:
+        assert credentials_file.read() == valid + awstemp.AWSTEMP.vimsyntax
+    info = os.stat(alice)
+    assert (info.st_uid, info.st_gid) == (owner, owner)
+    assert stat.S_IMODE(info.st_mode) == 0o640
+    config = ConfigParser()
+    config.read(tmp_path / "home" / "alice" / ".aws" / "config")
+    assert config.sections() == ["profile role1"]
+    assert os.stat(bob).st_mtime_ns == untouched
+
+    output = capsys.readouterr().out.splitlines()
+    assert output == [
+        f"Removing expired: {alice} expired_temp",
+        "Cleaned 1 of 2 files: 1 sections removed, 102 Bytes reclaimed",
+    ]
+
+
+def test_clean_users_failed(capsys, tmp_path):
+    """Test that unreadable files are reported and fail the command"""
+
+    broken = tmp_path / "credentials"
+    broken.write_text("no section header\n", encoding=ENCODING)
+
+    with pytest.raises(SystemExit) as error:
+        clean.clean_users([str(broken)], 1)
+
+    assert error.value.code == 1
+    assert capsys.readouterr().out.startswith(f"Failed {broken}: ")
+
+
+def test_clean_user(tmp_path):
+    """Test the worker directly, missing files are skipped"""
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    credentials = write_home(
+        tmp_path,
+        "[expired_temp]\naws_expiration = 2021-07-29T16:18:13+00:00\n"
+        + awstemp.AWSTEMP.vimsyntax,
+    )
+
+    assert clean.clean_user(credentials, str(tmp_path / "missing"), now) == (
+        credentials,
+        ["expired_temp"],
+        58,
+        None,
+    )
+    assert clean.clean_user(credentials, str(tmp_path / "missing"), now) == (
+        credentials,
+        [],
+        0,
+        None,
+    )
+
+    with open(credentials, "w", encoding=ENCODING) as credentials_file:
+        credentials_file.write("[naive]\naws_expiration = 2021-07-29T16:18:13\n")
+    assert clean.clean_user(credentials, credentials, now)[3]
+
+
+EXPIRED = "[expired_temp]\naws_expiration = 2021-07-29T16:18:13+00:00\n"
+
+
+@pytest.mark.parametrize("kind", ["symlink", "fifo"])
+def test_remove_sections_special_files(tmp_path, kind):
+    """Test that symlinks and other special files are left alone"""
+
+    path = str(tmp_path / "credentials")
+    target = tmp_path / "target"
+    target.write_text(EXPIRED, encoding=ENCODING)
+    if kind == "symlink":
+        os.symlink(target, path)
+    else:
+        os.mkfifo(path)
+
+    assert clean.remove_sections(path, lambda x: x.sections()) == ([], 0)
+    assert target.read_text(encoding=ENCODING) == EXPIRED
+    assert os.path.islink(path) == (kind == "symlink")
+
+
+@pytest.mark.parametrize("function", ["lstat", "fstat"])
+def test_remove_sections_foreign_owner(monkeypatch, tmp_path, function):
+    """Test that files owned by another user are left alone, even if swapped in"""
+
+    path = tmp_path / "credentials"
+    path.write_text(EXPIRED, encoding=ENCODING)
+    original = getattr(os, function)
+
+    def foreign(*args):
+        info = original(*args)
+        return os.stat_result((*info[:4], info.st_uid + 1, *info[5:]))
+
+    monkeypatch.setattr(os, function, foreign)
+
+    assert clean.remove_sections(str(path), lambda x: x.sections(), 0) == ([], 0)
+    monkeypatch.undo()
+    assert path.read_text(encoding=ENCODING) == EXPIRED
+
+
+def test_clean_user_foreign_files(monkeypatch, tmp_path):
+    """Test that files not owned by the home directory's owner are skipped"""
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    credentials = write_home(tmp_path / "home", EXPIRED)
+    lstat = os.lstat
+
+    def other_home(path):
+        info = lstat(path)
+        if path == str(tmp_path / "home"):
+            info = os.stat_result((*info[:4], info.st_uid + 1, *info[5:]))
+        return info
+
+    monkeypatch.setattr(os, "lstat", other_home)
+
+    assert clean.clean_user(credentials, credentials, now) == (
+        credentials,
+        [],
+        0,
+        None,
+    )
+    monkeypatch.undo()
+    assert (tmp_path / "home" / ".aws" / "credentials").read_text(
+        encoding=ENCODING
+    ) == EXPIRED
@@ -37,7 +37,7 @@ def test_main_print_help(mock_cli_arguments, name):
     assert mock_parser.print_help.call_args_list == [call()]
 
 
-@pytest.mark.parametrize("name", ["backup", "clean", "list", "status", "sessions"])
+@pytest.mark.parametrize("name", ["backup", "clean", "list", "status"])
 @patch("awstemp.cli.arguments")
 def test_main_calls_func(mock_cli_arguments, name):
     """Tests that generic none parametrized functions are called"""
@@ -45,6 +45,7 @@ def test_main_calls_func(mock_cli_arguments, name):
     mock_parse_args = Mock()
     mock_parse_args.name = name
     mock_parse_args.version = None
+    mock_parse_args.users = None
     mock_parse_args.func = Mock()
 
     mock_cli_arguments.return_value = (None, mock_parse_args)
@@ -54,9 +55,10 @@ def test_main_calls_func(mock_cli_arguments, name):
     assert mock_parse_args.func.call_args_list == [call()]
 
 
+@patch("awstemp.cli.sessions.export")
 @patch("awstemp.cli.arguments")
 @patch("awstemp.awstemp.AWSTEMP")
-def test_main_calls_cli_export(mock_awstemp_awstemp, mock_cli_arguments):
+def test_main_calls_cli_export(mock_awstemp_awstemp, mock_cli_arguments, mock_export):
     """Tests that the cli export command is called"""
 
     mock_parse_args = Mock()
@@ -65,14 +67,214 @@ def test_main_calls_cli_export(mock_awstemp_awstemp, mock_cli_arguments):
     mock_parse_args.profile = "profile"
 
     mock_awstemp = Mock()
-    mock_awstemp.export = Mock()
 
     mock_cli_arguments.return_value = (None, mock_parse_args)
     mock_awstemp_awstemp.return_value = mock_awstemp
 
     awstemp.cli.main()
 
-    assert mock_awstemp.export.call_args_list == [call(mock_parse_args.profile)]
+    assert mock_export.call_args_list == [call(mock_awstemp, mock_parse_args.profile)]
+
+
+@pytest.mark.parametrize(
+    "verify_all,profiles,expected",
+    [(False, ["profile"], ["profile"]), (True, [], ["all"])],
+    ids=["profiles", "all"],
+)
+@patch("awstemp.cli.verify.verify")
+@patch("awstemp.cli.arguments")
+def test_main_calls_cli_verify(
+    mock_cli_arguments, mock_verify, verify_all, profiles, expected
+):
+    """Tests that the cli verify command is called"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "verify"
+    mock_parse_args.version = None
+    mock_parse_args.all = verify_all
+    mock_parse_args.profiles = profiles
+    mock_parse_args.jobs = 4
+    mock_parse_args.cache_ttl = 30
+    mock_parse_args.json = True
+
+    mock_awstemp = Mock()
+    mock_awstemp.export_completer = Mock(return_value=["all"])
+
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+
+    awstemp.cli.main(mock_awstemp)
+
+    assert mock_verify.call_args_list == [call(mock_awstemp, expected, 4, 30, True)]
+
+
+@patch("awstemp.cli.discover.discover")
+@patch("awstemp.cli.arguments")
+@patch("awstemp.awstemp.AWSTEMP")
+def test_main_calls_cli_discover(
+    mock_awstemp_awstemp, mock_cli_arguments, mock_discover
+):
+    """Tests that the cli discover command is called"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "discover"
+    mock_parse_args.version = None
+
+    mock_awstemp = Mock()
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+    mock_awstemp_awstemp.return_value = mock_awstemp
+
+    awstemp.cli.main()
+
+    assert mock_discover.call_args_list == [
+        call(
+            mock_awstemp,
+            mock_parse_args.role_name,
+            template=mock_parse_args.template,
+            source_profile=mock_parse_args.source_profile,
+            region=mock_parse_args.region,
+            mfa_serial=mock_parse_args.mfa_serial,
+            profile=mock_parse_args.profile,
+            workers=mock_parse_args.jobs,
+        )
+    ]
+
+
+@pytest.mark.parametrize("as_json", [False, True])
+@patch("awstemp.cli.arguments")
+@patch("awstemp.awstemp.AWSTEMP")
+def test_main_calls_cli_ratelimit(mock_awstemp_awstemp, mock_cli_arguments, as_json):
+    """Tests that the cli ratelimit command is called"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "ratelimit"
+    mock_parse_args.version = None
+    mock_parse_args.json = as_json
+
+    mock_awstemp = Mock()
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+    mock_awstemp_awstemp.return_value = mock_awstemp
+
+    awstemp.cli.main()
+
+    assert mock_parse_args.func.call_args_list == [call(as_json)]
+
+
+@pytest.mark.parametrize("as_json", [False, True])
+@patch("awstemp.cli.arguments")
+@patch("awstemp.awstemp.AWSTEMP")
+def test_main_calls_cli_stats(mock_awstemp_awstemp, mock_cli_arguments, as_json):
+    """Tests that the cli stats command is called"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "stats"
+    mock_parse_args.version = None
+    mock_parse_args.json = as_json
+
+    mock_awstemp = Mock()
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+    mock_awstemp_awstemp.return_value = mock_awstemp
+
+    awstemp.cli.main()
+
+    assert mock_parse_args.func.call_args_list == [call(as_json)]
+
+
+@pytest.mark.parametrize("watch", [False, True])
+@patch("awstemp.cli.sessions.sessions")
+@patch("awstemp.cli.arguments")
+@patch("awstemp.awstemp.AWSTEMP")
+def test_main_calls_cli_sessions(
+    mock_awstemp_awstemp, mock_cli_arguments, mock_sessions, watch
+):
+    """Tests that the cli sessions command is called"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "sessions"
+    mock_parse_args.version = None
+    mock_parse_args.watch = watch
+
+    mock_awstemp = Mock()
+
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+    mock_awstemp_awstemp.return_value = mock_awstemp
+
+    awstemp.cli.main()
+
+    assert mock_sessions.call_args_list == [call(mock_awstemp, watch)]
+
+
+@patch("awstemp.cli.clean.clean_users")
+@patch("awstemp.cli.arguments")
+@patch("awstemp.awstemp.AWSTEMP")
+def test_main_calls_cli_clean_users(
+    mock_awstemp_awstemp, mock_cli_arguments, mock_clean_users
+):
+    """Tests that clean with --users cleans the given users"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "clean"
+    mock_parse_args.version = None
+    mock_parse_args.users = ["/home/*"]
+    mock_parse_args.jobs = 4
+
+    mock_awstemp = Mock()
+
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+    mock_awstemp_awstemp.return_value = mock_awstemp
+
+    awstemp.cli.main()
+
+    assert mock_clean_users.call_args_list == [call(["/home/*"], 4)]
+
+
+@patch("awstemp.cli.sessions.credential_process")
+@patch("awstemp.cli.arguments")
+@patch("awstemp.awstemp.AWSTEMP")
+def test_main_calls_cli_credential_process(
+    mock_awstemp_awstemp, mock_cli_arguments, mock_credential_process
+):
+    """Tests that the cli credential-process command is called"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "credential-process"
+    mock_parse_args.version = None
+    mock_parse_args.profile = "profile"
+
+    mock_awstemp = Mock()
+
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+    mock_awstemp_awstemp.return_value = mock_awstemp
+
+    awstemp.cli.main()
+
+    assert mock_credential_process.call_args_list == [
+        call(mock_awstemp, mock_parse_args.profile)
+    ]
+
+
+@patch("awstemp.cli.each.each")
+@patch("awstemp.cli.arguments")
+@patch("awstemp.awstemp.AWSTEMP")
+def test_main_calls_cli_each(mock_awstemp_awstemp, mock_cli_arguments, mock_each):
+    """Tests that the cli each command is called"""
+
+    mock_parse_args = Mock()
+    mock_parse_args.name = "each"
+    mock_parse_args.version = None
+    mock_parse_args.roles = ["prod-*"]
+    mock_parse_args.command = ["--", "aws", "s3", "ls"]
+    mock_parse_args.jobs = 4
+    mock_parse_args.json = True
+
+    mock_awstemp = Mock()
+    mock_cli_arguments.return_value = (None, mock_parse_args)
+    mock_awstemp_awstemp.return_value = mock_awstemp
+
+    awstemp.cli.main()
+
+    assert mock_each.call_args_list == [
+        call(mock_awstemp, ["prod-*"], ["--", "aws", "s3", "ls"], 4, True)
+    ]
 
 
 @patch("awstemp.cli.setup_shell")
@@ -132,11 +334,17 @@ def test_arguments():
         "assume",
         "backup",
         "clean",
+        "credential-process",
+        "discover",
+        "each",
         "export",
         "init",
         "list",
+        "ratelimit",
         "sessions",
+        "stats",
         "status",
+        "verify",
     ]:
         assert subparser in subparsers
 
@@ -0,0 +1,165 @@
+"""
+pytest module: awstemp/discover.py
+"""
+
+import json
+import os
+import stat
+import time
+import urllib.error
+import urllib.request
+from configparser import ConfigParser
+from unittest.mock import Mock, call, patch
+
+import pytest
+
+from awstemp import awstemp, discover
+from tests.helpers import data, fakests
+
+
+@patch("builtins.print")
+def test_discover_fake_organization(mock_print, monkeypatch, fake_sts):
+    """Test that thousands of accounts are discovered and merged in one write"""
+
+    fake_sts.fake.organization = fakests.FakeOrganization(accounts=5000, units=50)
+    fake_sts.fake.delay = fakests.latency("fixed:0.002")
+    monkeypatch.setenv("AWS_ENDPOINT_URL_ORGANIZATIONS", fake_sts.url)
+    config_path = os.environ["AWS_CONFIG_FILE"]
+    os.chmod(config_path, 0o640)
+
+    start = time.monotonic()
+    discover.discover(
+        awstemp.AWSTEMP(),
+        "OrganizationAccountAccessRole",
+        template="{name}-{id}",
+        region="eu-west-1",
+    )
+    assert time.monotonic() - start < 30
+    assert fake_sts.fake.peak > 1
+    assert mock_print.call_args_list[-1] == call(
+        "Discovered 4900 accounts, 4900 profiles updated"
+    )
+
+    config = ConfigParser()
+    config.read(config_path)
+    assert len(config.sections()) == 4903
+    assert dict(config.items("profile account-0-100000000000")) == {
+        "role_arn": "arn:aws:iam::100000000000:role/OrganizationAccountAccessRole",
+        "source_profile": "default",
+        "region": "eu-west-1",
+    }
+    assert config.get("profile role2", "mfa_serial") == data.MFA_SERIAL
+    assert not config.has_section("profile account-49-100000000049")
+    assert stat.S_IMODE(os.stat(config_path).st_mode) == 0o640
+
+    modified = os.stat(config_path).st_mtime_ns
+    discover.discover(
+        awstemp.AWSTEMP(),
+        "OrganizationAccountAccessRole",
+        template="{name}-{id}",
+        region="eu-west-1",
+    )
+    assert mock_print.call_args_list[-1] == call(
+        "Discovered 4900 accounts, 0 profiles updated"
+    )
+    assert os.stat(config_path).st_mtime_ns == modified
+
+
+@patch("builtins.print")
+def test_discover_updates_changed(mock_print, monkeypatch, fake_sts):
+    """Test that only profiles whose settings differ are updated"""
+
+    fake_sts.fake.organization = fakests.FakeOrganization(accounts=3, units=1)
+    monkeypatch.setenv("AWS_ENDPOINT_URL_ORGANIZATIONS", fake_sts.url)
+
+    discover.discover(awstemp.AWSTEMP(), "Admin")
+    discover.discover(awstemp.AWSTEMP(), "Admin", mfa_serial=data.MFA_SERIAL)
+
+    assert mock_print.call_args_list[-1] == call(
+        "Discovered 3 accounts, 3 profiles updated"
+    )
+    config = ConfigParser()
+    config.read(os.environ["AWS_CONFIG_FILE"])
+    assert config.get("profile account-0", "mfa_serial") == data.MFA_SERIAL
+
+
+@patch("builtins.print")
+def test_discover_colliding_names(mock_print, monkeypatch, fake_sts):
+    """Test that accounts with the same name get distinct profiles"""
+
+    organization = fakests.FakeOrganization(accounts=3, units=0)
+    for account in organization.accounts["r-root"]:
+        account["Name"] = "Sandbox" if account["Id"] != "100000000002" else "Prod"
+    fake_sts.fake.organization = organization
+    fake_sts.fake.error_rate = 0.3
+    monkeypatch.setattr("awstemp.ratelimit.random.uniform", lambda *_: 0)
+    monkeypatch.setenv("AWS_ENDPOINT_URL_ORGANIZATIONS", fake_sts.url)
+
+    discover.discover(awstemp.AWSTEMP(), "Admin")
+
+    assert mock_print.call_args_list[-1] == call(
+        "Discovered 3 accounts, 3 profiles updated"
+    )
+    config = ConfigParser()
+    config.read(os.environ["AWS_CONFIG_FILE"])
+    assert not config.has_section("profile sandbox")
+    assert config.get("profile sandbox-100000000000", "role_arn") == (
+        "arn:aws:iam::100000000000:role/Admin"
+    )
+    assert config.get("profile sandbox-100000000001", "role_arn") == (
+        "arn:aws:iam::100000000001:role/Admin"
+    )
+    assert config.has_section("profile prod")
+
+
+@patch("builtins.print")
+def test_profile_names_not_unique(_):
+    """Test that a template which cannot be made unique is refused"""
+
+    accounts = [
+        {"Id": "1", "Name": "a-2"},
+        {"Id": "2", "Name": "a"},
+        {"Id": "3", "Name": "a"},
+    ]
+
+    with pytest.raises(SystemExit) as exception:
+        discover.profile_names(accounts, "{name}", "Admin")
+
+    assert exception.value.code == 1
+
+
+@pytest.mark.parametrize("template", ["{account}", "{}", "{0}", "{name", "{id.x}"])
+def test_discover_invalid_template(monkeypatch, capsys, instance, template):
+    """Test that a bad template is refused before the organization is listed"""
+
+    organization_accounts = Mock()
+    monkeypatch.setattr(discover, "organization_accounts", organization_accounts)
+
+    with pytest.raises(SystemExit) as exception:
+        discover.discover(instance, "Admin", template=template)
+
+    assert exception.value.code == 1
+    assert not organization_accounts.called
+    assert "{name}, {id} and {role}" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "target,code",
+    [("ListRoots", "AccessDeniedException"), ("Page", "UnknownOperationException")],
+)
+def test_fake_organizations_errors(fake_sts, target, code):
+    """Test that the stand-in answers bad requests with error documents"""
+
+    if code != "AccessDeniedException":
+        fake_sts.fake.organization = fakests.FakeOrganization(accounts=1, units=0)
+    request = urllib.request.Request(
+        fake_sts.url,
+        data=b"{}",
+        headers={"X-Amz-Target": fakests.ORGANIZATIONS + target},
+    )
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request)  # pylint: disable=R1732
+
+    assert error.value.code == 400
+    assert json.loads(error.value.read())["__type"] == code
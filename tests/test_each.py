@@ -0,0 +1,207 @@
+"""
+pytest module: awstemp/each.py
+"""
+
+import json
+import os
+import sys
+from unittest.mock import Mock, call, patch
+
+import pytest
+from botocore.exceptions import ClientError, NoCredentialsError
+
+from awstemp import awstemp, each
+from tests.helpers import data, files, mocks
+
+
+def test_each_single_flight(monkeypatch, capsys, sharded):
+    """Test that each reuses a session another process stored meanwhile"""
+
+    monkeypatch.setattr(sharded, "request_session", Mock(side_effect=AssertionError))
+    os.makedirs(sharded.shards_path)
+    files.write_session(f"{sharded.shards_path}/role1_temp", "role1_temp")
+
+    each.each(sharded, ["role1"], session_env("AWS_ACCESS_KEY_ID"))
+
+    assert capsys.readouterr().out == "[role1] role1 OTHE\n"
+
+
+def session_env(*names):
+    """Command printing the role and the given environment variables"""
+
+    return [
+        sys.executable,
+        "-c",
+        "import os; print(os.environ['AWSTEMP_ROLE'],"
+        + ",".join(f"os.environ.get('{x}', '-')[:4]" for x in names)
+        + ")",
+    ]
+
+
+@patch("builtins.input", lambda prompt: "123456")
+def test_each_fake_sts(monkeypatch, capsys, tmp_path, fake_sts):
+    """Test that roles are assumed once and the command gets their session"""
+
+    monkeypatch.setenv("AWS_PROFILE", "default")
+    monkeypatch.delenv("AWS_DEFAULT_REGION", raising=False)
+    command = session_env("AWS_ACCESS_KEY_ID", "AWS_REGION", "AWS_PROFILE")
+
+    each.each(awstemp.AWSTEMP(), ["role*"], ["--", *command], 2)
+    each.each(awstemp.AWSTEMP(), ["role1", "role2"], command, 2)
+
+    assert sorted(capsys.readouterr().out.splitlines()) == [
+        "[role1] role1 ASIA eu-w -",
+        "[role1] role1 ASIA eu-w -",
+        "[role2] role2 ASIA eu-w -",
+        "[role2] role2 ASIA eu-w -",
+    ]
+    assert fake_sts.fake.count("AssumeRole", 200) == 2
+    credentials, modelines = files.read_ini(tmp_path / "credentials")
+    assert {"role1_temp", "role2_temp"} <= set(credentials.sections())
+    assert modelines == 1
+
+
+def test_each_mfa_command_cached(capsys, tmp_path, fake_sts):
+    """Test that concurrent MFA roles share one token from the command"""
+
+    config = tmp_path / "config"
+    config.write_text(
+        config.read_text(encoding="utf-8")
+        + f"awstemp_mfa_command = {files.mfa_command(tmp_path, 0)}\n"
+        + "awstemp_mfa_cache = true\n"
+        + f"[profile role3]\nrole_arn = {data.FAKE_ROLE_ARN}\n"
+        + f"mfa_serial = {data.MFA_SERIAL}\n"
+        + f"awstemp_mfa_command = {files.mfa_command(tmp_path, 0)}\n"
+        + "awstemp_mfa_cache = true\n",
+        encoding="utf-8",
+    )
+
+    each.each(awstemp.AWSTEMP(), ["role2", "role3"], [sys.executable, "-c", "pass"], 2)
+
+    assert (tmp_path / "calls").read_text(encoding="utf-8") == (f"{data.MFA_SERIAL}\n")
+    assert fake_sts.fake.count("AssumeRole", 200) == 2
+    assert "MFA Token" not in capsys.readouterr().out
+
+
+def test_resolve_sessions_mfa_error(monkeypatch, instance):
+    """Test that roles without an MFA token map to the error"""
+
+    provider = Mock()
+    provider.token.side_effect = awstemp.mfa.MFAError("No MFA token entered")
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    monkeypatch.setattr(awstemp.mfa, "provider", Mock(return_value=provider))
+
+    resolved = each.resolve_sessions(instance, ["role2"], 1)
+
+    assert resolved == {"role2": "No MFA token entered"}
+
+
+def test_each_json(monkeypatch, capsys, written):
+    """Test that results, exit codes and assume failures are collected"""
+
+    def request_session(cfg):
+        if cfg["session_name"].startswith("role1-"):
+            raise ClientError({"Error": {"Code": "AccessDenied"}}, "AssumeRole")
+        return mocks.MockBotoSession.MockBotoSessionClient.assume_role_response[
+            "Credentials"
+        ]
+
+    monkeypatch.setattr(written, "request_session", request_session)
+    command = [sys.executable, "-c", "import os; print(os.environ['AWSTEMP_ROLE'])"]
+
+    with pytest.raises(SystemExit) as exception:
+        each.each(written, ["valid", "expired", "role1"], command + ["x"], as_json=True)
+
+    assert exception.value.code == 1
+    results = json.loads(capsys.readouterr().out)
+    assert [(x["role"], x["exit_code"]) for x in results] == [
+        ("expired", 0),
+        ("role1", None),
+        ("valid", 0),
+    ]
+    assert results[0]["stdout"] == "expired\n"
+    assert "AccessDenied" in results[1]["error"]
+    credentials, _ = files.read_ini(written.credentials_path)
+    assert not written.is_expired("expired_temp")
+    assert credentials.get("expired_temp", "aws_session_token") == (
+        data.AWS_SESSION_TOKEN
+    )
+
+
+@patch("builtins.input", lambda prompt: "123456")
+def test_each_role_profiles_only(monkeypatch, capsys, written):
+    """Test that globs only select profiles that assume a role"""
+
+    written.config["profile dev"] = {"region": "eu-west-1"}
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+
+    each.each(written, ["*"], [sys.executable, "-c", "pass"])
+
+    assert capsys.readouterr().err == ""
+    assert written.role_profiles() == ["expired", "role1", "role2", "valid"]
+
+
+def test_resolve_sessions_config_error(instance):
+    """Test that a profile without a role is reported for that role only"""
+
+    instance.config["profile dev"] = {"region": "eu-west-1"}
+
+    resolved = each.resolve_sessions(instance, ["dev", "valid"], 2)
+
+    assert "No option 'role_arn'" in resolved["dev"]
+    assert resolved["valid"]["aws_session_token"] == data.AWS_SESSION_TOKEN
+
+
+def test_each_prefixed_failure(monkeypatch, capsys, written):
+    """Test that stderr and exit codes of failed commands are prefixed"""
+
+    monkeypatch.setattr(
+        written, "request_session", Mock(side_effect=NoCredentialsError())
+    )
+    command = [
+        sys.executable,
+        "-c",
+        "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)",
+    ]
+
+    with pytest.raises(SystemExit):
+        each.each(written, ["valid", "role1"], command)
+
+    output = capsys.readouterr()
+    assert output.out == "[valid] out\n"
+    assert output.err.splitlines() == [
+        "[valid] err",
+        "[valid] exit code 3",
+        "[role1] Unable to locate credentials",
+    ]
+
+
+@pytest.mark.parametrize(
+    "patterns,command,message",
+    [
+        (["nothing*"], ["true"], "No matching roles"),
+        (["role*"], ["--"], "No command given"),
+    ],
+)
+@patch("builtins.print")
+def test_each_nothing_to_run(mock_print, instance, patterns, command, message):
+    """Test that each needs matching roles and a command"""
+
+    with pytest.raises(SystemExit) as exception:
+        each.each(instance, patterns, command)
+
+    assert exception.value.code == 1
+    assert mock_print.call_args_list == [call(message)]
+
+
+def test_run_command_not_found():
+    """Test that a missing executable is reported like a shell would"""
+
+    session = dict.fromkeys(
+        ["aws_access_key_id", "aws_secret_access_key", "aws_session_token", "region"],
+        "x",
+    )
+    result = each.run_command("role1", ["/nonexistent/cmd"], session)
+
+    assert result["exit_code"] == 127
+    assert "/nonexistent/cmd" in result["stderr"]
@@ -0,0 +1,43 @@
+"""
+pytest module: awstemp/locks.py
+"""
+
+import fcntl
+import os
+
+import pytest
+
+from awstemp import locks
+
+
+def test_lock_read_write(tmp_path):
+    """Test that the locked file can be read and replaced"""
+
+    path = str(tmp_path / "state" / "file.lock")
+
+    with locks.FileLock(path) as lock:
+        assert lock.read() == b""
+        lock.write(b"first content")
+        lock.write(b"second")
+        assert lock.read() == b"second"
+
+    assert lock.fd is None
+    with open(path, "rb") as locked:
+        assert locked.read() == b"second"
+
+
+def test_lock_timeout(tmp_path):
+    """Test that a held lock times out other holders"""
+
+    path = str(tmp_path / "file.lock")
+    other = os.open(path, os.O_RDWR | os.O_CREAT)
+    fcntl.flock(other, fcntl.LOCK_EX)
+
+    with pytest.raises(locks.LockTimeout):
+        with locks.FileLock(path, timeout=0.1, poll=0.01):
+            pass  # pragma: no cover
+
+    fcntl.flock(other, fcntl.LOCK_UN)
+    with locks.FileLock(path, timeout=0.1) as lock:
+        assert lock.fd is not None
+    os.close(other)
@@ -0,0 +1,125 @@
+"""
+pytest module: awstemp/mfa.py
+"""
+
+import sys
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from awstemp import mfa
+from tests.helpers import data
+
+
+@patch("builtins.input", lambda prompt: " 123456\n")
+def test_prompt():
+    """Test that the entered token is returned"""
+
+    assert mfa.PromptProvider().token(data.MFA_SERIAL) == "123456"
+
+
+@patch("builtins.input", Mock(side_effect=EOFError))
+def test_prompt_no_input():
+    """Test that a closed stdin is an MFA error"""
+
+    with pytest.raises(mfa.MFAError, match="No MFA token entered"):
+        mfa.PromptProvider().token(data.MFA_SERIAL)
+
+
+def python(code):
+    """Command line running python code"""
+
+    return f"{sys.executable} -c {code!r}"
+
+
+def test_command():
+    """Test that the command gets the device and its token is returned"""
+
+    command = python("import os; print(os.environ['AWSTEMP_MFA_SERIAL'][-6:])")
+    serial = "arn:aws:iam::123456789012:mfa/000042"
+
+    assert mfa.CommandProvider(command).token(serial) == "000042"
+
+
+@pytest.mark.parametrize(
+    "command,message",
+    [
+        (python("import sys; sys.exit(2)"), "exit code 2"),
+        (python("print('touch')"), "printed no token"),
+        ("/nonexistent/token", "No such file"),
+        (python("import time; time.sleep(5)"), "timed out"),
+    ],
+    ids=["exit", "no-token", "missing", "timeout"],
+)
+def test_command_fails(command, message):
+    """Test that commands without a token are MFA errors"""
+
+    with pytest.raises(mfa.MFAError, match=message):
+        mfa.CommandProvider(command, timeout=0.5).token(data.MFA_SERIAL)
+
+
+def test_cached(monkeypatch, tmp_path):
+    """Test that a token is reused within its window only"""
+
+    source = Mock()
+    source.token.side_effect = ["111111", "222222"]
+    provider = mfa.CachedProvider(source, str(tmp_path))
+    monkeypatch.setattr(mfa.time, "time", Mock(return_value=60.0))
+
+    assert provider.token(data.MFA_SERIAL) == "111111"
+    assert provider.token(data.MFA_SERIAL) == "111111"
+
+    monkeypatch.setattr(mfa.time, "time", Mock(return_value=90.0))
+
+    assert provider.token(data.MFA_SERIAL) == "222222"
+    assert source.token.call_count == 2
+
+
+def test_cached_corrupt(tmp_path):
+    """Test that an unreadable cache asks the provider"""
+
+    (tmp_path / "mfa-serial.lock").write_text("{", encoding="utf-8")
+    source = Mock()
+    source.token.return_value = "123456"
+
+    assert mfa.CachedProvider(source, str(tmp_path)).token("serial") == "123456"
+
+
+def test_cached_concurrent(tmp_path):
+    """Test that concurrent assumes wait for one token"""
+
+    def slow(_):
+        time.sleep(0.2)
+        return "123456"
+
+    source = Mock()
+    source.token.side_effect = slow
+    provider = mfa.CachedProvider(source, str(tmp_path))
+    tokens = []
+    threads = [
+        threading.Thread(target=lambda: tokens.append(provider.token("serial")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["123456"] * 4
+    assert source.token.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "command,cache,expected",
+    [
+        (None, False, mfa.PromptProvider),
+        ("token", False, mfa.CommandProvider),
+        ("token", True, mfa.CachedProvider),
+    ],
+)
+def test_provider(command, cache, expected):
+    """Test that profiles choose their provider"""
+
+    assert isinstance(mfa.provider(command, cache, "/tmp"), expected)
@@ -0,0 +1,189 @@
+"""
+pytest module: awstemp/ratelimit.py
+"""
+
+import json
+import multiprocessing
+import time
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import (
+    ClientError,
+    EndpointConnectionError,
+    NoCredentialsError,
+    ReadTimeoutError,
+)
+
+from awstemp import ratelimit
+
+
+def error(code):
+    """Build a botocore ClientError"""
+    return ClientError({"Error": {"Code": code}}, "AssumeRole")
+
+
+@pytest.fixture(name="limiter")
+def fixture_limiter(monkeypatch, tmp_path):
+    """A limiter with a private state file and no backoff sleeps"""
+
+    monkeypatch.setattr(ratelimit.random, "uniform", lambda *_: 0)
+    yield ratelimit.RateLimiter(str(tmp_path / "ratelimit.json"), rate=40)
+
+
+def test_call_success(limiter):
+    """Test that successful calls are counted and raise the rate"""
+
+    method = Mock(return_value="response")
+
+    assert limiter.call(method, RoleArn="arn") == "response"
+    assert method.call_args_list[0][1] == {"RoleArn": "arn"}
+    assert limiter.metrics() == {
+        "rate": 40.5,
+        "observed_rate": round(1 / ratelimit.WINDOW, 2),
+        "calls": 1,
+        "throttles": 0,
+    }
+
+
+def test_call_throttled(limiter):
+    """Test that throttling halves the rate and retries"""
+
+    method = Mock(side_effect=[error("Throttling"), error("InternalFailure"), "ok"])
+
+    assert limiter.call(method) == "ok"
+
+    metrics = limiter.metrics()
+    assert metrics["throttles"] == 1
+    assert metrics["calls"] == 1
+    assert metrics["rate"] == 20.5
+
+
+def test_call_gives_up(limiter):
+    """Test that persistent throttling is raised after the retries"""
+
+    limiter.retries = 2
+    method = Mock(side_effect=error("Throttling"))
+
+    with pytest.raises(ClientError):
+        limiter.call(method)
+
+    assert method.call_count == 3
+    assert limiter.metrics()["throttles"] == 3
+
+
+def test_call_other_error(limiter):
+    """Test that non retryable errors are raised immediately"""
+
+    method = Mock(side_effect=error("AccessDenied"))
+
+    with pytest.raises(ClientError):
+        limiter.call(method)
+
+    assert method.call_count == 1
+
+
+def test_call_network_error(limiter):
+    """Test that connection failures and timeouts are retried without throttling"""
+
+    method = Mock(
+        side_effect=[
+            EndpointConnectionError(endpoint_url="https://sts"),
+            ReadTimeoutError(endpoint_url="https://sts"),
+            "ok",
+        ]
+    )
+
+    assert limiter.call(method) == "ok"
+    assert method.call_count == 3
+    assert limiter.metrics()["throttles"] == 0
+
+
+def test_call_network_error_gives_up(limiter):
+    """Test that persistent connection failures are raised after the retries"""
+
+    limiter.retries = 1
+    method = Mock(side_effect=EndpointConnectionError(endpoint_url="https://sts"))
+
+    with pytest.raises(EndpointConnectionError):
+        limiter.call(method)
+
+    assert method.call_count == 2
+
+
+def test_call_other_botocore_error(limiter):
+    """Test that botocore errors other than network failures are not retried"""
+
+    method = Mock(side_effect=NoCredentialsError())
+
+    with pytest.raises(NoCredentialsError):
+        limiter.call(method)
+
+    assert method.call_count == 1
+
+
+def test_observed_rate(monkeypatch, tmp_path):
+    """Test that the observed rate is not capped by the size of the window"""
+
+    clock = iter([*(1000 + x / 32 for x in range(2400)), 1074.99])
+    monkeypatch.setattr(ratelimit.time, "time", lambda: next(clock))
+    limiter = ratelimit.RateLimiter(str(tmp_path / "ratelimit.json"))
+
+    for _ in range(2400):
+        limiter.success()
+
+    # 32 calls per second over the last 60 seconds
+    assert limiter.metrics()["observed_rate"] == 32.0
+    state = json.loads((tmp_path / "ratelimit.json").read_text(encoding="utf-8"))
+    assert len(state["seconds"]) == ratelimit.WINDOW
+
+
+def test_acquire_waits(tmp_path):
+    """Test that an empty bucket delays the caller"""
+
+    limiter = ratelimit.RateLimiter(
+        str(tmp_path / "ratelimit.json"), rate=10, minimum=10, maximum=10
+    )
+
+    start = time.monotonic()
+    for _ in range(12):
+        limiter.acquire()
+
+    assert time.monotonic() - start >= 0.15
+
+
+def test_corrupt_state(tmp_path):
+    """Test that an unreadable state file is reset"""
+
+    path = tmp_path / "ratelimit.json"
+    path.write_text("corrupt", encoding="utf-8")
+
+    assert ratelimit.RateLimiter(str(path)).metrics()["calls"] == 0
+    assert json.loads(path.read_text(encoding="utf-8"))["rate"] == 10.0
+
+
+def acquire_many(path, count):
+    """Child process drawing from the shared bucket"""
+
+    limiter = ratelimit.RateLimiter(path, rate=20, minimum=20, maximum=20)
+    for _ in range(count):
+        limiter.acquire()
+
+
+def test_shared_between_processes(tmp_path):
+    """Test that separate processes draw from one budget"""
+
+    path = str(tmp_path / "ratelimit.json")
+    processes = [
+        multiprocessing.Process(target=acquire_many, args=(path, 12)) for _ in range(2)
+    ]
+
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # 24 tokens from a bucket of 20 refilled at 20 per second
+    assert time.monotonic() - start >= 0.15
+    assert all(x.exitcode == 0 for x in processes)
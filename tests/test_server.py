@@ -0,0 +1,342 @@
+"""
+pytest module: awstemp/server.py
+"""
+
+import os
+import socket
+import sys
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from awstemp import server, shim
+from awstemp.locks import FileLock
+
+
+@pytest.fixture(name="files")
+def fixture_files(fake_sts):
+    """
+    Fixture pointing the environment at real credentials and config files
+    """
+
+    yield fake_sts, os.environ["AWS_SHARED_CREDENTIALS_FILE"]
+
+
+@pytest.mark.parametrize(
+    "status,expected", [(3 << 8, 3), (9, 137)], ids=["exited", "signaled"]
+)
+def test_exit_code(status, expected):
+    """Test that wait statuses become shell exit codes"""
+
+    assert server.exit_code(status) == expected
+
+
+def test_install_fds(monkeypatch):
+    """Test that descriptors land on the caller's numbers and the rest close"""
+
+    monkeypatch.setattr(shim, "FORWARDED_FDS", (50, 51, 52))
+    first, second = os.pipe(), os.pipe()
+    os.dup2(first[1], 52)
+
+    server.install_fds([50, 51], [first[1], second[1]])
+    os.write(50, b"first")
+    os.write(51, b"second")
+
+    assert os.read(first[0], 16) == b"first"
+    assert os.read(second[0], 16) == b"second"
+    with pytest.raises(OSError):
+        os.fstat(52)
+    for fd in [50, 51, first[0], second[0]]:
+        os.close(fd)
+
+
+def test_reopen_streams(monkeypatch):
+    """Test that the standard streams are rebuilt, over /dev/null when closed"""
+
+    for name in ["stdin", "stdout", "stderr"]:
+        monkeypatch.setattr(sys, name, None)
+    fstat = os.fstat
+
+    def closed_stdin(fd):
+        if fd == 0:
+            raise OSError
+        return fstat(fd)
+
+    opened = []
+    devnull = os.open
+
+    def record(path, flags):
+        opened.append(path)
+        return devnull(path, flags)
+
+    monkeypatch.setattr(server.os, "fstat", closed_stdin)
+    monkeypatch.setattr(server.os, "open", record)
+
+    server.reopen_streams()
+
+    assert opened == [os.devnull]
+    assert sys.stdin.fileno() != 0
+    assert (sys.stdout.fileno(), sys.stderr.fileno()) == (1, 2)
+    assert sys.stderr.line_buffering
+    os.close(sys.stdin.fileno())
+
+
+@pytest.mark.parametrize(
+    "outcome,expected",
+    [
+        (None, (0, "")),
+        (SystemExit(2), (2, "")),
+        (SystemExit(None), (0, "")),
+        (SystemExit("failed"), (1, "failed")),
+        (KeyboardInterrupt(), (130, "")),
+        (RuntimeError("broken"), (1, "RuntimeError: broken")),
+    ],
+    ids=["ok", "exit", "exit-none", "exit-message", "interrupted", "raised"],
+)
+def test_run_request(instance, monkeypatch, capsys, outcome, expected):
+    """Test that a call runs with the caller's state and reports its exit code"""
+
+    install_fds = Mock()
+    monkeypatch.setattr(server, "install_fds", install_fds)
+    monkeypatch.setattr(server, "reopen_streams", Mock())
+    monkeypatch.setattr(os, "environ", dict(os.environ))
+    monkeypatch.setattr(sys, "argv", list(sys.argv))
+    monkeypatch.chdir(os.getcwd())
+    seen = {}
+
+    def main(cli):
+        seen.update(cli=cli, env=dict(os.environ), cwd=os.getcwd(), argv=sys.argv)
+        if outcome is not None:
+            raise outcome
+
+    monkeypatch.setattr(server.cli, "main", main)
+    request = {
+        "argv": ["awstemp", "list"],
+        "env": {"AWSTEMP_TEST": "1"},
+        "cwd": "/",
+        "fds": [1],
+    }
+
+    assert server.run_request(request, [99], instance) == expected[0]
+    assert expected[1] in capsys.readouterr().err
+    assert install_fds.call_args[0] == ([1], [99])
+    assert seen == {
+        "cli": instance,
+        "env": {"AWSTEMP_TEST": "1"},
+        "cwd": "/",
+        "argv": ["awstemp", "list"],
+    }
+
+
+def test_server_idle(monkeypatch):
+    """Test that the idle timeout comes from the environment by default"""
+
+    monkeypatch.setenv("AWSTEMP_SERVER_IDLE", "30")
+
+    assert server.Server().idle == 30.0
+    assert server.Server(idle=5).idle == 5
+
+
+@pytest.mark.usefixtures("files")
+def test_instance_reloads():
+    """Test that the loaded state is reused until its files change"""
+
+    config = os.environ["AWS_CONFIG_FILE"]
+    with open(config, "a", encoding="utf-8") as config_file:
+        config_file.write("[profile role3]\nrole_arn = arn\nsource_profile = none\n")
+    env = dict(os.environ)
+    resident = server.Server("unused")
+
+    first = resident.instance(env)
+    assert resident.instance(env) is first
+    assert os.environ == env
+    assert [x[0] for x in server.awstemp.CLIENTS] == ["default"]
+
+    with open(config, "a", encoding="utf-8") as config_file:
+        config_file.write("[profile added]\n")
+    second = resident.instance(env)
+
+    assert second is not first
+    assert second.config.has_section("profile added")
+
+
+def test_supervise(monkeypatch):
+    """Test that the call's pid and then its exit code are sent back"""
+
+    monkeypatch.setattr(server.os, "fork", Mock(return_value=4242))
+    monkeypatch.setattr(server.os, "waitpid", Mock(return_value=(4242, 3 << 8)))
+    os_exit = Mock(side_effect=SystemExit)
+    monkeypatch.setattr(server.os, "_exit", os_exit)
+    read_fd, write_fd = os.pipe()
+    left, right = socket.socketpair()
+
+    with left, right:
+        with pytest.raises(SystemExit):
+            server.Server.supervise(left, {}, [write_fd], None)
+        replies = shim.recv_exact(right, 2 * shim.CODE.size)
+
+    assert [shim.CODE.unpack_from(replies, x)[0] for x in (0, 4)] == [4242, 3]
+    assert os_exit.call_args[0] == (0,)
+    assert os.read(read_fd, 1) == b""
+    os.close(read_fd)
+
+
+def test_supervise_child(monkeypatch):
+    """Test that the further fork runs the call and exits with its code"""
+
+    monkeypatch.setattr(server.os, "fork", Mock(return_value=0))
+    run_request = Mock(return_value=5)
+    os_exit = Mock(side_effect=SystemExit)
+    monkeypatch.setattr(server, "run_request", run_request)
+    monkeypatch.setattr(server.os, "_exit", os_exit)
+    conn = Mock()
+
+    with pytest.raises(SystemExit):
+        server.Server.supervise(conn, {"argv": []}, [], "instance")
+
+    assert run_request.call_args[0] == ({"argv": []}, [], "instance")
+    assert [x[0] for x in os_exit.call_args_list] == [(5,), (0,)]
+    assert conn.close.called
+
+
+def call(resident, request, fds):
+    """Send a request to Server.handle over a socket pair"""
+
+    left, right = socket.socketpair()
+    with left, right:
+        shim.send_request(left, request, fds)
+        resident.handle(right)
+
+
+@pytest.mark.usefixtures("files")
+@pytest.mark.parametrize("pid", [4242, 0], ids=["server", "fork"])
+def test_handle(monkeypatch, pid):
+    """Test that a call is handed to a fork and its descriptors closed"""
+
+    supervise = Mock()
+    monkeypatch.setattr(server.os, "fork", Mock(return_value=pid))
+    monkeypatch.setattr(server.Server, "supervise", supervise)
+    resident = server.Server("unused")
+    read_fd, write_fd = os.pipe()
+
+    call(resident, {"env": dict(os.environ)}, [write_fd])
+    os.close(write_fd)
+
+    assert os.read(read_fd, 1) == b""
+    os.close(read_fd)
+    assert resident.children == ({4242} if pid else {0})
+    assert supervise.called == (not pid)
+
+
+@pytest.mark.parametrize("broken_config", [True, False], ids=["config", "env"])
+def test_handle_refused(tmp_path, broken_config):
+    """Test that calls failing to set up are refused and the server carries on"""
+
+    config = tmp_path / "config"
+    config.write_text("[broken\n", encoding="utf-8")
+    request_env = {"AWS_CONFIG_FILE": str(config)} if broken_config else None
+    resident = server.Server("unused")
+    read_fd, write_fd = os.pipe()
+    left, right = socket.socketpair()
+    with left, right:
+        shim.send_request(left, {"env": request_env}, [write_fd])
+        resident.handle(right)
+        reply = shim.recv_exact(left, shim.CODE.size)
+    os.close(write_fd)
+
+    assert shim.CODE.unpack(reply)[0] == shim.REFUSED
+    assert os.read(read_fd, 1) == b""
+    os.close(read_fd)
+    assert not resident.children
+
+
+def test_handle_other_user(monkeypatch):
+    """Test that calls from other users are refused"""
+
+    monkeypatch.setattr(server.os, "getuid", Mock(return_value=-1))
+    instance = Mock()
+    monkeypatch.setattr(server.Server, "instance", instance)
+
+    call(server.Server("unused"), {"env": {}}, [])
+
+    assert not instance.called
+
+
+def test_handle_bad_request(monkeypatch):
+    """Test that malformed requests are dropped"""
+
+    instance = Mock()
+    monkeypatch.setattr(server.Server, "instance", instance)
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(shim.HEADER.pack(3) + b"{{{")
+        server.Server("unused").handle(right)
+
+    assert not instance.called
+
+
+def test_reap(monkeypatch):
+    """Test that finished calls are collected"""
+
+    monkeypatch.setattr(
+        server.os, "waitpid", Mock(side_effect=lambda pid, _: (pid % 2 * pid, 0))
+    )
+    resident = server.Server("unused")
+    resident.children = {1, 2}
+
+    assert resident.reap()
+    assert resident.children == {2}
+
+
+def test_serve_already_running(tmp_path):
+    """Test that a second server leaves the running one alone"""
+
+    path = str(tmp_path / "s.sock")
+    with FileLock(f"{path}.lock"):
+        server.Server(path, idle=0.1).serve()
+
+    assert not os.path.exists(path)
+
+
+def test_serve_waits_for_calls(monkeypatch, tmp_path):
+    """Test that the idle time only starts once running calls have finished"""
+
+    reap = Mock(side_effect=[True, True, False, False, False, False])
+    monkeypatch.setattr(server, "POLL", 0.05)
+    monkeypatch.setattr(server.Server, "reap", reap)
+
+    server.Server(str(tmp_path / "s.sock"), idle=0.1).serve()
+
+    assert reap.call_count >= 4
+
+
+def test_serve(files, monkeypatch, tmp_path, capfd):
+    """Test forwarded calls end to end, picking up file changes, until idle"""
+
+    _, credentials = files
+    path = str(tmp_path / "s.sock")
+    monkeypatch.setattr(server, "POLL", 0.2)
+    codes = []
+
+    def calls():
+        while not codes or codes[0] is None:
+            codes[:] = [shim.forward(["awstemp", "list"], path)]
+        with open(credentials, "a", encoding="utf-8") as credentials_file:
+            credentials_file.write("[added]\n")
+        codes.append(shim.forward(["awstemp", "list"], path))
+        codes.append(shim.forward(["awstemp", "assume", "nonexistent"], path))
+
+    thread = threading.Thread(target=calls)
+    thread.start()
+    server.Server(path, idle=0.5).serve()
+    thread.join()
+
+    lines = capfd.readouterr().out.splitlines()
+    assert codes == [0, 0, 1]
+    assert [x for x in lines if x in ["default", "added"]] == [
+        "default",
+        "added",
+        "default",
+    ]
+    assert not os.path.exists(path)
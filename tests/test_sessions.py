@@ -0,0 +1,157 @@
+"""
+pytest module: awstemp/sessions.py
+"""
+
+import datetime
+import json
+from unittest.mock import call, patch
+
+import pytest
+
+from awstemp import sessions
+from tests.helpers import data, files
+
+
+@pytest.mark.parametrize(
+    "role,session",
+    [
+        (None, False),
+        ("default", False),
+        ("valid_temp", True),
+    ],
+    ids=[
+        "None",
+        "default",
+        "temporary credentials with session token",
+    ],
+)
+@patch("builtins.print")
+def test_export(mock_print, instance, role, session):
+    """Test export method for existing credentials"""
+    sessions.export(instance, role)
+
+    if role is None:
+        role = "default"
+
+    expected = [
+        call(f"Profile: {role}"),
+        call(f"export AWS_ACCESS_KEY_ID={data.AWS_ACCESS_KEY_ID}"),
+        call(f"export AWS_SECRET_ACCESS_KEY={data.AWS_SECRET_ACCESS_KEY}"),
+    ]
+
+    if session:
+        expected.append(call(f"export AWS_SESSION_TOKEN={data.AWS_SESSION_TOKEN}"))
+
+    assert mock_print.call_args_list == expected
+
+
+@patch("builtins.print")
+def test_export_unknown(mock_print, instance):
+    """Test export method for unknown credentials"""
+
+    role = "unknown"
+
+    with pytest.raises(SystemExit) as exception:
+        sessions.export(instance, role)
+
+    assert exception.value.code == 1
+    assert mock_print.call_args_list == [call(f"Profile not found: {role}")]
+
+
+@patch("builtins.print")
+def test_sessions(mock_print, instance):
+    """Test sessions command lists expiry status of all temporary credentials"""
+    sessions.sessions(instance)
+
+    assert mock_print.call_args_list == [
+        call("expired_temp (expired)"),
+        call("valid_temp (59 minutes)"),
+    ]
+
+
+@patch("builtins.print")
+@patch("awstemp.sessions.Watcher")
+def test_sessions_watch(mock_watcher, mock_print, instance):
+    """Test sessions --watch redraws on change and stops on interrupt"""
+
+    mock_watcher.return_value.wait.side_effect = [False, True, KeyboardInterrupt]
+    instance.load_credentials = lambda: instance.credentials.remove_section(
+        "expired_temp"
+    )
+
+    sessions.sessions(instance, watch=True)
+
+    assert mock_print.call_args_list == [
+        call("\033[H\033[Jexpired_temp (expired)\nvalid_temp (59 minutes)", flush=True),
+        call("\033[H\033[Jexpired_temp (expired)\nvalid_temp (59 minutes)", flush=True),
+        call("\033[H\033[Jvalid_temp (59 minutes)", flush=True),
+    ]
+    assert mock_watcher.return_value.close.call_args_list == [call()]
+
+
+@pytest.mark.parametrize(
+    "remaining,expected",
+    [([], 60.05), ([-30], 60.05), ([90.5], 30.55), ([120, 61], 1.05)],
+    ids=["no sessions", "expired", "one session", "earliest boundary"],
+)
+def test_next_tick(remaining, expected):
+    """Test that redraws are scheduled for the next minute boundary"""
+
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    expiries = {
+        str(i): now + datetime.timedelta(seconds=x) for i, x in enumerate(remaining)
+    }
+
+    assert sessions.next_tick(expiries, now) == pytest.approx(expected)
+
+
+@patch("builtins.print")
+def test_list(mock_print, instance):
+    """Test list command lists credentials"""
+    sessions.list_profiles(instance)
+
+    assert mock_print.call_args_list == [
+        call("default"),
+        call("expired_temp (expired)"),
+        call("role1"),
+        call("role2"),
+        call("valid_temp (59 minutes)"),
+    ]
+
+
+@patch("builtins.print")
+def test_credential_process(mock_print, instance):
+    """Test that a valid session is printed as credential_process JSON"""
+
+    sessions.credential_process(instance, "valid_temp")
+
+    output = json.loads(mock_print.call_args_list[0][0][0])
+    assert output["Version"] == 1
+    assert output["AccessKeyId"] == data.AWS_ACCESS_KEY_ID
+    assert output["SecretAccessKey"] == data.AWS_SECRET_ACCESS_KEY
+    assert output["SessionToken"] == data.AWS_SESSION_TOKEN
+    assert output["Expiration"] == instance.credentials.get(
+        "valid_temp", "aws_expiration"
+    )
+
+
+@patch("builtins.print")
+def test_credential_process_refreshed(mock_print, written):
+    """Test that credential_process waits for and reads a refreshed session"""
+
+    thread = files.hold_session_lock("other_temp", 0.2, written.credentials_path)
+
+    sessions.credential_process(written, "other_temp")
+
+    assert json.loads(mock_print.call_args_list[-1][0][0])["AccessKeyId"] == "OTHER"
+    thread.join()
+
+
+@pytest.mark.parametrize("profile", ["expired_temp", "default", "unknown"])
+def test_credential_process_invalid(instance, profile):
+    """Test that expired, static or unknown profiles are refused"""
+
+    with pytest.raises(SystemExit) as exception:
+        sessions.credential_process(instance, profile)
+
+    assert exception.value.code == 1
@@ -0,0 +1,213 @@
+"""
+pytest module: awstemp/shim.py
+"""
+
+import os
+import socket
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from awstemp import shim
+
+
+def test_socket_path(monkeypatch, tmp_path):
+    """Test that the socket lives in the state directory unless overridden"""
+
+    assert shim.socket_path() == str(tmp_path / "state" / "server.sock")
+
+    monkeypatch.setenv("AWSTEMP_SERVER_SOCKET", "/run/awstemp.sock")
+
+    assert shim.socket_path() == "/run/awstemp.sock"
+
+
+def test_request_round_trip():
+    """Test that a request and its descriptors arrive intact"""
+
+    left, right = socket.socketpair()
+    read_fd, write_fd = os.pipe()
+    with left, right:
+        shim.send_request(left, {"argv": ["awstemp", "list"]}, [write_fd])
+        request, fds = shim.receive_request(right)
+
+    os.close(write_fd)
+    os.write(fds[0], b"through")
+    os.close(fds[0])
+
+    assert request == {"argv": ["awstemp", "list"]}
+    assert os.read(read_fd, 16) == b"through"
+    os.close(read_fd)
+
+
+def test_recv_exact_closed():
+    """Test that a connection closed early is an error"""
+
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(b"ab")
+        left.close()
+        with pytest.raises(ConnectionError):
+            shim.recv_exact(right, 4)
+
+
+def test_open_fds(monkeypatch):
+    """Test that only open descriptors are forwarded"""
+
+    monkeypatch.setattr(shim, "FORWARDED_FDS", (0, 1, 2, 987))
+
+    assert shim.open_fds() == [0, 1, 2]
+
+
+def test_forward_no_server(tmp_path):
+    """Test that forwarding without a server returns None"""
+
+    assert shim.forward(["awstemp"], str(tmp_path / "missing.sock")) is None
+
+
+def fake_server(path, replies):
+    """Accept one call, send the replies and return the received request"""
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+    received = {}
+
+    def serve():
+        conn, _ = listener.accept()
+        with conn, listener:
+            received["request"], fds = shim.receive_request(conn)
+            for fd in fds:
+                os.close(fd)
+            for reply in replies:
+                conn.sendall(shim.CODE.pack(reply))
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    return thread, received
+
+
+def test_forward(tmp_path, monkeypatch):
+    """Test that the call, environment and directory are sent and the code returned"""
+
+    monkeypatch.setenv("AWSTEMP_TEST", "1")
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "s.sock")
+    thread, received = fake_server(path, [4242, 3])
+
+    assert shim.forward(["awstemp", "list"], path) == 3
+    thread.join()
+
+    request = received["request"]
+    assert request["argv"] == ["awstemp", "list"]
+    assert request["env"]["AWSTEMP_TEST"] == "1"
+    assert request["cwd"] == str(tmp_path)
+    assert request["fds"] == shim.open_fds()
+
+
+def test_forward_refused(tmp_path):
+    """Test that a refused call is reported without waiting for an exit code"""
+
+    path = str(tmp_path / "s.sock")
+    thread, _ = fake_server(path, [shim.REFUSED])
+
+    assert shim.forward(["awstemp"], path) == shim.REFUSED
+    thread.join()
+
+
+def test_forward_interrupted(tmp_path, monkeypatch):
+    """Test that Ctrl-C is passed on to the command"""
+
+    path = str(tmp_path / "s.sock")
+    thread, _ = fake_server(path, [4242, 130])
+    recv_exact = shim.recv_exact
+    calls = []
+
+    def interrupted(sock, size):
+        if threading.current_thread() is threading.main_thread():
+            calls.append(size)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+        return recv_exact(sock, size)
+
+    kill = Mock()
+    monkeypatch.setattr(shim, "recv_exact", interrupted)
+    monkeypatch.setattr(shim.os, "kill", kill)
+
+    assert shim.forward(["awstemp"], path) == 130
+    thread.join()
+    assert kill.call_args[0] == (4242, shim.signal.SIGINT)
+
+
+def test_forward_lost(tmp_path, capsys):
+    """Test that a server going away mid call fails the call"""
+
+    path = str(tmp_path / "s.sock")
+    thread, _ = fake_server(path, [4242])
+
+    assert shim.forward(["awstemp"], path) == 1
+    thread.join()
+    assert "awstemp server:" in capsys.readouterr().err
+
+
+def test_start_server(monkeypatch):
+    """Test that the server is started detached from the caller"""
+
+    popen = Mock()
+    monkeypatch.setattr(shim.subprocess, "Popen", popen)
+
+    shim.start_server()
+
+    assert "server.Server().serve()" in popen.call_args[0][0][-1]
+    assert popen.call_args[1]["start_new_session"]
+
+
+@pytest.mark.parametrize(
+    "env,argv,codes,expected",
+    [
+        (None, ["awstemp", "list"], [], "local"),
+        ("0", ["awstemp", "list"], [], "local"),
+        ("1", ["awstemp", "list"], [3], 3),
+        ("1", ["awstemp", "list"], [shim.REFUSED], "local"),
+        ("1", ["awstemp", "list"], [None, None, 0], 0),
+    ],
+    ids=["unset", "disabled", "forwarded", "refused", "started"],
+)
+def test_main(monkeypatch, env, argv, codes, expected):
+    """Test when calls are forwarded and when they run locally"""
+
+    if env is None:
+        monkeypatch.delenv("AWSTEMP_SERVER", raising=False)
+    else:
+        monkeypatch.setenv("AWSTEMP_SERVER", env)
+    monkeypatch.setattr(shim.sys, "argv", argv)
+    start_server = Mock()
+    monkeypatch.setattr(shim, "forward", Mock(side_effect=codes))
+    monkeypatch.setattr(shim, "start_server", start_server)
+    local = Mock()
+    monkeypatch.setattr("awstemp.cli.main", local)
+
+    if expected == "local":
+        shim.main()
+        assert local.call_count == 1
+        assert not start_server.called
+    else:
+        with pytest.raises(SystemExit) as exception:
+            shim.main()
+        assert exception.value.code == expected
+        assert start_server.call_count == (len(codes) > 1)
+
+
+def test_main_start_fails(monkeypatch):
+    """Test that the call runs locally when no server comes up"""
+
+    monkeypatch.setenv("AWSTEMP_SERVER", "1")
+    monkeypatch.setattr(shim, "START_TIMEOUT", 0.1)
+    monkeypatch.setattr(shim, "forward", Mock(return_value=None))
+    monkeypatch.setattr(shim, "start_server", Mock())
+    local = Mock()
+    monkeypatch.setattr("awstemp.cli.main", local)
+
+    shim.main()
+
+    assert local.call_count == 1
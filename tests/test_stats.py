@@ -0,0 +1,71 @@
+"""
+pytest module: awstemp/stats.py
+"""
+
+import json
+from unittest.mock import call, patch
+
+import pytest
+
+from awstemp import stats
+
+
+@pytest.mark.parametrize("as_json", [False, True])
+@patch("builtins.print")
+def test_ratelimit(mock_print, as_json):
+    """Test that the rate limiter metrics are printed"""
+
+    stats.ratelimit(as_json)
+
+    if as_json:
+        assert json.loads(mock_print.call_args_list[0][0][0])["calls"] == 0
+    else:
+        assert mock_print.call_args_list == [
+            call("rate: 10.0"),
+            call("observed_rate: 0.0"),
+            call("calls: 0"),
+            call("throttles: 0"),
+        ]
+
+
+@pytest.mark.parametrize("as_json", [False, True])
+@patch("builtins.print")
+def test_stats(mock_print, instance, as_json):
+    """Test that the usage report is printed as a table or JSON"""
+
+    for cache in ["miss", "hit", "hit"]:
+        with instance.usage.timer("sts" if cache == "miss" else "io"):
+            pass
+        instance.usage.record("assume", "role1", cache)
+
+    stats.stats(instance, as_json)
+
+    if as_json:
+        report = json.loads(mock_print.call_args_list[-1][0][0])
+        assert report["sts"] == {"made": 1, "avoided": 2}
+        assert [x["name"] for x in report["latencies"]] == [
+            "assume",
+            "io",
+            "sts",
+            "role1",
+        ]
+    else:
+        lines = [x[0][0] for x in mock_print.call_args_list[-6:]]
+        assert lines[0].split() == ["KIND", "NAME", "COUNT", "P50", "P95", "P99"]
+        assert lines[1].split()[:3] == ["command", "assume", "3"]
+        assert lines[2].split()[:3] == ["phase", "io", "3"]
+        assert lines[3].split()[:3] == ["phase", "sts", "3"]
+        assert lines[4].split()[:3] == ["role", "role1", "3"]
+        assert lines[5] == "STS calls made: 1, avoided: 2"
+
+
+@patch("builtins.print")
+def test_stats_empty(mock_print, instance):
+    """Test that an empty usage log prints only the headers"""
+
+    stats.stats(instance)
+
+    assert mock_print.call_args_list[-2:] == [
+        call("KIND  NAME  COUNT  P50  P95  P99"),
+        call("STS calls made: 0, avoided: 0"),
+    ]
@@ -0,0 +1,53 @@
+"""
+pytest module: concurrent awstemp processes sharing the credential files
+"""
+
+import pytest
+
+from tests.helpers import stress
+
+
+@pytest.mark.parametrize("sharded", [False, True], ids=["single-file", "sharded"])
+def test_concurrent_processes(tmp_path, sharded):
+    """Test that mixed concurrent commands lose and corrupt nothing"""
+
+    report = stress.run(
+        processes=4, operations=12, roles=3, sharded=sharded, directory=str(tmp_path)
+    )
+
+    assert not report["errors"]
+    assert not report["problems"]
+    assert report["sessions"] == report["sts_calls"]
+    assert report["ops_per_second"] > 0
+
+
+@pytest.mark.parametrize("sharded", [False, True], ids=["single-file", "sharded"])
+def test_simultaneous_assumes(tmp_path, sharded):
+    """Test that processes assuming one role at once share a single STS call"""
+
+    results, sts_calls = stress.contend(
+        processes=3, sharded=sharded, directory=str(tmp_path)
+    )
+
+    assert results == ["created", "skipping", "skipping"]
+    assert sts_calls == 1
+
+
+def test_check_detects_damage(tmp_path):
+    """Test that the integrity check reports lost and duplicated content"""
+
+    env = stress.prepare(str(tmp_path), 2, sharded=True)
+    with open(env["AWS_CONFIG_FILE"], "a", encoding="utf-8") as config_file:
+        config_file.write(stress.awstemp.AWSTEMP.vimsyntax)
+    with open(env["AWS_SHARED_CREDENTIALS_FILE"], "a", encoding="utf-8") as ini_file:
+        ini_file.write("[default]\n")
+
+    problems = stress.check(env, 3, ["w0_role0_temp"])
+
+    assert problems[0].startswith(f"{env['AWS_SHARED_CREDENTIALS_FILE']}: ")
+    assert problems[1:] == [
+        f"{env['AWS_CONFIG_FILE']}: 2 vim modelines",
+        "lost session w0_role0_temp: " + ", ".join(stress.SESSION_KEYS),
+        "lost config profile: w0_role0_temp",
+        "lost role profile: role2",
+    ]
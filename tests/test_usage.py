@@ -0,0 +1,153 @@
+"""
+pytest module: awstemp/usage.py
+"""
+
+import json
+
+import pytest
+
+from awstemp import usage
+
+
+@pytest.fixture(name="log")
+def fixture_log(tmp_path):
+    """A usage recorder writing below a missing state directory"""
+
+    yield usage.Usage(str(tmp_path / "state" / "usage.jsonl"))
+
+
+def test_record(log):
+    """Test that phases and the total are appended as one JSON line"""
+
+    with log.timer("sts"):
+        pass
+    with log.timer("sts"):
+        pass
+    log.record("assume", "role1", "miss")
+    log.record("status", "role1")
+
+    records = usage.read(log.path)
+    assert [x["command"] for x in records] == ["assume", "status"]
+    assert records[0]["role"] == "role1"
+    assert records[0]["cache"] == "miss"
+    assert 0 <= records[0]["sts"] <= records[0]["total"]
+    assert "sts" in records[1]
+
+
+def test_record_rotates(monkeypatch, log):
+    """Test that a full log is moved aside and a new one started"""
+
+    monkeypatch.setattr(usage, "MAX_BYTES", 1)
+    log.record("export")
+    log.record("status")
+    log.record("clean")
+
+    with open(f"{log.path}.1", encoding="utf-8") as rotated:
+        assert [json.loads(x)["command"] for x in rotated] == ["export", "status"]
+    assert [x["command"] for x in usage.read(log.path)] == [
+        "export",
+        "status",
+        "clean",
+    ]
+
+
+def test_record_unwritable(tmp_path):
+    """Test that failing to write the log never fails the command"""
+
+    (tmp_path / "state").write_text("", encoding="utf-8")
+    usage.Usage(str(tmp_path / "state" / "usage.jsonl")).record("export")
+
+
+def test_read_corrupt(log):
+    """Test that missing logs and unparsable lines are skipped"""
+
+    assert not usage.read(log.path)
+
+    log.record("export")
+    with open(log.path, "a", encoding="utf-8") as log_file:
+        log_file.write("{truncated\n1\n{}\n[]\n")
+        log_file.write('{"command": "export"}\n{"total": 1.0}\n')
+
+    assert len(usage.read(log.path)) == 1
+    assert usage.report(usage.read(log.path))["sts"] == {"made": 0, "avoided": 0}
+
+
+def test_percentile():
+    """Test nearest rank percentiles"""
+
+    values = list(range(1, 101))
+    assert usage.percentile(values, 50) == 50
+    assert usage.percentile(values, 99) == 99
+    assert usage.percentile([7], 95) == 7
+
+
+def test_report():
+    """Test grouping per subcommand, phase and role, and the STS counters"""
+
+    records = [
+        {
+            "command": "assume",
+            "role": "prod",
+            "cache": "miss",
+            "total": 900.0,
+            "sts": 800.0,
+            "io": 2.0,
+        },
+        {"command": "assume", "role": "prod", "cache": "hit", "total": 10.0, "io": 4.0},
+        {"command": "assume", "role": "dev", "cache": "hit", "total": 20.0},
+        {"command": "clean", "role": None, "cache": None, "total": 5.0},
+    ]
+
+    assert usage.report(records) == {
+        "latencies": [
+            {
+                "kind": "command",
+                "name": "assume",
+                "count": 3,
+                "p50": 20.0,
+                "p95": 900.0,
+                "p99": 900.0,
+            },
+            {
+                "kind": "command",
+                "name": "clean",
+                "count": 1,
+                "p50": 5.0,
+                "p95": 5.0,
+                "p99": 5.0,
+            },
+            {
+                "kind": "phase",
+                "name": "io",
+                "count": 2,
+                "p50": 2.0,
+                "p95": 4.0,
+                "p99": 4.0,
+            },
+            {
+                "kind": "phase",
+                "name": "sts",
+                "count": 1,
+                "p50": 800.0,
+                "p95": 800.0,
+                "p99": 800.0,
+            },
+            {
+                "kind": "role",
+                "name": "dev",
+                "count": 1,
+                "p50": 20.0,
+                "p95": 20.0,
+                "p99": 20.0,
+            },
+            {
+                "kind": "role",
+                "name": "prod",
+                "count": 2,
+                "p50": 10.0,
+                "p95": 900.0,
+                "p99": 900.0,
+            },
+        ],
+        "sts": {"made": 1, "avoided": 2},
+    }
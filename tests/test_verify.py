@@ -0,0 +1,169 @@
+"""
+pytest module: awstemp/verify.py
+"""
+
+import json
+import os
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from botocore.exceptions import ClientError, NoCredentialsError
+
+from awstemp import awstemp, verify
+from tests.helpers import data, fakests, mocks
+
+ENCODING = "utf-8"
+
+
+@patch("builtins.print")
+def test_verify(mock_print, monkeypatch, instance):
+    """Test that profiles are verified and successful results cached"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+
+    verify.verify(instance, ["default", "valid_temp"])
+
+    lines = [x[0][0] for x in mock_print.call_args_list][-3:]
+    assert lines[0].split() == ["PROFILE", "STATUS", "ACCOUNT", "ARN", "LATENCY"]
+    assert lines[1].split()[:4] == ["default", "ok", data.ACCOUNT, data.ROLE_ARN]
+    assert lines[2].split()[:4] == ["valid_temp", "ok", data.ACCOUNT, data.ROLE_ARN]
+
+    with open(f"{awstemp.state_path()}/verify.json", encoding=ENCODING) as cache_file:
+        cache = json.load(cache_file)
+    assert sorted(cache) == ["default", "valid_temp"]
+    assert cache["default"]["key"] == data.AWS_ACCESS_KEY_ID
+
+
+@patch("builtins.print")
+def test_verify_cached(mock_print, monkeypatch, instance):
+    """Test that cached results are reused without calling STS"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    verify.verify(instance, ["default"], as_json=True)
+    mock_print.reset_mock()
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", None))
+    verify.verify(instance, ["default"], as_json=True)
+
+    output = json.loads(mock_print.call_args_list[-1][0][0])
+    assert output[0]["status"] == "ok"
+    assert output[0]["cached"] is True
+
+
+@patch("builtins.print")
+def test_verify_cache_invalidated(mock_print, monkeypatch, instance):
+    """Test that rotated keys and expired cache entries are verified again"""
+
+    monkeypatch.setattr(*mocks.mock("boto3.Session", mocks.MockBotoSession()))
+    verify.verify(instance, ["default", "valid_temp"], cache_ttl=60)
+    instance.credentials.set("default", "aws_access_key_id", "ROTATED")
+    mock_print.reset_mock()
+
+    verify.verify(instance, ["default", "valid_temp"], cache_ttl=0, as_json=True)
+
+    output = json.loads(mock_print.call_args_list[-1][0][0])
+    assert [x["cached"] for x in output] == [False, False]
+
+
+@pytest.mark.parametrize(
+    "error,status",
+    [
+        (
+            ClientError({"Error": {"Code": "ExpiredToken"}}, "GetCallerIdentity"),
+            "ExpiredToken",
+        ),
+        (NoCredentialsError(), "NoCredentialsError"),
+    ],
+)
+@patch("builtins.print")
+def test_verify_failed(mock_print, monkeypatch, instance, error, status):
+    """Test that failures are reported, not cached, and exit non-zero"""
+
+    session = Mock()
+    session.client.return_value.get_caller_identity.side_effect = error
+    monkeypatch.setattr(*mocks.mock("boto3.Session", session))
+    monkeypatch.setenv("AWS_PROFILE", "role1")
+
+    os.makedirs(awstemp.state_path())
+    with open(f"{awstemp.state_path()}/verify.json", "w", encoding=ENCODING) as cache:
+        cache.write("corrupt")
+
+    with pytest.raises(SystemExit) as exception:
+        verify.verify(instance)
+
+    assert exception.value.code == 1
+    assert mock_print.call_args_list[-1][0][0].split() == [
+        "role1",
+        status,
+        "-",
+        "-",
+        "-",
+    ]
+    with open(f"{awstemp.state_path()}/verify.json", encoding=ENCODING) as cache:
+        assert json.load(cache) == {}
+
+
+@patch("builtins.print")
+def test_verify_expired(mock_print, instance):
+    """Test that expired sessions are reported without calling STS"""
+
+    with pytest.raises(SystemExit) as exception:
+        verify.verify(instance, ["expired_temp"], as_json=True)
+
+    assert exception.value.code == 1
+    assert json.loads(mock_print.call_args_list[0][0][0]) == [
+        {
+            "profile": "expired_temp",
+            "account": None,
+            "arn": None,
+            "cached": False,
+            "status": "expired",
+            "latency": 0.0,
+        }
+    ]
+
+
+def test_verify_fake_sts_concurrent(fake_sts):
+    """Test that slow STS calls are verified concurrently"""
+
+    fake_sts.fake.delay = fakests.latency("fixed:0.2")
+    cli = awstemp.AWSTEMP()
+    for index in range(8):
+        cli.credentials[f"static{index}"] = dict(cli.credentials.items("default"))
+
+    start = time.monotonic()
+    results = verify.caller_identities(cli, cli.credentials.sections(), 8)
+
+    assert time.monotonic() - start < 1.0
+    assert all(x["status"] == "ok" for x in results)
+    assert fake_sts.fake.peak > 1
+    assert not os.path.exists(awstemp.sts_limiter().path)
+
+
+def test_verify_fake_sts_revoked(fake_sts):
+    """Test that revoked credentials are reported by their error code"""
+
+    fake_sts.fake.revoked.add(data.AWS_ACCESS_KEY_ID)
+    cli = awstemp.AWSTEMP()
+
+    results = verify.caller_identities(cli, ["default"], 1)
+
+    assert results[0]["status"] == "InvalidClientTokenId"
+
+
+def test_verify_fake_sts_throttled(monkeypatch, fake_sts):
+    """Test that throttled STS calls are retried and recorded host wide"""
+
+    monkeypatch.setattr("awstemp.ratelimit.random.uniform", lambda *_: 0)
+    fake_sts.fake.max_rps = 5
+    fake_sts.fake.tokens = 5
+    cli = awstemp.AWSTEMP()
+    for index in range(10):
+        cli.credentials[f"static{index}"] = dict(cli.credentials.items("default"))
+
+    results = verify.caller_identities(cli, cli.credentials.sections(), 10)
+
+    assert all(x["status"] == "ok" for x in results)
+    assert fake_sts.fake.count("GetCallerIdentity", 400) > 0
+    assert verify.rate_limiter().metrics()["throttles"] > 0
@@ -0,0 +1,124 @@
+"""
+pytest module: awstemp/watch.py
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from awstemp import watch
+
+ENCODING = "utf-8"
+
+
+def touch(path, content="[section]\n"):
+    """Write a small ini file"""
+    with open(path, "w", encoding=ENCODING) as ini_file:
+        ini_file.write(content)
+
+
+@pytest.fixture(name="paths")
+def fixture_paths(tmp_path):
+    """A credentials file and a shards directory to watch"""
+
+    credentials = tmp_path / "credentials"
+    shards = tmp_path / "credentials.d"
+    touch(credentials)
+    os.mkdir(shards)
+
+    yield str(credentials), str(shards)
+
+
+@pytest.mark.parametrize("inotify", [True, False], ids=["inotify", "polling"])
+def test_wait_timeout(paths, inotify):
+    """Test that wait returns False when nothing changed"""
+
+    watcher = watch.Watcher([*paths, None], inotify=inotify)
+    assert watcher.wait(0.05) is False
+    watcher.close()
+    watcher.close()
+
+
+@pytest.mark.parametrize("inotify", [True, False], ids=["inotify", "polling"])
+def test_wait_file_changed(monkeypatch, paths, inotify):
+    """Test that rewriting the credentials file is noticed"""
+
+    monkeypatch.setattr(watch, "POLL_INTERVAL", 0.01)
+    watcher = watch.Watcher(paths, inotify=inotify)
+    touch(paths[0], "[section]\nkey = value\n")
+
+    assert watcher.wait(1) is True
+    assert watcher.wait(0.05) is False
+
+
+@pytest.mark.parametrize("inotify", [True, False], ids=["inotify", "polling"])
+def test_wait_shard_created(monkeypatch, paths, inotify):
+    """Test that a new file in the shards directory is noticed"""
+
+    monkeypatch.setattr(watch, "POLL_INTERVAL", 0.01)
+    watcher = watch.Watcher(paths, inotify=inotify)
+    touch(os.path.join(paths[1], "role_temp"))
+
+    assert watcher.wait(1) is True
+
+
+def test_wait_unrelated(paths):
+    """Test that other files next to the credentials file are ignored"""
+
+    watcher = watch.Watcher([paths[0], paths[0]])
+    assert len(watcher.watches) == 1
+    touch(os.path.join(os.path.dirname(paths[0]), "config"))
+
+    assert watcher.wait(0.05) is False
+
+
+def test_missing_path(tmp_path):
+    """Test that paths which do not exist yet can be watched"""
+
+    watcher = watch.Watcher([str(tmp_path / "missing")], inotify=False)
+    assert watcher.state == [None]
+
+
+def test_read_events_empty(paths):
+    """Test that draining without pending events reports no change"""
+
+    watcher = watch.Watcher(paths)
+    assert watcher.read_events() is False
+
+
+@patch("ctypes.CDLL", side_effect=OSError("no libc"))
+def test_load_inotify_unavailable(_):
+    """Test that a missing inotify falls back to polling"""
+    assert watch.load_inotify() is None
+
+
+@patch("awstemp.watch.load_inotify")
+def test_inotify_init_failure(mock_load_inotify, paths):
+    """Test that a failing inotify_init1 falls back to polling"""
+
+    mock_load_inotify.return_value.inotify_init1.return_value = -1
+    assert watch.Watcher(paths).fd is None
+
+
+@pytest.mark.parametrize("recreate", [False, True], ids=["created", "recreated"])
+def test_wait_shards_directory_created(monkeypatch, tmp_path, recreate):
+    """Test that shards written after the directory appears are noticed"""
+
+    monkeypatch.setattr(watch, "POLL_INTERVAL", 0.01)
+    shards = tmp_path / "credentials.d"
+    if recreate:
+        os.mkdir(shards)
+    watcher = watch.Watcher([str(shards)])
+    if recreate:
+        os.rmdir(shards)
+        assert watcher.wait(1) is True
+        assert str(shards) not in watcher.watches.values()
+
+    os.mkdir(shards)
+    assert watcher.wait(1) is True
+    assert str(shards) in watcher.watches.values()
+
+    touch(shards / "role_temp")
+    assert watcher.wait(1) is True
+    watcher.close()